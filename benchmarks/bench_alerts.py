@@ -0,0 +1,141 @@
+import argparse, random, sys, threading, time
+
+from benchmarks.bench_coarse_route import random_stop_pairs
+from benchmarks.synthetic import synthetic_network, RAPID_TRANSIT, FULL_NETWORK
+from test.stub_api import AlertStreamServer, alert_object
+from utils.alerts import AlertConsumer
+from utils.closures import ClosableNetwork
+from utils.profiling import LatencyHistogram, PROFILE_BUCKETS_MS
+from utils.routing import find_coarse_route
+
+
+def random_events(ordered_stop_names, num_events, max_active, seed=0):
+  """
+  A replay of alert events: station closures and shuttles over a few stops of a route, which are added
+  until max_active are in effect, and then removed (oldest first) and replaced.
+  """
+  rng = random.Random(seed)
+  routes = sorted(ordered_stop_names)
+  stops = sorted(set(stop for route in routes for stop in ordered_stop_names[route]))
+  active, events = [], []
+  for i in range(num_events):
+    if len(active) >= max_active:
+      events.append(("remove", {"id": active.pop(0), "type": "alert"}))
+      continue
+    alert_id = str(i)
+    if rng.random() < 0.5:
+      events.append(("add", alert_object(alert_id, "STATION_CLOSURE", [rng.choice(stops)])))
+    else:
+      route = rng.choice(routes)
+      start = rng.randrange(max(1, len(ordered_stop_names[route]) - 4))
+      events.append(("add", alert_object(alert_id, "SHUTTLE", ordered_stop_names[route][start:start + 5], route_id=route)))
+    active.append(alert_id)
+  return events
+
+
+def percentiles_ms(times):
+  times = sorted(times)
+  if len(times) == 0:
+    return "n/a"
+  return "p50 {:>7.3f} ms   p99 {:>7.3f} ms   max {:>7.3f} ms".format(
+      1e3 * times[len(times) // 2], 1e3 * times[min(len(times) - 1, int(0.99 * len(times)))], 1e3 * times[-1])
+
+
+def run(ordered_stop_names, events, args):
+  """
+  Replays events through a local alert stream while reader threads route random stop pairs.
+
+  Returns:
+    (list) Seconds from each event being sent to the new graph being swapped in
+    (list) Seconds from each event being sent to the first query that ran on the new graph
+    (LatencyHistogram) Query latency while events were applied
+  """
+  network = ClosableNetwork(ordered_stop_names)
+  pairs = [(a, b) for a, b in random_stop_pairs(network.routes_of_stop, 1000) if a != b]
+  applied = [] # (time, graph) after every swap. Keeping the old graphs alive means their ids aren't reused.
+  consumer = AlertConsumer(network, on_update=lambda changed: applied.append((time.perf_counter(), network.graph)))
+  server = AlertStreamServer()
+  thread = consumer.start(server.url)
+  server.wait_for_streams()
+
+  # Each reader notes when it first runs a query on each graph. The earliest note is when the update became visible.
+  first_seen = {}
+  histograms = [LatencyHistogram(PROFILE_BUCKETS_MS) for _ in range(args.readers)]
+  done = threading.Event()
+
+  def reader(histogram):
+    i = 0
+    while not done.is_set():
+      stop_A, stop_B = pairs[i % len(pairs)]
+      t0 = time.perf_counter()
+      graph = network.graph
+      first_seen.setdefault(id(graph), t0)
+      if stop_A in graph and stop_B in graph: # Like the server, which doesn't route to closed stops.
+        find_coarse_route(stop_A, stop_B, graph)
+      histogram.record(time.perf_counter() - t0)
+      i += 1
+
+  readers = [threading.Thread(target=reader, args=(histogram,)) for histogram in histograms]
+  for r in readers:
+    r.start()
+
+  to_applied, to_visible = [], []
+  for event, data in events:
+    num_events, num_applied = consumer.num_events, len(applied)
+    t_sent = server.push(event, data)
+    while consumer.num_events == num_events:
+      time.sleep(0.0001)
+    if len(applied) > num_applied:
+      t_applied, graph = applied[-1]
+      to_applied.append(t_applied - t_sent)
+      time.sleep(args.interval)
+      if id(graph) in first_seen:
+        to_visible.append(first_seen[id(graph)] - t_sent)
+
+  done.set()
+  for r in readers:
+    r.join()
+  consumer.stop()
+  server.close()
+  thread.join()
+
+  histogram = LatencyHistogram(PROFILE_BUCKETS_MS)
+  for h in histograms:
+    histogram.counts = [a + b for a, b in zip(histogram.counts, h.counts)]
+    histogram.count += h.count
+    histogram.total_ms += h.total_ms
+  return to_applied, to_visible, histogram
+
+
+def main(args):
+  """
+  Measures update-to-visible latency of alerts streamed from a local replay server: from an event being
+  sent, to the graph with its closures being swapped in, to the first route query that runs on it. Also
+  reports the latency of the queries running alongside the updates.
+
+  While readers keep the CPU busy, every hop of an event between threads (server, consumer) waits for the GIL,
+  up to one switch interval each (5 ms by default), so --switch-interval has a large effect on latency.
+  """
+  if args.switch_interval is not None:
+    sys.setswitchinterval(args.switch_interval)
+  for label, sizes in [("rapid transit", RAPID_TRANSIT), ("full network", FULL_NETWORK)]:
+    ordered_stop_names, _ = synthetic_network(**sizes)
+    events = random_events(ordered_stop_names, args.events, args.max_active)
+    to_applied, to_visible, histogram = run(ordered_stop_names, events, args)
+    print("==> {} ({} routes, {} events, {} reader threads, switch interval {:g} ms)".format(
+        label, len(ordered_stop_names), len(events), args.readers, 1e3 * sys.getswitchinterval()))
+    print("  Sent to swapped in:  {}".format(percentiles_ms(to_applied)))
+    print("  Sent to visible:     {}".format(percentiles_ms(to_visible)))
+    print("  Queries during updates: {} queries, mean {:.3f} ms, p50 <= {} ms, p99 <= {} ms".format(
+        histogram.count, histogram.total_ms / max(1, histogram.count), histogram.percentile(50), histogram.percentile(99)))
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark update-to-visible latency of streamed service alerts")
+  parser.add_argument("--events", default=200, type=int, help="Number of alert events to replay")
+  parser.add_argument("--max-active", default=10, type=int, help="Number of alerts in effect at once")
+  parser.add_argument("--readers", default=2, type=int, help="Number of threads running route queries")
+  parser.add_argument("--interval", default=0.01, type=float, help="Seconds between events")
+  parser.add_argument("--switch-interval", default=None, type=float,
+                      help="Seconds between GIL handoffs (sys.setswitchinterval). Defaults to Python's 0.005")
+  main(parser.parse_args())
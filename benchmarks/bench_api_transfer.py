@@ -0,0 +1,129 @@
+import argparse, json, time
+
+from benchmarks.synthetic import synthetic_network, FULL_NETWORK
+from test.stub_api import StubApiServer, paginate, sparse_fieldsets
+from utils import profiling
+from utils.mbta_api import MbtaClient, fast_json_loads, get_routes, get_stops
+from utils.utils import project_attributes
+
+
+def full_route_object(route_id, route_type, long_name, destinations):
+  """
+  A route with every attribute, relationship and link that the real API returns.
+  """
+  return {"type": "route", "id": route_id, "links": {"self": "/routes/" + route_id},
+          "attributes": {"color": "FFC72C", "description": "Local Bus" if route_type == 3 else "Rapid Transit",
+                         "direction_destinations": destinations, "direction_names": ["Outbound", "Inbound"],
+                         "fare_class": "Local Bus" if route_type == 3 else "Rapid Transit", "long_name": long_name,
+                         "short_name": route_id if route_type == 3 else "", "sort_order": 50000,
+                         "text_color": "000000", "type": route_type},
+          "relationships": {"line": {"data": {"id": "line-" + route_id, "type": "line"}}}}
+
+
+def full_stop_object(stop_id, name, latitude, longitude):
+  """
+  A stop with every attribute, relationship and link that the real API returns.
+  """
+  return {"type": "stop", "id": stop_id, "links": {"self": "/stops/" + stop_id},
+          "attributes": {"address": "{}, Boston, MA 02110".format(name), "at_street": None,
+                         "description": "{} - Outbound".format(name), "latitude": latitude, "location_type": 0,
+                         "longitude": longitude, "municipality": "Boston", "name": name, "on_street": "Washington Street",
+                         "platform_code": None, "platform_name": "Outbound", "vehicle_type": 3,
+                         "wheelchair_boarding": 1},
+          "relationships": {"facilities": {"links": {"related": "/facilities/?filter[stop]=" + stop_id}},
+                            "parent_station": {"data": None}, "zone": {"data": {"id": "LocalBus", "type": "zone"}}}}
+
+
+def fixture_handler():
+  """
+  Serves the synthetic full network with full resource objects, like the real API: routes filtered by type,
+  stops filtered by route (with the routes included), sparse fieldsets and pagination.
+  """
+  ordered_stop_names, coordinates = synthetic_network(**FULL_NETWORK)
+  stop_ids = {name: str(10000 + i) for i, name in enumerate(sorted(coordinates))}
+  routes, route_stops = [], {}
+  for i, (route_name, stop_names) in enumerate(sorted(ordered_stop_names.items())):
+    route_type = 1 if i < 8 else (2 if i < 20 else (4 if i < 24 else 3))
+    route_id = route_name.replace("Route ", "R")
+    routes.append(full_route_object(route_id, route_type, route_name, [stop_names[-1], stop_names[0]]))
+    route_stops[route_id] = [full_stop_object(stop_ids[name], name, *coordinates[name]) for name in stop_names]
+  routes_by_id = {route["id"]: route for route in routes}
+
+  def handler(path, params, headers):
+    if path == "/routes":
+      types = params["filter[type]"].split(",") if "filter[type]" in params else None
+      response = {"data": [r for r in routes if types is None or str(r["attributes"]["type"]) in types]}
+    elif path == "/stops":
+      route_ids = params["filter[route]"].split(",")
+      response = {"data": [s for route_id in route_ids for s in route_stops.get(route_id, [])]}
+      if params.get("include") == "route":
+        response["included"] = [routes_by_id[route_id] for route_id in route_ids if route_id in routes_by_id]
+    else:
+      return 404, {"Content-Type": "application/json"}, b'{"errors": []}'
+    response = paginate(sparse_fieldsets(response, params), path, params)
+    return 200, {"Content-Type": "application/json"}, json.dumps(response).encode("utf-8")
+
+  return handler
+
+
+def fetch_network(client, sparse):
+  """
+  The requests that preprocessing every route makes: all of the routes, then the stops along each one.
+  """
+  fields = {} if sparse else {"fields": None}
+  _, routes_json = get_routes(route_types=None, sort_by=None, client=client, **fields)
+  stops = {}
+  for (route_id,) in project_attributes(routes_json, ["/id"]):
+    _, stops_json = get_stops([route_id], sort_by=None, client=client, **fields)
+    stops[route_id] = project_attributes(stops_json, ["/attributes/name", "/attributes/latitude", "/attributes/longitude"])
+  return stops
+
+
+def main(args):
+  """
+  Reports bytes on the wire and JSON decode time per API call, for the requests made to preprocess every
+  route, served from a local fixture with full resource objects. Each row adds one change to the row above:
+  sparse fieldsets, gzip, and a fast JSON parser (orjson, if it's installed).
+  """
+  server = StubApiServer(fixture_handler())
+  configurations = [
+    ("full resources, json", dict(sparse=False, compress=False, loads=json.loads)),
+    ("+ sparse fieldsets", dict(sparse=True, compress=False, loads=json.loads)),
+    ("+ gzip", dict(sparse=True, compress=True, loads=json.loads)),
+  ]
+  if fast_json_loads is not json.loads:
+    configurations.append(("+ orjson", dict(sparse=True, compress=True, loads=fast_json_loads)))
+  else:
+    print("NOTE: orjson isn't installed, so responses are always decoded with json")
+
+  expected = None
+  for label, config in configurations:
+    client = MbtaClient(base_url=server.url, compress=config["compress"], loads=config["loads"])
+    best = None
+    for _ in range(args.repeats):
+      profiler = profiling.enable()
+      t0 = time.perf_counter()
+      stops = fetch_network(client, config["sparse"])
+      elapsed = time.perf_counter() - t0
+      profiling.disable()
+      if best is None or elapsed < best[0]:
+        best = (elapsed, profiler)
+    client.close()
+
+    elapsed, profiler = best
+    expected = stops if expected is None else expected
+    num_calls = profiler.histograms["api_request"].count
+    decode = profiler.histograms["api_decode"]
+    print("  {:<22} {:>4} calls   {:>8.1f} KB/call on the wire ({:>8.1f} KB decoded)   decode {:>6.3f} ms/call   "
+          "total {:>6.3f} sec   {}".format(
+              label, num_calls, profiler.counters["api_bytes"] / num_calls / 1024,
+              profiler.counters["api_body_bytes"] / num_calls / 1024, decode.total_ms / decode.count, elapsed,
+              "same stops" if stops == expected else "MISMATCH"))
+
+  server.close()
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark bytes on the wire and decode time of MBTA API calls")
+  parser.add_argument("--repeats", default=3, type=int, help="Fetches per configuration (the fastest is reported)")
+  main(parser.parse_args())
@@ -0,0 +1,46 @@
+import argparse, time
+
+from benchmarks.bench_coarse_route import random_stop_pairs
+from benchmarks.synthetic import synthetic_network, routes_containing_stop, RAPID_TRANSIT, FULL_NETWORK
+from utils.routing import TransitGraph, search_route_ids, preprocess_nominal
+
+
+def main(args):
+  """
+  Compares the one-sided and bidirectional searches behind find_coarse_route (routes expanded and latency),
+  on the cached nominal network and synthetic networks the size of the rapid transit and full MBTA networks.
+  """
+  networks = [("nominal", preprocess_nominal(allow_cache=True, verbose=False))]
+  for label, sizes in [("synthetic rapid transit", RAPID_TRANSIT), ("synthetic full network", FULL_NETWORK)]:
+    ordered_stop_names, _ = synthetic_network(**sizes)
+    networks.append((label, routes_containing_stop(ordered_stop_names)))
+
+  for label, network in networks:
+    graph = TransitGraph(network)
+    queries = []
+    for stop_A, stop_B in random_stop_pairs(network, args.queries):
+      start, goal = graph.stop_routes[graph.stop_ids[stop_A]], graph.stop_routes[graph.stop_ids[stop_B]]
+      # Same-route pairs are answered before searching, so leave them out.
+      if len(set(start).intersection(goal)) == 0:
+        queries.append((start, goal))
+
+    print("==> {} ({} routes, {} queries that need a transfer)".format(label, len(graph.route_names), len(queries)))
+    paths = {}
+    for name, bidirectional in [("one-sided", False), ("bidirectional", True)]:
+      total_expanded = 0
+      paths[name] = []
+      t0 = time.perf_counter()
+      for start, goal in queries:
+        routes, _, num_expanded = search_route_ids(graph, start, goal, bidirectional=bidirectional)
+        total_expanded += num_expanded
+        paths[name].append(routes)
+      elapsed = time.perf_counter() - t0
+      print("  {:<14} {:>8.1f} routes expanded/query   {:>8.1f} us/query".format(
+          name, total_expanded / len(queries), 1e6 * elapsed / len(queries)))
+    assert paths["one-sided"] == paths["bidirectional"]
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark one-sided vs. bidirectional route search")
+  parser.add_argument("--queries", default=20000, type=int, help="Number of random stop pairs per network")
+  main(parser.parse_args())
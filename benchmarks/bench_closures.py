@@ -0,0 +1,50 @@
+import argparse, random, time
+
+from benchmarks.synthetic import synthetic_network, RAPID_TRANSIT, FULL_NETWORK
+from utils.closures import ClosableNetwork
+from utils.routing import TransitGraph
+
+
+def main(args):
+  """
+  Compares closing/reopening one stop at a time with ClosableNetwork vs. rebuilding the whole network.
+  """
+  rng = random.Random(0)
+  for label, sizes in [("rapid transit", RAPID_TRANSIT), ("full network", FULL_NETWORK)]:
+    ordered_stop_names, _ = synthetic_network(**sizes)
+    network = ClosableNetwork(ordered_stop_names)
+    stops = sorted(network.routes_of_stop)
+
+    incremental = []
+    rebuild = []
+    for _ in range(args.changes):
+      stop = rng.choice(stops)
+      t0 = time.perf_counter()
+      if stop in network.closed:
+        network.reopen(stop)
+      else:
+        network.close(stop)
+      incremental.append(time.perf_counter() - t0)
+
+      # Baseline: recompute every route's components, then build a new graph from scratch.
+      t0 = time.perf_counter()
+      baseline = ClosableNetwork(ordered_stop_names)
+      baseline.closed = set(network.closed)
+      for route in ordered_stop_names:
+        baseline.component_of.update(baseline._split(route))
+      TransitGraph(baseline.routes_containing_stop())
+      rebuild.append(time.perf_counter() - t0)
+
+    incremental.sort()
+    rebuild.sort()
+    print("==> {} ({} stops, {} routes, {} changes)".format(label, len(stops), len(ordered_stop_names), args.changes))
+    print("  Incremental update: median {:>9.1f} us   max {:>9.1f} us".format(
+        1e6 * incremental[len(incremental) // 2], 1e6 * incremental[-1]))
+    print("  Full rebuild:       median {:>9.1f} us   max {:>9.1f} us".format(
+        1e6 * rebuild[len(rebuild) // 2], 1e6 * rebuild[-1]))
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark incremental closure updates vs. full rebuilds")
+  parser.add_argument("--changes", default=200, type=int, help="Number of random stops to close/reopen")
+  main(parser.parse_args())
@@ -0,0 +1,45 @@
+import argparse, random, time
+
+from utils.routing import TransitGraph, find_coarse_route, preprocess_nominal, preprocess_covid
+
+
+def random_stop_pairs(stop_names, num_queries, seed=0):
+  rng = random.Random(seed)
+  stop_names = sorted(stop_names)
+  return [(rng.choice(stop_names), rng.choice(stop_names)) for _ in range(num_queries)]
+
+
+def queries_per_second(pairs, graph):
+  t0 = time.perf_counter()
+  for stop_A, stop_B in pairs:
+    find_coarse_route(stop_A, stop_B, graph)
+  return len(pairs) / (time.perf_counter() - t0)
+
+
+def main(args):
+  """
+  Compares find_coarse_route throughput when the route graph is rebuilt on every query (passing the
+  routes_containing_stop dictionary) vs. built once up front (passing a TransitGraph).
+  """
+  for label, preprocess in [("nominal", preprocess_nominal), ("covid", preprocess_covid)]:
+    routes_containing_stop = preprocess(allow_cache=True, verbose=False)
+    pairs = [(a, b) for a, b in random_stop_pairs(routes_containing_stop, args.queries) if a != b]
+
+    qps_rebuild = queries_per_second(pairs, routes_containing_stop)
+
+    t0 = time.perf_counter()
+    graph = TransitGraph(routes_containing_stop)
+    build_ms = 1000 * (time.perf_counter() - t0)
+    qps_prebuilt = queries_per_second(pairs, graph)
+
+    print("==> {} network ({} stops, {} routes, {} queries)".format(
+        label, len(graph.stop_names), len(graph.route_names), len(pairs)))
+    print("  Rebuild graph per query:  {:>10.0f} queries/sec".format(qps_rebuild))
+    print("  Prebuilt TransitGraph:    {:>10.0f} queries/sec (one-time build {:.3f} ms)".format(qps_prebuilt, build_ms))
+    print("  Speedup:                  {:>10.1f}x".format(qps_prebuilt / qps_rebuild))
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark find_coarse_route with and without a prebuilt graph")
+  parser.add_argument("--queries", default=5000, type=int, help="Number of random stop pairs to route")
+  main(parser.parse_args())
@@ -0,0 +1,65 @@
+import argparse, random, time
+
+from jsonpointer import resolve_pointer
+
+from utils.utils import compile_pointer, project_attributes, strip_attributes
+
+
+def synthetic_stops_json(num_stops, seed=0):
+  """
+  Stop objects shaped like the /stops response from the MBTA API.
+  """
+  rng = random.Random(seed)
+  data = []
+  for i in range(num_stops):
+    data.append({
+      "type": "stop", "id": str(i),
+      "attributes": {"name": "Stop {}".format(i), "latitude": 42.2 + 0.3 * rng.random(),
+                     "longitude": -71.2 + 0.3 * rng.random(), "wheelchair_boarding": 1,
+                     "address": None, "platform_name": None, "location_type": 0},
+      "relationships": {"parent_station": {"data": None}, "zone": {"data": None}},
+    })
+  return {"data": data}
+
+
+def best_of(fn, repeats):
+  best = float("inf")
+  for _ in range(repeats):
+    t0 = time.perf_counter()
+    fn()
+    best = min(best, time.perf_counter() - t0)
+  return 1000 * best
+
+
+def main(args):
+  """
+  Compares resolving JSON pointers with resolve_pointer vs. the compiled extractors in utils.utils.
+  """
+  stops_json = synthetic_stops_json(args.stops)
+  ptrs = ["/attributes/name", "/attributes/latitude", "/attributes/longitude"]
+
+  cases = [
+    ("strip_attributes, 1 pointer",
+     lambda: [resolve_pointer(obj, ptrs[0]) for obj in stops_json["data"]],
+     lambda: strip_attributes(stops_json, ptrs[0])),
+    ("3 attributes per object",
+     lambda: [tuple(resolve_pointer(obj, ptr) for ptr in ptrs) for obj in stops_json["data"]],
+     lambda: project_attributes(stops_json, ptrs)),
+    ("single lookup (x10000)",
+     lambda: [resolve_pointer(stops_json["data"][0], ptrs[1]) for _ in range(10000)],
+     lambda: [compile_pointer(ptrs[1])(stops_json["data"][0]) for _ in range(10000)]),
+  ]
+
+  print("==> {} stop objects, best of {} runs".format(args.stops, args.repeats))
+  for label, baseline, compiled in cases:
+    assert baseline() == compiled()
+    ms_baseline, ms_compiled = best_of(baseline, args.repeats), best_of(compiled, args.repeats)
+    print("  {:<28} resolve_pointer {:>8.2f} ms   compiled {:>8.2f} ms   ({:.1f}x)".format(
+        label, ms_baseline, ms_compiled, ms_baseline / ms_compiled))
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark compiled JSON pointer extractors")
+  parser.add_argument("--stops", default=10000, type=int, help="Number of synthetic stop objects")
+  parser.add_argument("--repeats", default=5, type=int, help="Number of timed runs per case")
+  main(parser.parse_args())
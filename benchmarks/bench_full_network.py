@@ -0,0 +1,182 @@
+import argparse, gzip, json, multiprocessing, os, resource, tempfile, time, tracemalloc
+
+from benchmarks.synthetic import synthetic_network, FULL_NETWORK
+from test.stub_api import StubApiServer, paginate, route_patterns_response
+from utils import profiling
+from utils.mbta_api import MbtaClient, get_routes, get_stops, get_stops_each_route, iter_stop_pages
+from utils.routing import discover_routes, preprocess_all_routes
+from utils.utils import project_attributes
+
+
+def record_fixture(path):
+  """
+  Records every route, and the stops along each route, from the live MBTA API into a fixture file.
+  """
+  client = MbtaClient()
+  success, routes_json = get_routes(route_types=None, sort_by=None, client=client)
+  assert success, routes_json
+  stops = {}
+  for route in routes_json["data"]:
+    stops[route["id"]] = []
+    for success, page_json in iter_stop_pages([route["id"]], sort_by=None, page_limit=100, client=client):
+      assert success, page_json
+      stops[route["id"]].extend(page_json["data"])
+  with gzip.open(path, "wt") as f:
+    json.dump({"routes": routes_json["data"], "stops": stops}, f)
+  client.close()
+
+
+def synthetic_fixture(path):
+  """
+  Writes a fixture shaped like the API responses for the whole network, from a synthetic network (for
+  when there's no recorded fixture). Route types are split roughly like the real network.
+  """
+  ordered_stop_names, coordinates = synthetic_network(**FULL_NETWORK)
+  routes, stops = [], {}
+  for i, (route_name, stop_names) in enumerate(sorted(ordered_stop_names.items())):
+    route_type = 1 if i < 8 else (2 if i < 20 else (4 if i < 24 else 3))
+    route_id = route_name.replace("Route ", "R")
+    routes.append({"type": "route", "id": route_id, "attributes": {
+      "type": route_type, "short_name": route_id if route_type == 3 else "", "long_name": route_name}})
+    stops[route_id] = [{"type": "stop", "id": name, "attributes": {
+      "name": name, "latitude": coordinates[name][0], "longitude": coordinates[name][1]}} for name in stop_names]
+  with gzip.open(path, "wt") as f:
+    json.dump({"routes": routes, "stops": stops}, f)
+
+
+def fixture_handler(fixture, latency_ms):
+  """
+  Serves a fixture like the real API: routes filtered by type, stops filtered by route, and pagination.
+  Route patterns are served as each route's stops in both directions. Every response is delayed by
+  latency_ms, to stand in for the round trip to the real API.
+  """
+  def handler(path, params, headers):
+    time.sleep(latency_ms / 1000)
+    if path == "/routes":
+      types = params["filter[type]"].split(",") if "filter[type]" in params else None
+      data = [r for r in fixture["routes"] if types is None or str(r["attributes"]["type"]) in types]
+    elif path == "/stops":
+      data = [s for route_id in params["filter[route]"].split(",") for s in fixture["stops"].get(route_id, [])]
+    elif path == "/route_patterns":
+      patterns = [(route_id, direction_id, stops if direction_id == 0 else stops[::-1])
+                  for route_id in params["filter[route]"].split(",") for direction_id in (0, 1)
+                  for stops in [fixture["stops"].get(route_id, [])]]
+      return 200, {"Content-Type": "application/json"}, json.dumps(route_patterns_response(patterns, params)).encode("utf-8")
+    else:
+      return 404, {"Content-Type": "application/json"}, b'{"errors": []}'
+    return 200, {"Content-Type": "application/json"}, json.dumps(paginate({"data": data}, path, params)).encode("utf-8")
+  return handler
+
+
+def build_serial(client):
+  """
+  One request per route, one after another, like preprocess_nominal used to do.
+  """
+  route_names = discover_routes(client=client)
+  routes_containing_stop = {}
+  for route_id, route_name in route_names.items():
+    _, stops_json = get_stops([route_id], sort_by=None, client=client)
+    for (name,) in project_attributes(stops_json, ["/attributes/name"]):
+      routes_containing_stop.setdefault(name, set()).add(route_name)
+  return routes_containing_stop
+
+
+def build_collect_first(client):
+  """
+  Concurrent requests, but every (unpaginated) response is held in memory until the index is built.
+  """
+  route_names = discover_routes(client=client)
+  stops_each_route = get_stops_each_route(list(route_names), sort_by=None, client=client)
+  routes_containing_stop = {}
+  for route_id, (success, stops_json) in stops_each_route.items():
+    for (name,) in project_attributes(stops_json, ["/attributes/name"]):
+      routes_containing_stop.setdefault(name, set()).add(route_names[route_id])
+  return routes_containing_stop
+
+
+def build_streaming(client):
+  return preprocess_all_routes(allow_cache=False, verbose=False, client=client, routes_per_request=None)
+
+
+def build_bulk(client):
+  return preprocess_all_routes(allow_cache=False, verbose=False, client=client)
+
+
+def measure(url, builder_name, fixture_path, queue):
+  """
+  Runs in a fresh process, so that peak RSS only reflects one build.
+  """
+  build = {"serial": build_serial, "collect first": build_collect_first, "streaming": build_streaming,
+           "bulk patterns": build_bulk}[builder_name]
+  client = MbtaClient(base_url=url)
+  profiler = profiling.enable()
+  t0 = time.perf_counter()
+  routes_containing_stop = build(client)
+  elapsed = time.perf_counter() - t0
+  profiling.disable()
+  num_requests = profiler.histograms["api_request"].count
+  num_bytes = profiler.counters["api_bytes"]
+  peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 # Linux reports KB.
+
+  tracemalloc.start()
+  build(client)
+  peak_heap_mb = tracemalloc.get_traced_memory()[1] / 2**20
+  tracemalloc.stop()
+  client.close()
+
+  # Check the index against the fixture.
+  with gzip.open(fixture_path, "rt") as f:
+    fixture = json.load(f)
+  expected = {}
+  names = discover_routes(client=MbtaClient(base_url=url))
+  for route_id, stops in fixture["stops"].items():
+    for stop in stops:
+      expected.setdefault(stop["attributes"]["name"], set()).add(names[route_id])
+  queue.put((elapsed, peak_rss_mb, peak_heap_mb, num_requests, num_bytes, len(routes_containing_stop),
+             routes_containing_stop == expected))
+
+
+def main(args):
+  """
+  Reports build time and memory for preprocessing every route type, served from a local fixture of API
+  responses. Compares bulk route pattern requests (preprocess_all_routes), the streaming pipeline of paginated
+  requests for each route, and collecting every response first.
+  """
+  folder = tempfile.TemporaryDirectory()
+  fixture_path = args.fixture
+  if args.record is not None:
+    record_fixture(args.record)
+    fixture_path = args.record
+  if fixture_path is None:
+    fixture_path = os.path.join(folder.name, "synthetic_fixture.json.gz")
+    synthetic_fixture(fixture_path)
+
+  with gzip.open(fixture_path, "rt") as f:
+    fixture = json.load(f)
+  server = StubApiServer(fixture_handler(fixture, args.latency_ms))
+  num_stops = sum(len(stops) for stops in fixture["stops"].values())
+  print("==> {} ({} routes, {} route stops, {} ms simulated latency)".format(
+      "synthetic fixture" if args.fixture is None and args.record is None else fixture_path, len(fixture["routes"]),
+      num_stops, args.latency_ms))
+
+  context = multiprocessing.get_context("spawn")
+  for builder_name in ["serial", "collect first", "streaming", "bulk patterns"]:
+    queue = context.Queue()
+    process = context.Process(target=measure, args=(server.url, builder_name, fixture_path, queue))
+    process.start()
+    elapsed, peak_rss_mb, peak_heap_mb, num_requests, num_bytes, num_index_stops, matches = queue.get()
+    process.join()
+    print("  {:<13} {:>7.3f} sec   {:>4} requests ({:>5.1f} MB)   peak RSS {:>6.1f} MB   peak Python heap {:>6.1f} MB   "
+          "{} stops, {}".format(builder_name, elapsed, num_requests, num_bytes / 2**20, peak_rss_mb, peak_heap_mb,
+                                num_index_stops, "matches fixture" if matches else "MISMATCH"))
+
+  server.close()
+  folder.cleanup()
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark preprocessing every MBTA route type")
+  parser.add_argument("--fixture", default=None, type=str, help="Recorded fixture to serve (default: a synthetic one)")
+  parser.add_argument("--record", default=None, type=str, help="Record a fixture from the live API to this path first")
+  parser.add_argument("--latency-ms", default=20, type=float, help="Simulated round trip time for each request")
+  main(parser.parse_args())
@@ -0,0 +1,47 @@
+import argparse, os, tempfile, time, tracemalloc
+
+from benchmarks.synthetic import synthetic_network, write_synthetic_gtfs, FULL_NETWORK
+from utils.gtfs import read_gtfs
+
+
+def main(args):
+  """
+  Reports read_gtfs ingest throughput (stop_times rows/sec) and peak Python heap on a GTFS feed, for every
+  route and for rapid transit only. Without --gtfs, synthetic feeds of the full network's size are written
+  with an increasing number of trips, to show that memory doesn't grow with stop_times.txt.
+  """
+  folder = tempfile.TemporaryDirectory()
+  feeds = []
+  if args.gtfs is not None:
+    feeds.append((args.gtfs, None))
+  else:
+    ordered_stop_names, coordinates = synthetic_network(**FULL_NETWORK)
+    for trips_per_direction in args.trips:
+      path = os.path.join(folder.name, "synthetic_{}.zip".format(trips_per_direction))
+      write_synthetic_gtfs(path, ordered_stop_names, coordinates, trips_per_direction)
+      feeds.append((path, "synthetic full network, {} trips each way per route".format(trips_per_direction)))
+
+  for path, label in feeds:
+    print("==> {} ({:.1f} MB zipped)".format(label or path, os.path.getsize(path) / 2**20))
+    for name, route_types in [("every route", None), ("rapid transit", (0, 1))]:
+      ordered_stop_names, _, stats = read_gtfs(path, route_types=route_types, verbose=False)
+
+      tracemalloc.start()
+      read_gtfs(path, route_types=route_types, verbose=False)
+      peak_heap_mb = tracemalloc.get_traced_memory()[1] / 2**20
+      tracemalloc.stop()
+
+      print("  {:<14} {:>9} rows in {:>6.2f} sec   {:>9.0f} rows/sec   peak Python heap {:>6.1f} MB   "
+            "{} routes, {} trips, {} stop patterns".format(
+                name, stats.stop_times_rows, stats.seconds, stats.stop_times_rows / stats.seconds, peak_heap_mb,
+                len(ordered_stop_names), stats.trips, stats.patterns))
+
+  folder.cleanup()
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark reading a GTFS static feed")
+  parser.add_argument("--gtfs", default=None, type=str, help="GTFS zip to read (default: synthetic feeds)")
+  parser.add_argument("--trips", default=[25, 200], type=int, nargs="+",
+                      help="Trips each way per route in the synthetic feeds")
+  main(parser.parse_args())
@@ -0,0 +1,70 @@
+import argparse, random, time
+
+import requests
+
+from utils.mbta_api import get_default_client
+from utils.utils import haversine_distance, haversine_many, haversine_matrix, project_attributes
+
+
+def all_stop_coordinates(num_synthetic):
+  """
+  Coordinates of every MBTA stop across all route types (buses included), or a synthetic stand-in of a
+  similar size if the API can't be reached.
+  """
+  try:
+    success, stops_json = get_default_client().get("/stops", params={})
+    if success:
+      coords = project_attributes(stops_json, ["/attributes/longitude", "/attributes/latitude"])
+      return "MBTA stops (all route types)", [c for c in coords if None not in c]
+  except requests.exceptions.RequestException:
+    pass
+  print("NOTE: Couldn't reach the MBTA API, using {} synthetic stops instead".format(num_synthetic))
+  rng = random.Random(0)
+  return "synthetic stops", [(-71.3 + 0.5 * rng.random(), 42.1 + 0.5 * rng.random()) for _ in range(num_synthetic)]
+
+
+def main(args):
+  """
+  Compares the scalar haversine_distance in Python loops with haversine_many/haversine_matrix.
+  """
+  label, coords = all_stop_coordinates(args.stops)
+  lons = [c[0] for c in coords]
+  lats = [c[1] for c in coords]
+  n = len(coords)
+  print("==> {} ({} stops, {} pairs)".format(label, n, n * n))
+  haversine_many(lons[:1], lats[:1], lons[0], lats[0]) # Warm up, so that importing NumPy isn't timed.
+
+  # One point to every stop (i.e a nearest-stop scan).
+  t0 = time.perf_counter()
+  scalar = [haversine_distance(lons[i], lats[i], lons[0], lats[0]) for i in range(n)]
+  t_scalar = time.perf_counter() - t0
+  t0 = time.perf_counter()
+  vector = haversine_many(lons, lats, lons[0], lats[0])
+  t_vector = time.perf_counter() - t0
+  print("  One to all:    scalar {:>9.2f} ms   haversine_many   {:>8.2f} ms   ({:.1f}x, max error {:.2e} km)".format(
+      1000 * t_scalar, 1000 * t_vector, t_scalar / t_vector, max(abs(a - b) for a, b in zip(scalar, vector))))
+
+  # All pairs. The scalar version is timed on a sample of rows and scaled up, since it takes minutes.
+  rows = min(n, args.scalar_rows)
+  t0 = time.perf_counter()
+  for i in range(rows):
+    for j in range(n):
+      haversine_distance(lons[i], lats[i], lons[j], lats[j])
+  t_scalar = (time.perf_counter() - t0) * n / rows
+
+  for float32 in [False, True]:
+    t0 = time.perf_counter()
+    matrix = haversine_matrix(lons, lats, float32=float32)
+    t_vector = time.perf_counter() - t0
+    max_error = max(abs(float(matrix[i, j]) - haversine_distance(lons[i], lats[i], lons[j], lats[j]))
+                    for i in range(0, n, max(1, n // 50)) for j in range(0, n, max(1, n // 50)))
+    print("  All pairs:     scalar {:>9.0f} ms   haversine_matrix {:>8.0f} ms   ({:.1f}x, {}, {:.0f} MB, max error {:.2e} km)".format(
+        1000 * t_scalar, 1000 * t_vector, t_scalar / t_vector, matrix.dtype, matrix.nbytes / 1e6, max_error))
+    del matrix
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark vectorized haversine distances")
+  parser.add_argument("--stops", default=8000, type=int, help="Number of synthetic stops, if the API is unreachable")
+  parser.add_argument("--scalar-rows", default=100, type=int, help="Rows of the all-pairs matrix to time with the scalar version")
+  main(parser.parse_args())
@@ -0,0 +1,44 @@
+import argparse, time
+from collections import Counter
+
+from benchmarks.bench_stop_graph import networks
+from benchmarks.bench_transfer_table import percentile
+from utils.pareto import k_best_routes, pareto_routes
+
+
+def main(args):
+  """
+  Reports Pareto frontier sizes and query latency (p50/p99) for pareto_routes and k_best_routes over every
+  stop pair, or a sample of them on large networks.
+  """
+  for label, graph in networks(args):
+    stops = graph.stop_names
+    pairs = [(a, b) for a in stops for b in stops if a != b]
+    pairs = pairs[::max(1, len(pairs) // args.max_pairs)]
+    print("==> {} ({} stops, {} nodes, {} pairs)".format(label, len(stops), len(graph.node_stop), len(pairs)))
+
+    for name, search in [("shortest_path", lambda A, B: graph.shortest_path(A, B)),
+                         ("pareto_routes", lambda A, B: pareto_routes(graph, A, B)),
+                         ("k_best_routes k={}".format(args.k), lambda A, B: k_best_routes(graph, A, B, k=args.k))]:
+      latencies, sizes = [], Counter()
+      for stop_A, stop_B in pairs:
+        t0 = time.perf_counter()
+        result = search(stop_A, stop_B)
+        latencies.append(time.perf_counter() - t0)
+        if name == "pareto_routes":
+          sizes[len(result)] += 1
+
+      latencies_us = sorted(1e6 * t for t in latencies)
+      print("  {:<18} p50 {:>9.1f} us   p99 {:>9.1f} us   mean {:>9.1f} us".format(
+          name, percentile(latencies_us, 50), percentile(latencies_us, 99), sum(latencies_us) / len(latencies_us)))
+      if name == "pareto_routes":
+        print("  {:<18} mean {:.2f}, max {}, histogram {}".format(
+            "frontier size", sum(n * c for n, c in sizes.items()) / len(pairs), max(sizes), dict(sorted(sizes.items()))))
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark Pareto (transfers vs. distance) and k-best route searches")
+  parser.add_argument("--transfer-penalty", default=1.0, type=float, help="Transfer penalty in km, for k_best_routes")
+  parser.add_argument("--max-pairs", default=2000, type=int, help="Maximum number of stop pairs per network")
+  parser.add_argument("--k", default=3, type=int, help="Number of alternatives for k_best_routes")
+  main(parser.parse_args())
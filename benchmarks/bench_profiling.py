@@ -0,0 +1,58 @@
+import argparse, time
+
+from benchmarks.bench_coarse_route import random_stop_pairs
+from benchmarks.synthetic import synthetic_network, FULL_NETWORK
+from utils import profiling
+from utils.routing import TransitGraph, _find_coarse_route, find_coarse_route, preprocess_nominal
+
+
+def ns_per_query(route_fn, pairs, graph):
+  t0 = time.perf_counter()
+  for stop_A, stop_B in pairs:
+    route_fn(stop_A, stop_B, graph, None)
+  return 1e9 * (time.perf_counter() - t0) / len(pairs)
+
+
+def main(args):
+  """
+  Measures what the instrumentation in find_coarse_route costs: the uninstrumented search vs. the public
+  function with profiling off (one global check) and on (a timer, a histogram and two counters per query).
+  """
+  ordered_stop_names, _ = synthetic_network(**FULL_NETWORK)
+  routes_containing_stop = {}
+  for route_name, stop_names in ordered_stop_names.items():
+    for stop_name in stop_names:
+      routes_containing_stop.setdefault(stop_name, set()).add(route_name)
+
+  for label, network in [("nominal", preprocess_nominal(allow_cache=True, verbose=False)),
+                         ("synthetic full", routes_containing_stop)]:
+    graph = TransitGraph(network)
+    pairs = [(a, b) for a, b in random_stop_pairs(network, args.queries) if a != b]
+    print("==> {} network ({} stops, {} routes, {} queries)".format(
+        label, len(graph.stop_names), len(graph.route_names), len(pairs)))
+
+    # The three are interleaved (and the fastest pass of each is kept), so that warming up doesn't favor one.
+    baseline_ns, off_ns, on_ns = float("inf"), float("inf"), float("inf")
+    for _ in range(args.repeats):
+      baseline_ns = min(baseline_ns, ns_per_query(_find_coarse_route, pairs, graph))
+      off_ns = min(off_ns, ns_per_query(find_coarse_route, pairs, graph))
+      profiler = profiling.enable()
+      on_ns = min(on_ns, ns_per_query(find_coarse_route, pairs, graph))
+      profiling.disable()
+
+    histogram = profiler.histograms["route_query"]
+    print("  Uninstrumented:  {:>8.0f} ns/query".format(baseline_ns))
+    print("  Profiling off:   {:>8.0f} ns/query  (+{:.0f} ns, {:+.1f}%)".format(
+        off_ns, off_ns - baseline_ns, 100 * (off_ns / baseline_ns - 1)))
+    print("  Profiling on:    {:>8.0f} ns/query  (+{:.0f} ns, {:+.1f}%)   p50 <= {} ms, p99 <= {} ms, "
+          "{:.1f} routes expanded per search".format(
+              on_ns, on_ns - baseline_ns, 100 * (on_ns / baseline_ns - 1), histogram.percentile(50),
+              histogram.percentile(99), profiler.counters.get("routes_expanded", 0) /
+              max(1, profiler.counters.get("route_searches", 0))))
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark the cost of profiling find_coarse_route")
+  parser.add_argument("--queries", default=5000, type=int, help="Number of random stop pairs to route")
+  parser.add_argument("--repeats", default=5, type=int, help="Passes over the queries (the fastest is reported)")
+  main(parser.parse_args())
@@ -0,0 +1,59 @@
+import argparse, os, random, tempfile, time
+from collections import Counter
+
+from benchmarks.bench_transfer_table import percentile
+from benchmarks.synthetic import synthetic_network, write_synthetic_gtfs, FULL_NETWORK
+from utils.raptor import Timetable, earliest_arrival
+
+
+def main(args):
+  """
+  Builds a Timetable from a GTFS feed, and reports RAPTOR query latency (p50/p99) over random stop pairs and
+  departure times spread over a day. Without --gtfs, the feed is a synthetic full network with a trip each
+  way on every route every --headway minutes from 5am to 1am (about the size of the MBTA's schedule).
+  """
+  folder = tempfile.TemporaryDirectory()
+  path = args.gtfs
+  if path is None:
+    path = os.path.join(folder.name, "synthetic.zip")
+    ordered_stop_names, coordinates = synthetic_network(**FULL_NETWORK)
+    num_rows = write_synthetic_gtfs(path, ordered_stop_names, coordinates, trips_per_direction=20 * 60 // args.headway,
+                                    headway=60 * args.headway)
+    print("==> Synthetic full network ({} routes, {} stop_times rows)".format(len(ordered_stop_names), num_rows))
+
+  t0 = time.perf_counter()
+  timetable = Timetable.from_gtfs(path, date=args.date, verbose=False)
+  print("  built timetable in {:.2f} sec: {} stops, {} patterns, {} trips, {} stop times".format(
+      time.perf_counter() - t0, len(timetable.stop_names), len(timetable.pattern_route), len(timetable.trip_ids),
+      len(timetable.arrivals)))
+
+  rng = random.Random(0)
+  stops = timetable.stop_names
+  latencies, transfers, num_infeasible = [], Counter(), 0
+  for _ in range(args.queries):
+    stop_A, stop_B = rng.choice(stops), rng.choice(stops)
+    departure_time = 3600 * 5 + rng.randrange(0, 19 * 3600)
+    t0 = time.perf_counter()
+    journey = earliest_arrival(timetable, stop_A, stop_B, departure_time, max_transfers=args.max_transfers)
+    latencies.append(time.perf_counter() - t0)
+    if journey is None:
+      num_infeasible += 1
+    else:
+      transfers[journey.transfers] += 1
+
+  latencies_ms = sorted(1e3 * t for t in latencies)
+  print("  {} queries: p50 {:.2f} ms   p99 {:.2f} ms   mean {:.2f} ms   max {:.2f} ms".format(
+      args.queries, percentile(latencies_ms, 50), percentile(latencies_ms, 99), sum(latencies_ms) / len(latencies_ms),
+      latencies_ms[-1]))
+  print("  transfers {}, {} without a journey".format(dict(sorted(transfers.items())), num_infeasible))
+  folder.cleanup()
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark RAPTOR earliest arrival queries")
+  parser.add_argument("--gtfs", default=None, type=str, help="GTFS zip to route over (default: a synthetic feed)")
+  parser.add_argument("--date", default=None, type=str, help="Service day (YYYYMMDD) to build the timetable for")
+  parser.add_argument("--headway", default=10, type=int, help="Minutes between trips in the synthetic feed")
+  parser.add_argument("--queries", default=1000, type=int, help="Number of random queries")
+  parser.add_argument("--max-transfers", default=5, type=int, help="Maximum number of transfers per journey")
+  main(parser.parse_args())
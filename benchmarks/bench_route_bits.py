@@ -0,0 +1,77 @@
+import argparse, random, time
+
+from benchmarks.bench_coarse_route import random_stop_pairs
+from benchmarks.synthetic import synthetic_network, FULL_NETWORK
+from utils.route_bits import BitGraph, transfer_counts
+from utils.routing import TransitGraph, find_coarse_route, preprocess_nominal
+
+
+def main(args):
+  """
+  Compares bitmask route sets (BitGraph) with the route id tuples of TransitGraph, on the 8-route nominal
+  network and the synthetic ~170-route network:
+    - Single queries: find_coarse_route vs. BitGraph.find_coarse_route on random stop pairs.
+    - Many origins: the fewest transfers from --origins stops to --destinations stops, with one
+      find_coarse_route per pair vs. one bit-parallel BFS from every origin at once (transfer_counts).
+  """
+  ordered_stop_names, _ = synthetic_network(**FULL_NETWORK)
+  synthetic = {}
+  for route_name, stop_names in ordered_stop_names.items():
+    for stop_name in stop_names:
+      synthetic.setdefault(stop_name, set()).add(route_name)
+
+  for label, network in [("nominal", preprocess_nominal(allow_cache=True, verbose=False)), ("synthetic full", synthetic)]:
+    graph = TransitGraph(network)
+    t0 = time.perf_counter()
+    bit_graph = BitGraph(graph)
+    build_ms = 1e3 * (time.perf_counter() - t0)
+    print("==> {} network ({} stops, {} routes, BitGraph built in {:.2f} ms)".format(
+        label, len(graph.stop_names), len(graph.route_names), build_ms))
+
+    pairs = [(a, b) for a, b in random_stop_pairs(network, args.queries) if a != b]
+    best_sets, best_bits = float("inf"), float("inf")
+    for _ in range(args.repeats):
+      t0 = time.perf_counter()
+      for stop_A, stop_B in pairs:
+        find_coarse_route(stop_A, stop_B, graph)
+      best_sets = min(best_sets, time.perf_counter() - t0)
+      t0 = time.perf_counter()
+      for stop_A, stop_B in pairs:
+        bit_graph.find_coarse_route(stop_A, stop_B)
+      best_bits = min(best_bits, time.perf_counter() - t0)
+    is_same = all(len(find_coarse_route(a, b, graph)[1]) == len(bit_graph.find_coarse_route(a, b)[1]) for a, b in pairs)
+    print("  Single queries ({}):  route id tuples {:>7.2f} us/query   bitmasks {:>7.2f} us/query   "
+          "speedup {:.2f}x   {}".format(len(pairs), 1e6 * best_sets / len(pairs), 1e6 * best_bits / len(pairs),
+                                       best_sets / best_bits, "same transfers" if is_same else "MISMATCH"))
+
+    rng = random.Random(0)
+    stops = sorted(network)
+    origins = rng.sample(stops, min(args.origins, len(stops)))
+    destinations = rng.sample(stops, min(args.destinations, len(stops)))
+    t0 = time.perf_counter()
+    expected = []
+    for stop_A in origins:
+      row = []
+      for stop_B in destinations:
+        is_feasible, S = find_coarse_route(stop_A, stop_B, graph) if stop_A != stop_B else (True, [None])
+        row.append(len(S) - 1 if is_feasible else -1)
+      expected.append(row)
+    per_pair_sec = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    counts = transfer_counts(bit_graph, [bit_graph.stop_masks[graph.stop_ids[s]] for s in origins],
+                             [bit_graph.stop_masks[graph.stop_ids[s]] for s in destinations])
+    parallel_sec = time.perf_counter() - t0
+    print("  Many origins ({} x {}):  one search per pair {:>8.1f} ms   bit-parallel BFS {:>7.1f} ms   "
+          "speedup {:.0f}x   {}".format(len(origins), len(destinations), 1e3 * per_pair_sec, 1e3 * parallel_sec,
+                                      per_pair_sec / parallel_sec,
+                                      "same transfers" if [list(row) for row in counts] == expected else "MISMATCH"))
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark bitmask route sets and bit-parallel BFS")
+  parser.add_argument("--queries", default=20000, type=int, help="Number of random stop pairs to route")
+  parser.add_argument("--repeats", default=3, type=int, help="Passes over the queries (the fastest is reported)")
+  parser.add_argument("--origins", default=256, type=int, help="Number of origins for the many-origins comparison")
+  parser.add_argument("--destinations", default=256, type=int, help="Number of destinations for it")
+  main(parser.parse_args())
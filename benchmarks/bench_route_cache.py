@@ -0,0 +1,56 @@
+import argparse, time
+
+from benchmarks.bench_coarse_route import random_stop_pairs
+from benchmarks.synthetic import synthetic_network, FULL_NETWORK
+from utils.route_cache import RouteCache
+from utils.routing import TransitGraph, find_coarse_route, preprocess_nominal
+
+
+def main(args):
+  """
+  Routes a batch of random stop pairs with find_coarse_route, and with a RouteCache in front of it.
+  Reports how many searches the cache actually runs (one per pair of route-set classes that's queried),
+  its hit rate, and the speedup. The uncached search is timed on the first --baseline-queries pairs.
+  """
+  ordered_stop_names, _ = synthetic_network(**FULL_NETWORK)
+  synthetic = {}
+  for route_name, stop_names in ordered_stop_names.items():
+    for stop_name in stop_names:
+      synthetic.setdefault(stop_name, set()).add(route_name)
+
+  for label, network in [("nominal", preprocess_nominal(allow_cache=True, verbose=False)), ("synthetic full", synthetic)]:
+    graph = TransitGraph(network)
+    pairs = [(a, b) for a, b in random_stop_pairs(network, args.queries) if a != b]
+    baseline_pairs = pairs[:args.baseline_queries]
+    print("==> {} network ({} stops, {} routes, {} route-set classes, {} queries)".format(
+        label, len(graph.stop_names), len(graph.route_names), len(set(graph.stop_routes)), len(pairs)))
+
+    # Results aren't kept while timing (like a batch that writes them out), so that neither loop pays for
+    # garbage collection of a million lists.
+    t0 = time.perf_counter()
+    for stop_A, stop_B in baseline_pairs:
+      find_coarse_route(stop_A, stop_B, graph)
+    baseline_us = 1e6 * (time.perf_counter() - t0) / len(baseline_pairs)
+
+    cache = RouteCache(max_entries=args.max_entries)
+    t0 = time.perf_counter()
+    for stop_A, stop_B in pairs:
+      cache.find_coarse_route(stop_A, stop_B, graph)
+    cached_us = 1e6 * (time.perf_counter() - t0) / len(pairs)
+    hits, misses, hit_rate, num_entries = cache.hits, cache.misses, cache.hit_rate(), len(cache.entries)
+    is_same = all(cache.find_coarse_route(a, b, graph) == find_coarse_route(a, b, graph) for a, b in baseline_pairs)
+
+    print("  find_coarse_route:  {:>8.2f} us/query ({} queries)".format(baseline_us, len(baseline_pairs)))
+    print("  RouteCache:         {:>8.2f} us/query   {} searches, {} hits, hit rate {:.4%}, {} entries   "
+          "speedup {:.1f}x   {}".format(
+              cached_us, misses, hits, hit_rate, num_entries, baseline_us / cached_us,
+              "same results" if is_same else "MISMATCH"))
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark memoizing find_coarse_route by route-set classes")
+  parser.add_argument("--queries", default=1000000, type=int, help="Number of random stop pairs to route")
+  parser.add_argument("--baseline-queries", default=100000, type=int,
+                      help="Number of those pairs to also route without the cache")
+  parser.add_argument("--max-entries", default=65536, type=int, help="Size of the LRU")
+  main(parser.parse_args())
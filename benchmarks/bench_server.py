@@ -0,0 +1,138 @@
+import argparse, asyncio, json, os, random, tempfile, threading, time
+from urllib.parse import quote, urlsplit
+
+from benchmarks.bench_transfer_table import percentile
+from benchmarks.synthetic import RAPID_TRANSIT, FULL_NETWORK, synthetic_network, routes_containing_stop
+from utils.server import RoutingServer, RoutingService
+from utils.snapshot import write_snapshot
+
+
+async def _request(reader, writer, method, path, body=b""):
+  """
+  Sends one request on a keep-alive connection and reads the response. Returns (status, body bytes).
+  """
+  writer.write("{} {} HTTP/1.1\r\nHost: bench\r\nContent-Length: {}\r\n\r\n".format(method, path, len(body)).encode("latin-1") + body)
+  await writer.drain()
+  status = int((await reader.readline()).split()[1])
+  length = 0
+  while True:
+    line = await reader.readline()
+    if line in (b"\r\n", b"\n", b""):
+      break
+    key, _, value = line.decode("latin-1").partition(":")
+    if key.strip().lower() == "content-length":
+      length = int(value)
+  return status, await reader.readexactly(length)
+
+
+async def run_load(host, port, stop_names, num_requests, concurrency, bulk_size, seed=0):
+  """
+  Load generator: concurrency clients each hold a keep-alive connection and send requests back to back.
+  With bulk_size > 1, each request is a POST /routes with that many pairs, otherwise a GET /route.
+
+  Returns:
+    (list of float) Latency of every request, in seconds.
+    (int) Number of requests that didn't return 200.
+    (float) Wall clock time, in seconds.
+  """
+  rng = random.Random(seed)
+  latencies, num_errors = [], [0]
+  remaining = [num_requests]
+
+  async def client():
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+      while remaining[0] > 0:
+        remaining[0] -= 1
+        if bulk_size > 1:
+          pairs = [{"from": rng.choice(stop_names), "to": rng.choice(stop_names)} for _ in range(bulk_size)]
+          method, path, body = "POST", "/routes", json.dumps(pairs).encode("utf-8")
+        else:
+          method, body = "GET", b""
+          path = "/route?from={}&to={}".format(quote(rng.choice(stop_names)), quote(rng.choice(stop_names)))
+        t0 = time.perf_counter()
+        status, _ = await _request(reader, writer, method, path, body)
+        latencies.append(time.perf_counter() - t0)
+        num_errors[0] += status != 200
+    finally:
+      writer.close()
+
+  t0 = time.perf_counter()
+  await asyncio.gather(*[client() for _ in range(concurrency)])
+  return latencies, num_errors[0], time.perf_counter() - t0
+
+
+def start_local_server(snapshot_path, reload_interval):
+  """
+  Starts a RoutingServer on a free port, with its own event loop in a background thread.
+  """
+  server = RoutingServer(RoutingService(snapshot_path), port=0, reload_interval=reload_interval)
+  loop = asyncio.new_event_loop()
+  loop.run_until_complete(server.start())
+  threading.Thread(target=loop.run_forever, daemon=True).start()
+  return server
+
+
+def main(args):
+  """
+  Load tests the routing server, either one that's already running (--url), or a local one serving a
+  synthetic network. With --reload, the local snapshot is rewritten during the test to exercise hot reloading.
+
+  NOTE: The load generator runs in the same process (and GIL) as a local server, so throughput is a lower bound.
+  """
+  folder = tempfile.TemporaryDirectory()
+  ordered, _ = synthetic_network(**(FULL_NETWORK if args.full else RAPID_TRANSIT))
+  network = routes_containing_stop(ordered)
+  stop_names = sorted(network)
+
+  if args.url is not None:
+    parts = urlsplit(args.url)
+    host, port, server = parts.hostname, parts.port, None
+    if args.stops is not None:
+      with open(args.stops, "r") as f:
+        stop_names = [line.strip() for line in f if len(line.strip()) > 0]
+  else:
+    snapshot_path = os.path.join(folder.name, "network.snap")
+    write_snapshot(snapshot_path, network)
+    server = start_local_server(snapshot_path, reload_interval=0.1)
+    host, port = "127.0.0.1", server.port
+
+    if args.reload:
+      def rewrite():
+        while not done.is_set():
+          time.sleep(0.25)
+          write_snapshot(snapshot_path, network)
+      done = threading.Event()
+      threading.Thread(target=rewrite, daemon=True).start()
+
+  print("==> {} stops, {} requests, {} connections, {} pair(s) per request".format(
+      len(stop_names), args.requests, args.concurrency, args.bulk))
+  latencies, num_errors, elapsed = asyncio.run(
+      run_load(host, port, stop_names, args.requests, args.concurrency, args.bulk))
+
+  latencies_ms = sorted(1000 * t for t in latencies)
+  print("  {:.0f} requests/sec ({:.0f} routes/sec), {} errors".format(
+      len(latencies) / elapsed, len(latencies) * args.bulk / elapsed, num_errors))
+  print("  client latency p50 {:.2f} ms   p99 {:.2f} ms   max {:.2f} ms".format(
+      percentile(latencies_ms, 50), percentile(latencies_ms, 99), latencies_ms[-1]))
+
+  if server is not None:
+    if args.reload:
+      done.set()
+    metrics = server.metrics()
+    endpoint = "/routes" if args.bulk > 1 else "/route"
+    print("  server latency p50 <= {} ms   p99 <= {} ms   ({} reloads)".format(
+        metrics["latency"][endpoint]["p50_ms"], metrics["latency"][endpoint]["p99_ms"], metrics["num_reloads"]))
+  folder.cleanup()
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Load test the routing server")
+  parser.add_argument("--url", default=None, type=str, help="URL of a running routing_server (default: start one locally)")
+  parser.add_argument("--stops", default=None, type=str, help="File with one stop name per line to query, with --url")
+  parser.add_argument("--full", action="store_true", help="Serve a synthetic network the size of all MBTA routes")
+  parser.add_argument("--requests", default=5000, type=int, help="Total number of requests to send")
+  parser.add_argument("--concurrency", default=16, type=int, help="Number of concurrent keep-alive connections")
+  parser.add_argument("--bulk", default=1, type=int, help="Pairs per request (more than 1 uses POST /routes)")
+  parser.add_argument("--reload", action="store_true", help="Rewrite the snapshot during the test to trigger hot reloads")
+  main(parser.parse_args())
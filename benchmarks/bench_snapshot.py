@@ -0,0 +1,53 @@
+import argparse, os, pickle, tempfile, time
+
+from utils.routing import TransitGraph, path_to_output_file
+from utils.snapshot import Snapshot, write_snapshot
+
+
+def best_of(fn, repeats):
+  best = float("inf")
+  for _ in range(repeats):
+    t0 = time.perf_counter()
+    fn()
+    best = min(best, time.perf_counter() - t0)
+  return 1000 * best
+
+
+def main(args):
+  """
+  Compares loading a network (and building its TransitGraph) from the pickle caches vs. a snapshot.
+  """
+  for name in ["nominal", "covid"]:
+    path_to_pickle = path_to_output_file("routes_containing_stop_{}.pkl".format(name))
+    with open(path_to_pickle, "rb") as f:
+      routes_containing_stop = pickle.load(f)
+
+    with tempfile.TemporaryDirectory() as folder:
+      path_to_snapshot = os.path.join(folder, "network.snap")
+      write_snapshot(path_to_snapshot, routes_containing_stop)
+
+      def load_pickle():
+        with open(path_to_pickle, "rb") as f:
+          return pickle.load(f)
+
+      def open_snapshot():
+        Snapshot(path_to_snapshot).close()
+
+      def snapshot_to_graph():
+        snapshot = Snapshot(path_to_snapshot)
+        TransitGraph.from_snapshot(snapshot)
+        snapshot.close()
+
+      print("==> {} network ({} bytes pickle, {} bytes snapshot)".format(
+          name, os.path.getsize(path_to_pickle), os.path.getsize(path_to_snapshot)))
+      print("  Load pickle:                   {:>8.3f} ms".format(best_of(load_pickle, args.repeats)))
+      print("  Load pickle + TransitGraph:    {:>8.3f} ms".format(
+          best_of(lambda: TransitGraph(load_pickle()), args.repeats)))
+      print("  Open snapshot:                 {:>8.3f} ms".format(best_of(open_snapshot, args.repeats)))
+      print("  Open snapshot + TransitGraph:  {:>8.3f} ms".format(best_of(snapshot_to_graph, args.repeats)))
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark loading the pickle caches vs. network snapshots")
+  parser.add_argument("--repeats", default=20, type=int, help="Number of timed runs per case")
+  main(parser.parse_args())
@@ -0,0 +1,44 @@
+import argparse, heapq, random, time
+
+from benchmarks.bench_haversine import all_stop_coordinates
+from utils.spatial import StopIndex
+from utils.utils import haversine_distance
+
+
+def main(args):
+  """
+  Compares nearest-stop lookups with a StopIndex vs. a linear scan with haversine_distance.
+  """
+  label, coords = all_stop_coordinates(args.stops)
+  coordinates = {"Stop {}".format(i): (lat, lng) for i, (lng, lat) in enumerate(coords)}
+
+  t0 = time.perf_counter()
+  index = StopIndex(coordinates)
+  build_ms = 1000 * (time.perf_counter() - t0)
+
+  rng = random.Random(0)
+  lats = [c[0] for c in coordinates.values()]
+  lngs = [c[1] for c in coordinates.values()]
+  queries = [(rng.uniform(min(lats), max(lats)), rng.uniform(min(lngs), max(lngs))) for _ in range(args.queries)]
+
+  print("==> {} ({} stops, {} queries, index build {:.1f} ms)".format(label, len(coordinates), len(queries), build_ms))
+  for k in [1, 10]:
+    t0 = time.perf_counter()
+    for lat, lng in queries:
+      heapq.nsmallest(k, ((haversine_distance(c[1], c[0], lng, lat), name) for name, c in coordinates.items()))
+    t_linear = (time.perf_counter() - t0) / len(queries)
+
+    t0 = time.perf_counter()
+    for lat, lng in queries:
+      index.nearest_stops(lat, lng, k=k)
+    t_index = (time.perf_counter() - t0) / len(queries)
+
+    print("  k={:<3} linear scan {:>9.1f} us/query   StopIndex {:>7.1f} us/query   ({:.0f}x)".format(
+        k, 1e6 * t_linear, 1e6 * t_index, t_linear / t_index))
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark nearest-stop lookups")
+  parser.add_argument("--stops", default=8000, type=int, help="Number of synthetic stops, if the API is unreachable")
+  parser.add_argument("--queries", default=200, type=int, help="Number of random points to look up")
+  main(parser.parse_args())
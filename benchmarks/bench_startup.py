@@ -0,0 +1,77 @@
+import argparse, compileall, os, statistics, subprocess, sys, time
+
+from utils.routing import load_snapshot
+
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(module):
+  """
+  Imports module in a fresh interpreter with -X importtime.
+
+  Returns (dict) : Maps each module imported by module (not by the interpreter's startup, which is
+                   reported up to "site") to its (self, cumulative) import time in microseconds.
+  """
+  result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module], cwd=_ROOT,
+                          stderr=subprocess.PIPE, check=True, universal_newlines=True)
+  times = {}
+  for line in result.stderr.splitlines():
+    if not line.startswith("import time:") or "self [us]" in line:
+      continue
+    self_us, cumulative_us, name = line[len("import time:"):].split("|")
+    if name.strip() == "site":
+      times = {}
+      continue
+    times[name.strip()] = (int(self_us), int(cumulative_us))
+  return times
+
+
+def wall_time_ms(command, runs):
+  """
+  Median wall time of running command (a list of arguments) runs times.
+  """
+  times = []
+  for _ in range(runs):
+    t0 = time.perf_counter()
+    subprocess.run(command, cwd=_ROOT, stdout=subprocess.DEVNULL, check=True)
+    times.append(1e3 * (time.perf_counter() - t0))
+  return statistics.median(times)
+
+
+def main(args):
+  """
+  Reports the cold start of routing_main.py on a cached network: the -X importtime of routing_main (and
+  the slowest modules it imports), and the wall time of a query compared to an empty interpreter. Exits
+  with an error if importing routing_main takes longer than --budget-ms, so that this can be run in CI to
+  catch an expensive import (i.e the MBTA API client) creeping back into the cached query path.
+  """
+  # Measure with bytecode, like a normal install (PYTHONDONTWRITEBYTECODE would otherwise make every run compile).
+  compileall.compile_dir(os.path.join(_ROOT, "utils"), quiet=1)
+  compileall.compile_file(os.path.join(_ROOT, "routing_main.py"), quiet=1)
+  load_snapshot("nominal", allow_cache=True, verbose=False)
+
+  runs = [import_times("routing_main") for _ in range(args.runs)]
+  import_ms = statistics.median(times["routing_main"][1] for times in runs) / 1e3
+  print("==> import routing_main: {:.1f} ms (median of {} runs, budget {:.1f} ms)".format(
+      import_ms, args.runs, args.budget_ms))
+  slowest = sorted(runs[-1].items(), key=lambda item: -item[1][0])[:args.top]
+  for name, (self_us, cumulative_us) in slowest:
+    print("  {:<32} self {:>6.2f} ms   cumulative {:>6.2f} ms".format(name, self_us / 1e3, cumulative_us / 1e3))
+
+  empty_ms = wall_time_ms([sys.executable, "-c", "pass"], args.runs)
+  query_ms = wall_time_ms([sys.executable, "routing_main.py", "--A", "Wonderland", "--B", "Alewife"], args.runs)
+  print("==> Wall time: empty interpreter {:.1f} ms   cached query {:.1f} ms (+{:.1f} ms)".format(
+      empty_ms, query_ms, query_ms - empty_ms))
+
+  if import_ms > args.budget_ms:
+    print("FAILED: import routing_main took {:.1f} ms, over the budget of {:.1f} ms".format(import_ms, args.budget_ms))
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark the cold start of routing_main.py")
+  parser.add_argument("--runs", default=10, type=int, help="Number of runs to take the median of")
+  parser.add_argument("--budget-ms", default=30.0, type=float, help="Fail if import routing_main takes longer")
+  parser.add_argument("--top", default=8, type=int, help="Number of slowest imports to show")
+  main(parser.parse_args())
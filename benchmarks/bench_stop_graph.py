@@ -0,0 +1,56 @@
+import argparse, os, time
+
+from benchmarks.synthetic import synthetic_network, RAPID_TRANSIT, FULL_NETWORK
+from utils.routing import path_to_output_file
+from utils.snapshot import Snapshot
+from utils.stop_graph import StopGraph
+
+
+def networks(args):
+  """
+  Uses the nominal snapshot if it was written from the API (so it has coordinates), plus synthetic networks.
+  """
+  path_to_snapshot = path_to_output_file("network_nominal.snap")
+  if os.path.exists(path_to_snapshot):
+    snapshot = Snapshot(path_to_snapshot)
+    try:
+      yield "nominal snapshot", StopGraph.from_snapshot(snapshot, transfer_penalty_km=args.transfer_penalty)
+    except ValueError:
+      print("NOTE: Skipping {}, it doesn't have stop coordinates".format(path_to_snapshot))
+    snapshot.close()
+
+  for label, sizes in [("synthetic rapid transit", RAPID_TRANSIT), ("synthetic full network", FULL_NETWORK)]:
+    ordered_stop_names, coordinates = synthetic_network(**sizes)
+    yield label, StopGraph(ordered_stop_names, coordinates, transfer_penalty_km=args.transfer_penalty)
+
+
+def main(args):
+  """
+  Compares A* and Dijkstra (nodes expanded and latency) on every stop pair, or a sample of them on large networks.
+  """
+  for label, graph in networks(args):
+    stops = graph.stop_names
+    pairs = [(a, b) for a in stops for b in stops if a != b]
+    pairs = pairs[::max(1, len(pairs) // args.max_pairs)]
+
+    print("==> {} ({} stops, {} nodes, {} pairs)".format(label, len(stops), len(graph.node_stop), len(pairs)))
+    costs = {}
+    for name, use_astar in [("Dijkstra", False), ("A*", True)]:
+      total_expanded = 0
+      t0 = time.perf_counter()
+      costs[name] = []
+      for stop_A, stop_B in pairs:
+        _, _, cost, num_expanded = graph.shortest_path(stop_A, stop_B, use_astar=use_astar)
+        total_expanded += num_expanded
+        costs[name].append(cost)
+      elapsed = time.perf_counter() - t0
+      print("  {:<9} {:>10.1f} nodes expanded/query   {:>9.1f} us/query".format(
+          name, total_expanded / len(pairs), 1e6 * elapsed / len(pairs)))
+    assert all(abs(a - b) < 1e-9 for a, b in zip(costs["Dijkstra"], costs["A*"]))
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark A* vs. Dijkstra on the stop-level graph")
+  parser.add_argument("--transfer-penalty", default=1.0, type=float, help="Transfer penalty in km")
+  parser.add_argument("--max-pairs", default=2000, type=int, help="Maximum number of stop pairs per network")
+  main(parser.parse_args())
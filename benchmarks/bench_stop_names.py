@@ -0,0 +1,74 @@
+import argparse, difflib, random, time
+
+from utils.stop_names import StopNameResolver, normalize_name
+
+
+_WORDS = ["Park", "Street", "Center", "Square", "Station", "Avenue", "Road", "Hill", "Harvard", "Kendall",
+          "Government", "Boston", "College", "University", "Washington", "Commonwealth", "Beacon", "Summit",
+          "Chestnut", "Brookline", "Village", "Heath", "Forest", "Lake", "Union", "Central", "Davis", "Porter"]
+
+
+def synthetic_stop_names(num_stops, seed=0):
+  rng = random.Random(seed)
+  names = set()
+  while len(names) < num_stops:
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(1, 3))]
+    names.add("{} {}".format(" ".join(words), rng.randint(1, 999)))
+  return sorted(names)
+
+
+def misspell(name, rng):
+  """
+  Drops, swaps or replaces one character of a name.
+  """
+  i = rng.randrange(len(name) - 1)
+  kind = rng.randrange(3)
+  if kind == 0:
+    return name[:i] + name[i + 1:]
+  if kind == 1:
+    return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+  return name[:i] + rng.choice("abcdefghijklmnopqrstuvwxyz") + name[i + 1:]
+
+
+def main(args):
+  """
+  Compares fuzzy stop name lookups with a StopNameResolver vs. a difflib scan over every name.
+  """
+  rng = random.Random(1)
+  stop_names = synthetic_stop_names(args.stops)
+  queries = [(name, misspell(name, rng)) for name in rng.sample(stop_names, args.queries)]
+
+  t0 = time.perf_counter()
+  resolver = StopNameResolver(stop_names)
+  build_ms = 1000 * (time.perf_counter() - t0)
+  print("==> {} stops, {} misspelled queries (index build {:.1f} ms)".format(len(stop_names), len(queries), build_ms))
+
+  normalized = {normalize_name(name): name for name in stop_names}
+  t0 = time.perf_counter()
+  correct = 0
+  for name, query in queries:
+    matches = difflib.get_close_matches(normalize_name(query), normalized, n=1, cutoff=0.0)
+    correct += len(matches) > 0 and normalized[matches[0]] == name
+  t_linear = (time.perf_counter() - t0) / len(queries)
+  print("  difflib scan      {:>9.1f} us/query   top-1 accuracy {:.1%}".format(1e6 * t_linear, correct / len(queries)))
+
+  t0 = time.perf_counter()
+  correct = 0
+  for name, query in queries:
+    matches = resolver.resolve(query, k=1)
+    correct += len(matches) > 0 and matches[0][0] == name
+  t_index = (time.perf_counter() - t0) / len(queries)
+  print("  StopNameResolver  {:>9.1f} us/query   top-1 accuracy {:.1%}   ({:.0f}x)".format(
+      1e6 * t_index, correct / len(queries), t_linear / t_index))
+
+  t0 = time.perf_counter()
+  for name, _ in queries:
+    resolver.complete(name[:4])
+  print("  complete()        {:>9.1f} us/query".format(1e6 * (time.perf_counter() - t0) / len(queries)))
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark fuzzy stop name resolution")
+  parser.add_argument("--stops", default=8000, type=int, help="Number of synthetic stop names")
+  parser.add_argument("--queries", default=50, type=int, help="Number of misspelled names to look up")
+  main(parser.parse_args())
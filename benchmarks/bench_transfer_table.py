@@ -0,0 +1,55 @@
+import argparse, time
+
+from benchmarks.bench_coarse_route import random_stop_pairs
+from benchmarks.synthetic import synthetic_network, FULL_NETWORK
+from utils.routing import TransitGraph, find_coarse_route, preprocess_nominal, preprocess_covid
+from utils.transfer_table import TransferTable
+
+
+def latencies_us(pairs, route_fn):
+  latencies = []
+  for stop_A, stop_B in pairs:
+    t0 = time.perf_counter()
+    route_fn(stop_A, stop_B)
+    latencies.append(1e6 * (time.perf_counter() - t0))
+  latencies.sort()
+  return latencies
+
+
+def percentile(sorted_values, p):
+  return sorted_values[min(len(sorted_values) - 1, int(p / 100.0 * len(sorted_values)))]
+
+
+def main(args):
+  """
+  Compares per-query latency (p50/p99) of the BFS in find_coarse_route vs. TransferTable lookups, and
+  reports how long the table takes to build and how many entries it has.
+  """
+  ordered_stop_names, _ = synthetic_network(**FULL_NETWORK)
+  synthetic = {}
+  for route_name, stop_names in ordered_stop_names.items():
+    for stop_name in stop_names:
+      synthetic.setdefault(stop_name, set()).add(route_name)
+
+  for label, network in [("nominal", preprocess_nominal(allow_cache=True, verbose=False)),
+                         ("covid", preprocess_covid(allow_cache=True, verbose=False)),
+                         ("synthetic full", synthetic)]:
+    graph = TransitGraph(network)
+    pairs = [(a, b) for a, b in random_stop_pairs(graph.stop_names, args.queries) if a != b]
+
+    t0 = time.perf_counter()
+    table = TransferTable.build(graph)
+    build_ms = 1000 * (time.perf_counter() - t0)
+
+    print("==> {} network ({} stops, {} queries, table build {:.1f} ms, {} entries)".format(
+        label, len(graph.stop_names), len(pairs), build_ms, len(table.transfers)))
+    for name, route_fn in [("BFS", lambda a, b: find_coarse_route(a, b, graph)), ("Table", table.lookup)]:
+      lat = latencies_us(pairs, route_fn)
+      print("  {:<6} p50 {:>7.2f} us   p99 {:>7.2f} us   max {:>8.2f} us".format(
+          name, percentile(lat, 50), percentile(lat, 99), lat[-1]))
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Benchmark all-pairs TransferTable lookups vs. BFS")
+  parser.add_argument("--queries", default=20000, type=int, help="Number of random stop pairs to route")
+  main(parser.parse_args())
@@ -0,0 +1,99 @@
+import random
+
+from test.gtfs_fixture import write_gtfs
+from utils.utils import haversine_distance
+
+
+# Rough bounding box around Boston, used to give synthetic stops realistic coordinates.
+_LAT_RANGE = (42.20, 42.45)
+_LNG_RANGE = (-71.25, -70.95)
+
+
+def synthetic_network(num_routes, grid_size, stops_per_route, seed=0):
+  """
+  Builds a made-up network that is shaped like a real one, for benchmarks that need more data than the
+  cached pickles have (i.e stop order, coordinates, or all ~170 MBTA routes).
+
+  Stops sit on a jittered grid_size x grid_size grid. Each route is a straight line between two random
+  grid points, snapped to the grid, so routes share stops wherever they cross.
+
+  Returns:
+    (dict) Maps each route name to its stop names, in order along the route.
+    (dict) Maps each stop name to its (latitude, longitude).
+  """
+  rng = random.Random(seed)
+
+  def stop_name(row, col):
+    return "Stop {}-{}".format(row, col)
+
+  coordinates = {}
+  for row in range(grid_size):
+    for col in range(grid_size):
+      lat = _LAT_RANGE[0] + (row + 0.3 * rng.random()) / grid_size * (_LAT_RANGE[1] - _LAT_RANGE[0])
+      lng = _LNG_RANGE[0] + (col + 0.3 * rng.random()) / grid_size * (_LNG_RANGE[1] - _LNG_RANGE[0])
+      coordinates[stop_name(row, col)] = (lat, lng)
+
+  ordered_stop_names = {}
+  for route in range(num_routes):
+    r0, c0, r1, c1 = [rng.randrange(grid_size) for _ in range(4)]
+    stops = []
+    for i in range(stops_per_route):
+      t = i / max(1, stops_per_route - 1)
+      name = stop_name(int(round(r0 + t * (r1 - r0))), int(round(c0 + t * (c1 - c0))))
+      if len(stops) == 0 or stops[-1] != name:
+        stops.append(name)
+    ordered_stop_names["Route {}".format(route)] = stops
+
+  used = {stop for stops in ordered_stop_names.values() for stop in stops}
+  return ordered_stop_names, {name: coord for name, coord in coordinates.items() if name in used}
+
+
+def routes_containing_stop(ordered_stop_names):
+  """
+  Converts ordered stop lists into the dictionary that preprocess_nominal returns.
+  """
+  result = {}
+  for route, stops in ordered_stop_names.items():
+    for stop in stops:
+      result.setdefault(stop, set()).add(route)
+  return result
+
+
+# Sizes that roughly match the MBTA rapid transit network, and all route types (mostly buses).
+RAPID_TRANSIT = dict(num_routes=8, grid_size=14, stops_per_route=20)
+FULL_NETWORK = dict(num_routes=170, grid_size=90, stops_per_route=40)
+
+
+def write_synthetic_gtfs(path, ordered_stop_names, coordinates, trips_per_direction, first_departure=5 * 3600,
+                         headway=600, speed_kmh=30.0, dwell=30):
+  """
+  Writes a GTFS feed for a synthetic network, with trips_per_direction trips each way along every route,
+  one every headway seconds. Travel times come from the distance between stops at speed_kmh, plus dwell
+  seconds at each stop. Trips are generated as the feed is written, so big feeds don't need much memory.
+
+  Returns (int) : Number of rows in stop_times.txt.
+  """
+  route_ids = {route_name: "R{}".format(i) for i, route_name in enumerate(sorted(ordered_stop_names))}
+  # Route types are split roughly like the real network: a few rapid transit routes, and mostly buses.
+  routes = [(route_ids[route_name], "", route_name, 1 if i < 8 else (2 if i < 20 else (4 if i < 24 else 3)))
+            for i, route_name in enumerate(sorted(ordered_stop_names))]
+  stops = [(name, name, lat, lon, "") for name, (lat, lon) in sorted(coordinates.items())]
+
+  def offsets(stop_names):
+    times = [0]
+    for a, b in zip(stop_names[:-1], stop_names[1:]):
+      km = haversine_distance(coordinates[a][1], coordinates[a][0], coordinates[b][1], coordinates[b][0])
+      times.append(times[-1] + dwell + int(3600 * km / speed_kmh))
+    return times
+
+  def trips():
+    for route_name in sorted(ordered_stop_names):
+      for direction, stop_names in enumerate([ordered_stop_names[route_name], ordered_stop_names[route_name][::-1]]):
+        times = offsets(stop_names)
+        for i in range(trips_per_direction):
+          start = first_departure + i * headway
+          yield (route_ids[route_name], "{}-{}-{}".format(route_ids[route_name], direction, i), str(direction),
+                 [(name, start + t) for name, t in zip(stop_names, times)])
+
+  write_gtfs(path, routes, stops, trips())
+  return 2 * trips_per_direction * sum(len(stop_names) for stop_names in ordered_stop_names.values())
@@ -1,7 +1,7 @@
-import json, os
-from jsonpointer import resolve_pointer
+import argparse, json, os
 
-from utils.mbta_api import get_routes, get_stops
+from utils import profiling
+from utils.mbta_api import get_routes, get_route_stops_bulk, get_stops
 from utils.utils import *
 
 
@@ -25,12 +25,16 @@ def problem1_demo():
 
 
 def compute_route_distances(stops_by_name, routes_by_name):
+  get_destinations = compile_pointer("/attributes/direction_destinations")
+  get_latitude = compile_pointer("/attributes/latitude")
+  get_longitude = compile_pointer("/attributes/longitude")
+
   route_distances_and_endpoints = {}
   for long_name in routes_by_name:
     endpoints_A = []
     endpoints_B = []
 
-    dest_A, dest_B = resolve_pointer(routes_by_name[long_name], "/attributes/direction_destinations")
+    dest_A, dest_B = get_destinations(routes_by_name[long_name])
 
     # Handle compound destinations such as Ashmont/Braintree (two separate endpoints of the Red line).
     if dest_A not in stops_by_name and "/" in dest_A:
@@ -53,17 +57,19 @@ def compute_route_distances(stops_by_name, routes_by_name):
       print("Couldn't find {} or {} on the {} route".format(dest_A, dest_B, long_name))
 
     route_distances_and_endpoints[long_name] = (0, None, None)
-    for stop_A in endpoints_A:
-      for stop_B in endpoints_B:
-        latA = resolve_pointer(stops_by_name[stop_A], "/attributes/latitude")
-        lngA = resolve_pointer(stops_by_name[stop_A], "/attributes/longitude")
-        latB = resolve_pointer(stops_by_name[stop_B], "/attributes/latitude")
-        lngB = resolve_pointer(stops_by_name[stop_B], "/attributes/longitude")
+    if len(endpoints_A) == 0 or len(endpoints_B) == 0:
+      continue
 
-        distance_km = haversine_distance(lngA, latA, lngB, latB)
+    # Distances between every pair of endpoints, then keep the farthest pair.
+    distances = haversine_matrix(
+        [get_longitude(stops_by_name[stop]) for stop in endpoints_A],
+        [get_latitude(stops_by_name[stop]) for stop in endpoints_A],
+        [get_longitude(stops_by_name[stop]) for stop in endpoints_B],
+        [get_latitude(stops_by_name[stop]) for stop in endpoints_B])
 
-        if distance_km > route_distances_and_endpoints[long_name][0]:
-          route_distances_and_endpoints[long_name] = (distance_km, stop_A, stop_B)
+    i, j = divmod(int(distances.argmax()), len(endpoints_B))
+    if distances[i, j] > 0:
+      route_distances_and_endpoints[long_name] = (float(distances[i, j]), endpoints_A[i], endpoints_B[j])
 
   return route_distances_and_endpoints
 
@@ -74,8 +80,8 @@ def problem2_demo():
              (b) Determine the route with fewest/most stops
              (c) (Bonus) Compute the distance of the shortest/longest route
 
-  NOTE: Occasionally, this will fail due to rate limiting. An error message should be printed
-  out in that case, just try running the file again and it should work.
+  NOTE: Requests that are rate limited are retried with backoff (see MbtaClient). If the API still
+  refuses, an error message is printed out, just try running the file again and it should work.
   """
   print("=====================" * 5)
   success, routes_json = get_routes(route_types=[0, 1], sort_by="long_name", descending=False)
@@ -96,18 +102,20 @@ def problem2_demo():
   #======== (a) Get all unique stops. The MBTA API will automatically filter out duplicates.
   stop_names = strip_attributes(stops_json, "/attributes/name")
 
-  #======== (b) Determine which route has the most stops. Unfortunately, when multiple route IDs
-  # are used to filter, the route relationship disappears from the returned items... query one route
-  # at a time as a workaround.
-  stops_each_route = {}
-  for long_name in routes_by_name:
-    route_id = resolve_pointer(routes_by_name[long_name], "/id")
-    success, stops_this_route_json = get_stops([route_id], sort_by="name", descending=False)
+  #======== (b) Determine which route has the most stops. When multiple route IDs are used to filter
+  # stops, the route relationship disappears from the returned items... but route patterns keep it, so
+  # the stops along every route come from one request for their patterns (see get_route_stops_bulk).
+  get_id = compile_pointer("/id")
+  route_id_each_name = {long_name: get_id(routes_by_name[long_name]) for long_name in routes_by_name}
+  success, route_stops = get_route_stops_bulk(list(route_id_each_name.values()))
 
-    if not success:
-      print("Error during API request:\n", stops_this_route_json)
+  if not success:
+    print("Error during API request:\n", route_stops)
+    route_stops = {}
 
-    stops_each_route[long_name] = strip_attributes(stops_this_route_json, "/attributes/name")
+  stops_each_route = {}
+  for long_name, route_id in route_id_each_name.items():
+    stops_each_route[long_name] = [name for name, _, _ in route_stops.get(route_id, [])]
 
   minmax_stops_route_names, minmax_stops_num = dict_argmin_argmax(stops_each_route, fn=len)
 
@@ -126,5 +134,15 @@ def problem2_demo():
 
 
 if __name__ == "__main__":
-  problem1_demo()
-  problem2_demo()
+  parser = argparse.ArgumentParser(description="Answer Problems 1 and 2 with the MBTA API")
+  parser.add_argument("--profile", default=None, choices=["json", "prometheus"],
+                      help="Collect timers and counters (API latency, bytes fetched, cache hits) and write them in this format")
+  parser.add_argument("--profile-out", default=None, type=str, help="File to write the --profile to (default: stderr)")
+  args = parser.parse_args()
+  profiler = profiling.enable() if args.profile is not None else None
+  try:
+    problem1_demo()
+    problem2_demo()
+  finally:
+    if profiler is not None:
+      profiling.write_profile(profiler, args.profile, args.profile_out)
@@ -1,20 +1,121 @@
-import argparse
+import argparse, sys, time
+from functools import lru_cache
 
-from utils.routing import find_coarse_route, preprocess_nominal, preprocess_covid
-from utils.utils import print_coarse_route
+from utils import profiling
+from utils.routing import TransitGraph, find_coarse_route, load_snapshot, nearest_stop_name, network_name
+from utils.spatial import StopIndex, parse_coordinates
+from utils.utils import print_coarse_route, print_itineraries, print_journey
+
+# NOTE: Modules that only some options need are imported where they're used, so that a query on a cached
+# network starts quickly (see benchmarks/bench_startup.py).
+
+
+def load_network(args):
+  """
+  Opens the cached network snapshot if possible. If unavailable, will query the MBTA API for a list of stops.
+  """
+  return load_snapshot(network_name(args.all_routes, args.covid), allow_cache=True, verbose=False, gtfs_path=args.gtfs)
+
+
+def batch_main(args):
+  """
+  Routes every pair in the --batch file and writes JSONL results to stdout. Throughput is reported
+  on stderr so that stdout only contains results.
+  """
+  from utils.batch import read_queries, route_batch
+
+  t0 = time.perf_counter()
+  # Workers open the snapshot file themselves, so that they share its pages instead of each getting a copy.
+  snapshot = load_network(args)
+  num_routed = route_batch(read_queries(args.batch), snapshot.path, sys.stdout,
+                           workers=args.workers, precompute_all_pairs=args.precompute_all_pairs,
+                           network_name=network_name(args.all_routes, args.covid))
+  sys.stdout.flush()
+  elapsed = time.perf_counter() - t0
+  print("Routed {} pairs in {:.3f} sec ({:.0f} pairs/sec, {} worker(s))".format(
+      num_routed, elapsed, num_routed / elapsed, args.workers), file=sys.stderr)
+
+
+def resolve_stop(query, graph, get_stop_index, get_resolver):
+  """
+  Turns user input into a stop name:
+    - A "latitude,longitude" string is replaced by the nearest open stop.
+    - A name that isn't an open stop is replaced by the closest matching name, if there's a clear winner.
+      Otherwise, the best matches are printed as suggestions, and query is returned unchanged.
+
+  get_stop_index (function) : Returns the StopIndex to search, so that it's only built when it's needed.
+  get_resolver (function) : Returns the StopNameResolver to search, also only built when it's needed.
+  """
+  coordinates = parse_coordinates(query)
+  if coordinates is not None:
+    stop_index = get_stop_index()
+    if len(stop_index) == 0:
+      print("No stop coordinates are available, run preprocessing with the MBTA API to look up", query)
+      return query
+
+    stop_name = nearest_stop_name(stop_index, coordinates, graph)
+    print("Using the nearest stop to {}: {}".format(query, stop_name))
+    return stop_name
+
+  if query in graph:
+    return query
+
+  candidates = get_resolver().resolve(query, k=3)
+  if len(candidates) > 0 and candidates[0][1] >= 0.5 and (len(candidates) == 1 or candidates[0][1] - candidates[1][1] >= 0.2):
+    print("Using the closest match to {}: {}".format(query, candidates[0][0]))
+    return candidates[0][0]
+  if len(candidates) > 0:
+    print("Did you mean: {}?".format(", ".join(name for name, _ in candidates)))
+  return query
 
 
 def main(args):
+  if args.batch is not None:
+    return batch_main(args)
+
   print("\n======================= MBTA Routing ========================")
   if not args.interactive and (args.A is None or args.B is None):
     raise ValueError("If not in interactive mode, you must provide --A and --B")
 
-  # Get cached stop data if possible. If unavailable, will query the MBTA API
-  # for a list of stops.
-  if args.covid:
-    routes_containing_stop = preprocess_covid(allow_cache=True, verbose=False)
+  # Build the route graph once, and reuse it for every query.
+  snapshot = load_network(args)
+  graph = TransitGraph.from_snapshot(snapshot)
+  get_stop_index = lru_cache(maxsize=None)(lambda: StopIndex.from_snapshot(snapshot))
+
+  # The name index isn't saved with the snapshot: it's built in each process, the first time a name doesn't
+  # match an open stop exactly (~50 ms for the full network, about as long as unpickling it would take).
+  @lru_cache(maxsize=None)
+  def get_resolver():
+    from utils.stop_names import StopNameResolver
+    return StopNameResolver(name for name in graph.stop_names if name in graph)
+
+  # Ranking routes by travel time as well as transfers needs the stop graph (see utils/pareto.py).
+  stop_graph = None
+  if args.pareto or args.alternatives > 0:
+    from utils.pareto import k_best_routes, pareto_routes
+    from utils.stop_graph import StopGraph
+    try:
+      stop_graph = StopGraph.from_snapshot(snapshot)
+    except ValueError:
+      print("NOTE: The snapshot doesn't have stop coordinates, so only the route with the fewest transfers is shown")
+
+  # With a departure time, answer from the GTFS schedule (see utils/raptor.py).
+  timetable = None
+  if args.depart is not None:
+    if args.gtfs is None:
+      raise ValueError("--depart needs a GTFS feed to get schedules from (--gtfs)")
+    from utils.gtfs import RAPID_TRANSIT_ROUTE_TYPES, parse_gtfs_time
+    from utils.raptor import earliest_arrival, load_timetable
+    timetable = load_timetable(args.gtfs, date=args.date or time.strftime("%Y%m%d"),
+                               route_types=None if args.all_routes else RAPID_TRANSIT_ROUTE_TYPES, verbose=False)
+
+  # Optionally answer every query from a precomputed all-pairs table instead of searching.
+  if args.precompute_all_pairs:
+    from utils.transfer_table import preprocess_transfer_table
+    table = preprocess_transfer_table(graph, network_name(args.all_routes, args.covid), allow_cache=True, verbose=False)
+    route_fn = table.lookup
   else:
-    routes_containing_stop = preprocess_nominal(allow_cache=True, verbose=False)
+    route_fn = lambda stop_A, stop_B: find_coarse_route(stop_A, stop_B, graph)
 
   try:
     while True:
@@ -22,21 +123,48 @@ def main(args):
         print("\n==> Enter stop names for A and B. Press CTRL+C to exit.")
         print("==> For example, try 'Wonderland' and 'Boston College'")
 
-      stop_A = args.A if args.A is not None else input("Stop A: ")
-      stop_B = args.B if args.B is not None else input("Stop B: ")
+      stop_A = resolve_stop(args.A if args.A is not None else input("Stop A: "), graph, get_stop_index, get_resolver)
+      stop_B = resolve_stop(args.B if args.B is not None else input("Stop B: "), graph, get_stop_index, get_resolver)
 
-      if stop_A not in routes_containing_stop:
+      if stop_A not in graph:
         print("Invalid choice for Stop A:", stop_A)
         if args.covid:
           print("This stop might be shut down by COVID")
+        if not args.interactive:
+          return
         continue
-      if stop_B not in routes_containing_stop:
+      if stop_B not in graph:
         print("Invalid choice for Stop B:", stop_B)
         if args.covid:
           print("This stop might be shut down by COVID")
+        if not args.interactive:
+          return
         continue
 
-      is_feasible, S = find_coarse_route(stop_A, stop_B, routes_containing_stop)
+      if timetable is not None:
+        journey = earliest_arrival(timetable, stop_A, stop_B, parse_gtfs_time(args.depart + ":00"))
+        if journey is not None:
+          print_journey(journey, stop_A, stop_B)
+        else:
+          print("Couldn't find a trip from {} to {} leaving after {}".format(stop_A, stop_B, args.depart))
+        if not args.interactive:
+          return
+        continue
+
+      if stop_graph is not None:
+        if args.pareto:
+          itineraries = pareto_routes(stop_graph, stop_A, stop_B)
+        else:
+          itineraries = [itinerary for _, itinerary in k_best_routes(stop_graph, stop_A, stop_B, k=args.alternatives)]
+        if len(itineraries) > 0:
+          print_itineraries(itineraries, stop_A, stop_B)
+        else:
+          print("Couldn't find a feasible route between {} and {}".format(stop_A, stop_B))
+        if not args.interactive:
+          return
+        continue
+
+      is_feasible, S = route_fn(stop_A, stop_B)
 
       if is_feasible:
         print_coarse_route(S, stop_A, stop_B)
@@ -56,9 +184,33 @@ def main(args):
 if __name__ == "__main__":
   parser = argparse.ArgumentParser(description="Find a route from A to B using the MBTA")
   parser.add_argument("--covid", action="store_true", help="Close any stations with a word beginning with C, O, V, I, or D")
+  parser.add_argument("--all-routes", action="store_true",
+                      help="Use every route type (bus, commuter rail, ferry), not just rapid transit. Ignores --covid")
+  parser.add_argument("--gtfs", default=None, type=str,
+                      help="Build the network from this GTFS zip instead of the MBTA API (if it isn't cached yet)")
+  parser.add_argument("--depart", default=None, type=str,
+                      help="Departure time (HH:MM) to find the earliest arrival from the --gtfs schedule. Ignores --covid")
+  parser.add_argument("--date", default=None, type=str, help="Service day (YYYYMMDD) for --depart, defaults to today")
   parser.add_argument("--interactive", action="store_true",
                       help="If true, accept user input from command line. False means only do a single query and exit.")
-  parser.add_argument("--A", default=None, type=str, help="Initial stop name")
-  parser.add_argument("--B", default=None, type=str, help="Destination stop name")
+  parser.add_argument("--precompute-all-pairs", action="store_true",
+                      help="Answer queries from a precomputed table of routes between every pair of stops")
+  parser.add_argument("--batch", default=None, type=str,
+                      help="Route every pair in a CSV (with A,B columns) or JSONL file, or JSONL on stdin if '-'")
+  parser.add_argument("--workers", default=1, type=int, help="Number of worker processes to use with --batch")
+  parser.add_argument("--alternatives", default=0, type=int,
+                      help="Show this many alternative itineraries, ranked by distance plus a penalty per transfer")
+  parser.add_argument("--pareto", action="store_true",
+                      help="Show every itinerary where fewer transfers means a longer trip (the Pareto frontier)")
+  parser.add_argument("--A", default=None, type=str, help="Initial stop name (typos are OK), or 'latitude,longitude' to use the nearest stop")
+  parser.add_argument("--B", default=None, type=str, help="Destination stop name (typos are OK), or 'latitude,longitude' to use the nearest stop")
+  parser.add_argument("--profile", default=None, choices=["json", "prometheus"],
+                      help="Collect timers and counters (API requests, caches, graph build, queries) and write them in this format")
+  parser.add_argument("--profile-out", default=None, type=str, help="File to write the --profile to (default: stderr)")
   args = parser.parse_args()
-  main(args)
+  profiler = profiling.enable() if args.profile is not None else None
+  try:
+    main(args)
+  finally:
+    if profiler is not None:
+      profiling.write_profile(profiler, args.profile, args.profile_out)
@@ -0,0 +1,38 @@
+import argparse, asyncio
+
+from utils.routing import load_snapshot, network_name
+from utils.server import RoutingServer, RoutingService
+
+
+def main(args):
+  # Make sure the snapshot exists (preprocessing if needed), then serve it and watch it for changes.
+  snapshot = load_snapshot(network_name(args.all_routes, args.covid), allow_cache=True, verbose=True)
+  snapshot_path = snapshot.path
+  snapshot.close()
+
+  server = RoutingServer(RoutingService(snapshot_path), host=args.host, port=args.port,
+                         reload_interval=args.reload_interval)
+
+  async def run():
+    await server.start()
+    print("Serving routes for {} on http://{}:{}".format(snapshot_path, args.host, server.port))
+    print("Try: curl 'http://{}:{}/route?from=Wonderland&to=Boston%20College'".format(args.host, server.port))
+    await server.serve_forever()
+
+  try:
+    asyncio.run(run())
+  except KeyboardInterrupt:
+    print("Exiting")
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Serve routes between MBTA stops over HTTP")
+  parser.add_argument("--covid", action="store_true", help="Close any stations with a word beginning with C, O, V, I, or D")
+  parser.add_argument("--all-routes", action="store_true",
+                      help="Use every route type (bus, commuter rail, ferry), not just rapid transit. Ignores --covid")
+  parser.add_argument("--host", default="127.0.0.1", type=str, help="Address to listen on")
+  parser.add_argument("--port", default=8080, type=int, help="Port to listen on (0 picks a free port)")
+  parser.add_argument("--reload-interval", default=1.0, type=float,
+                      help="Seconds between checks for a new snapshot in output/ (0 disables reloading)")
+  args = parser.parse_args()
+  main(args)
@@ -0,0 +1,69 @@
+import csv, io, zipfile
+
+from utils.gtfs import format_gtfs_time
+
+
+def write_gtfs(path, routes, stops, trips):
+  """
+  Writes a GTFS static feed zip, with one service that runs every day.
+
+  routes (list of tuple) : (route ID, short name, long name, route type) for each route.
+  stops (list of tuple) : (stop ID, name, latitude, longitude, parent station ID or "") for each stop.
+  trips (iterable of tuple) : (route ID, trip ID, direction ID, [(stop ID, seconds after midnight)]) for
+                              each trip. This can be a generator, since stop_times.txt is written as it goes.
+  """
+  with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+    def write(member, header, rows):
+      with archive.open(member, "w") as raw:
+        f = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+        f.flush()
+        f.detach()
+
+    write("agency.txt", ["agency_id", "agency_name", "agency_url", "agency_timezone"],
+          [["1", "MBTA", "https://www.mbta.com", "America/New_York"]])
+    write("calendar.txt", ["service_id", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday",
+                           "sunday", "start_date", "end_date"], [["daily"] + ["1"] * 7 + ["20200101", "20301231"]])
+    write("routes.txt", ["route_id", "agency_id", "route_short_name", "route_long_name", "route_type"],
+          [[route_id, "1", short_name, long_name, route_type] for route_id, short_name, long_name, route_type in routes])
+    location_types = {parent for _, _, _, _, parent in stops if parent}
+    write("stops.txt", ["stop_id", "stop_name", "stop_lat", "stop_lon", "location_type", "parent_station"],
+          [[stop_id, name, lat, lon, 1 if stop_id in location_types else 0, parent]
+           for stop_id, name, lat, lon, parent in stops])
+
+    # Trips and stop times are written together, so that trips can be a generator.
+    trip_rows = []
+    def stop_time_rows():
+      for route_id, trip_id, direction_id, stop_times in trips:
+        trip_rows.append([route_id, "daily", trip_id, direction_id])
+        for sequence, (stop_id, seconds) in enumerate(stop_times):
+          yield [trip_id, format_gtfs_time(seconds), format_gtfs_time(seconds), stop_id, sequence + 1]
+    write("stop_times.txt", ["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"], stop_time_rows())
+    write("trips.txt", ["route_id", "service_id", "trip_id", "direction_id"], trip_rows)
+
+
+def write_fixture_gtfs(path):
+  """
+  Writes the fixture network from stub_api.py as a GTFS feed, so that it can be compared with what the API
+  returns. Each station has a platform for each direction, and each route has two trips in direction 0 and
+  one in direction 1.
+  """
+  from test.stub_api import FIXTURE_STOPS, FIXTURE_ROUTES, FIXTURE_BUS_STOPS, FIXTURE_BUS_ROUTES
+
+  routes = [(route_id, "", long_name, 1) for route_id, long_name, _ in FIXTURE_ROUTES]
+  routes += [(route_id, route_id, long_name, 3) for route_id, long_name, _ in FIXTURE_BUS_ROUTES]
+  stops, trips = [], []
+  for route_id, route_stops in sorted(dict(FIXTURE_STOPS, **FIXTURE_BUS_STOPS).items()):
+    for name, lat, lon in route_stops:
+      station = "place-" + name.lower().replace(" ", "")
+      if station not in {stop[0] for stop in stops}:
+        stops.append((station, name, lat, lon, ""))
+        stops += [("{}-{}".format(station, direction), name, lat, lon, station) for direction in [0, 1]]
+    platforms = ["place-{}-0".format(name.lower().replace(" ", "")) for name, _, _ in route_stops]
+    for start in [6 * 3600, 7 * 3600]:
+      trips.append((route_id, "{}-{}".format(route_id, start), "0", [(stop, start + 120 * i) for i, stop in enumerate(platforms)]))
+    platforms = [stop[:-1] + "1" for stop in reversed(platforms)]
+    trips.append((route_id, "{}-back".format(route_id), "1", [(stop, 8 * 3600 + 120 * i) for i, stop in enumerate(platforms)]))
+  write_gtfs(path, routes, stops, trips)
@@ -0,0 +1,325 @@
+import gzip, json, queue, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+
+# A small, made-up slice of the MBTA network: route ID => ordered (stop name, latitude, longitude).
+FIXTURE_STOPS = {
+  "Blue": [("Wonderland", 42.4134, -70.9916), ("Airport", 42.3743, -71.0304),
+           ("State", 42.3589, -71.0576), ("Government Center", 42.3597, -71.0592)],
+  "Orange": [("Oak Grove", 42.4367, -71.0711), ("North Station", 42.3656, -71.0613),
+             ("State", 42.3589, -71.0576), ("Downtown Crossing", 42.3555, -71.0605),
+             ("Forest Hills", 42.3005, -71.1137)],
+  "Red": [("Alewife", 42.3954, -71.1425), ("Kendall/MIT", 42.3625, -71.0862),
+          ("Park Street", 42.3564, -71.0624), ("Downtown Crossing", 42.3555, -71.0605),
+          ("Braintree", 42.2078, -71.0011)],
+}
+
+FIXTURE_ROUTES = [
+  ("Blue", "Blue Line", ["Wonderland", "Government Center"]),
+  ("Orange", "Orange Line", ["Forest Hills", "Oak Grove"]),
+  ("Red", "Red Line", ["Ashmont/Braintree", "Alewife"]),
+]
+
+# Bus routes, which are only returned when the route type filter allows buses (type 3).
+FIXTURE_BUS_STOPS = {
+  "1": [("Harvard", 42.3734, -71.1189), ("Massachusetts Avenue", 42.3471, -71.0870),
+        ("Nubian", 42.3294, -71.0840)],
+  "111": [("Woodlawn", 42.4172, -71.0317), ("Haymarket", 42.3630, -71.0583)],
+}
+
+FIXTURE_BUS_ROUTES = [
+  ("1", "Harvard Square - Nubian Station", ["Harvard Square", "Nubian Station"]),
+  ("111", "Woodlawn or Broadway - Haymarket Station", ["Woodlawn", "Haymarket Station"]),
+]
+
+
+def stop_object(name, latitude, longitude):
+  return {"type": "stop", "id": "place-" + name.lower().replace(" ", ""),
+          "attributes": {"name": name, "latitude": latitude, "longitude": longitude}}
+
+
+def route_object(route_id, long_name, direction_destinations, route_type):
+  short_name = route_id if route_type == 3 else ""
+  return {"type": "route", "id": route_id, "attributes": {
+    "long_name": long_name, "short_name": short_name, "type": route_type, "direction_destinations": direction_destinations}}
+
+
+def alert_object(alert_id, effect, stop_ids, route_id=None, active_period=None):
+  """
+  An alert resource like the real API's, which informs riders about stop_ids (on route_id, if given).
+
+  active_period (list or None) : (start, end) pairs of ISO 8601 times (end can be None). If None, the alert
+                                 is always active.
+  """
+  return {"type": "alert", "id": alert_id, "attributes": {
+    "effect": effect, "header": "{} ({})".format(effect.replace("_", " ").title(), alert_id),
+    "active_period": [{"start": start, "end": end} for start, end in active_period or []],
+    "informed_entity": [{"stop": stop_id, "route": route_id, "activities": ["BOARD", "EXIT", "RIDE"]}
+                        for stop_id in stop_ids]}}
+
+
+def sse_event(event, data):
+  return "event: {}\ndata: {}\n\n".format(event, json.dumps(data)).encode("utf-8")
+
+
+def paginate(response, path, params):
+  """
+  Applies page[limit] and page[offset] to a response, and adds a "next" link if there are more pages.
+  """
+  if "page[limit]" not in params:
+    return response
+  limit, offset = int(params["page[limit]"]), int(params.get("page[offset]", 0))
+  data = response["data"]
+  response = dict(response, data=data[offset:offset + limit], links={})
+  if offset + limit < len(data):
+    next_params = dict(params, **{"page[offset]": str(offset + limit)})
+    response["links"]["next"] = path + "?" + "&".join("{}={}".format(k, v) for k, v in sorted(next_params.items()))
+  return response
+
+
+def sparse_fieldsets(response, params):
+  """
+  Applies fields[type] parameters (i.e fields[stop]=name,latitude) to the resource objects in a response,
+  leaving out every other attribute and relationship.
+  """
+  def sparse(obj):
+    fields = params.get("fields[{}]".format(obj["type"]))
+    if fields is None:
+      return obj
+    keep = set(fields.split(",")) if len(fields) > 0 else set()
+    obj = dict(obj, attributes={k: v for k, v in obj.get("attributes", {}).items() if k in keep})
+    if "relationships" in obj:
+      obj["relationships"] = {k: v for k, v in obj["relationships"].items() if k in keep}
+    return obj
+
+  response = dict(response, data=[sparse(obj) for obj in response["data"]])
+  if "included" in response:
+    response["included"] = [sparse(obj) for obj in response["included"]]
+  return response
+
+
+def route_patterns_response(patterns, params):
+  """
+  Builds a /route_patterns response. With include=representative_trip.stops, each pattern's trip (with its
+  stops relationship, in order) and every stop it visits are put in the "included" section, like the real
+  API does.
+
+  patterns (list of tuple) : (route ID, direction ID, list of stop objects in order) for each pattern.
+  """
+  data, included, included_stops = [], [], set()
+  for i, (route_id, direction_id, stops) in enumerate(patterns):
+    pattern_id = "{}-{}-{}".format(route_id, direction_id, i)
+    trip_id = "trip-" + pattern_id
+    data.append({"type": "route_pattern", "id": pattern_id, "attributes": {"direction_id": direction_id, "typicality": 1},
+                 "relationships": {"route": {"data": {"type": "route", "id": route_id}},
+                                   "representative_trip": {"data": {"type": "trip", "id": trip_id}}}})
+    if params.get("include") == "representative_trip.stops":
+      included.append({"type": "trip", "id": trip_id, "attributes": {"direction_id": direction_id},
+                       "relationships": {"stops": {"data": [{"type": "stop", "id": stop["id"]} for stop in stops]}}})
+      for stop in stops:
+        if stop["id"] not in included_stops:
+          included_stops.add(stop["id"])
+          included.append(stop)
+  return {"data": data, "included": included}
+
+
+def fixture_response(path, params):
+  """
+  Builds a JSON:API style response for the fixture network, like the real API would.
+  """
+  if path == "/routes":
+    route_types = [int(t) for t in params["filter[type]"].split(",")] if "filter[type]" in params else [0, 1, 2, 3, 4]
+    data = [route_object(route_id, long_name, dests, 1) for route_id, long_name, dests in FIXTURE_ROUTES if 1 in route_types]
+    data += [route_object(route_id, long_name, dests, 3) for route_id, long_name, dests in FIXTURE_BUS_ROUTES if 3 in route_types]
+    return paginate({"data": data}, path, params)
+
+  if path == "/stops":
+    all_stops = dict(FIXTURE_STOPS, **FIXTURE_BUS_STOPS)
+    route_ids = params["filter[route]"].split(",") if "filter[route]" in params else list(all_stops)
+    data, seen = [], set()
+    for route_id in route_ids:
+      for name, latitude, longitude in all_stops.get(route_id, []):
+        if name not in seen:
+          seen.add(name)
+          data.append(stop_object(name, latitude, longitude))
+    if params.get("sort") in ("name", "-name"):
+      data.sort(key=lambda obj: obj["attributes"]["name"], reverse=params["sort"].startswith("-"))
+    return paginate({"data": data}, path, params)
+
+  if path == "/route_patterns":
+    all_stops = dict(FIXTURE_STOPS, **FIXTURE_BUS_STOPS)
+    patterns = []
+    for route_id in params["filter[route]"].split(","):
+      stops = [stop_object(*stop) for stop in all_stops.get(route_id, [])]
+      patterns += [(route_id, 0, stops), (route_id, 1, stops[::-1])]
+      if route_id == "Orange":
+        patterns.append((route_id, 0, stops[:3])) # A short turn, which doesn't add any stops.
+    return route_patterns_response(patterns, params)
+
+  return None
+
+
+class StubApiServer(object):
+  """
+  Local HTTP server that stands in for api-v3.mbta.com in tests.
+
+  handler (function) : Called as handler(path, params, headers) for every GET, and returns
+                       (status code, dict of response headers, body bytes). Defaults to serving the
+                       fixture network as JSON.
+
+  Like the real API, bodies are gzipped if the request accepts it.
+
+  Every request is recorded in self.requests as (path, params, headers).
+  """
+  def __init__(self, handler=None):
+    self.handler = handler if handler is not None else self.fixture_handler
+    self.requests = []
+    self.lock = threading.Lock()
+    stub = self
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = "HTTP/1.1"
+      disable_nagle_algorithm = True # Otherwise the body waits for the client to ACK the headers.
+
+      def do_GET(self):
+        parts = urlsplit(self.path)
+        params = {k: v[0] for k, v in parse_qs(parts.query, keep_blank_values=True).items()}
+        headers = dict(self.headers.items())
+        with stub.lock:
+          stub.requests.append((parts.path, params, headers))
+        status, response_headers, body = stub.handler(parts.path, params, headers)
+        if len(body) > 0 and "gzip" in headers.get("Accept-Encoding", ""):
+          body = gzip.compress(body, compresslevel=6)
+          response_headers = dict(response_headers, **{"Content-Encoding": "gzip"})
+        self.send_response(status)
+        for key, value in response_headers.items():
+          self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+      def log_message(self, *args):
+        pass
+
+    self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    self.server.daemon_threads = True
+    self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+    self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+    self.thread.start()
+
+  @staticmethod
+  def fixture_handler(path, params, headers):
+    response = fixture_response(path, params)
+    if response is None:
+      return 404, {"Content-Type": "application/json"}, b'{"errors": []}'
+    return 200, {"Content-Type": "application/json"}, json.dumps(sparse_fieldsets(response, params)).encode("utf-8")
+
+  def close(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+
+class AlertStreamServer(object):
+  """
+  Local server that stands in for the streaming alerts endpoint of the API (GET /alerts with
+  Accept: text/event-stream), and replays events pushed to it.
+
+  Every connection gets a "reset" event with the current alerts, then every event passed to push(). Like
+  the real API, events are sent with chunked transfer encoding, one chunk per event.
+
+  alerts (iterable) : Alert resources that are active when the server starts.
+  """
+  def __init__(self, alerts=()):
+    self.alerts = {alert["id"]: alert for alert in alerts}
+    self.streams = []
+    self.num_connections = 0
+    self.lock = threading.Lock()
+    stub = self
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = "HTTP/1.1"
+      disable_nagle_algorithm = True
+
+      def do_GET(self):
+        if urlsplit(self.path).path != "/alerts":
+          self.send_response(404)
+          self.send_header("Content-Length", "0")
+          self.end_headers()
+          return
+
+        events = queue.Queue()
+        with stub.lock:
+          events.put(("reset", list(stub.alerts.values())))
+          stub.streams.append(events)
+          stub.num_connections += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.close_connection = True
+        try:
+          while True:
+            event = events.get()
+            if event is None:
+              break
+            chunk = sse_event(*event)
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+          self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+          pass
+        finally:
+          with stub.lock:
+            if events in stub.streams:
+              stub.streams.remove(events)
+
+      def log_message(self, *args):
+        pass
+
+    self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    self.server.daemon_threads = True
+    self.url = "http://127.0.0.1:{}".format(self.server.server_address[1])
+    self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+    self.thread.start()
+
+  def push(self, event, data):
+    """
+    Applies an "add", "update" or "remove" event to the current alerts, and sends it to every open stream.
+
+    Returns (float) : time.perf_counter() when the event was handed to the streams.
+    """
+    with self.lock:
+      if event == "remove":
+        self.alerts.pop(data["id"], None)
+      else:
+        self.alerts[data["id"]] = data
+      t0 = time.perf_counter()
+      for events in self.streams:
+        events.put((event, data))
+    return t0
+
+  def wait_for_streams(self, count=1, timeout=5.0):
+    """
+    Waits until at least count clients are connected. Returns whether they are.
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+      with self.lock:
+        if len(self.streams) >= count:
+          return True
+      time.sleep(0.005)
+    return False
+
+  def disconnect(self):
+    """
+    Ends every open stream (clients are expected to reconnect).
+    """
+    with self.lock:
+      for events in self.streams:
+        events.put(None)
+      self.streams = []
+
+  def close(self):
+    self.disconnect()
+    self.server.shutdown()
+    self.server.server_close()
@@ -0,0 +1,185 @@
+import json, threading, time, unittest
+
+from utils.alerts import AlertConsumer, alert_closures, iter_sse_events
+from utils.closures import ClosableNetwork
+from utils.routing import find_coarse_route
+from test.stub_api import AlertStreamServer, alert_object
+from test.test_closures import _BRANCH_LINKS, _ORDERED_STOP_NAMES
+
+
+_STOP_NAMES = {"place-pktrm": "Park Street", "place-dwnxg": "Downtown Crossing", "place-jfk": "JFK/UMass",
+               "place-state": "State", "place-gover": "Government Center", "place-knncl": "Kendall/MIT"}
+_ROUTE_NAMES = {"Red": "Red Line", "Blue": "Blue Line", "Orange": "Orange Line", "Green": "Green Line"}
+
+
+def wait_for(condition, timeout=5.0):
+  deadline = time.time() + timeout
+  while time.time() < deadline:
+    if condition():
+      return True
+    time.sleep(0.001)
+  return False
+
+
+class SseTest(unittest.TestCase):
+  def test_iter_sse_events(self):
+    lines = [b": keep-alive", b"", b"event: reset", b"data: []", b"", "event: add\r", "data: {\"id\":", "data: 1}",
+             "id: 7", "", "data: no event type", ""]
+    self.assertEqual(list(iter_sse_events(lines)),
+                     [("reset", "[]"), ("add", '{"id":\n1}'), ("message", "no event type")])
+
+  def test_unterminated_event_is_dropped(self):
+    self.assertEqual(list(iter_sse_events(["event: add", "data: {}"])), [])
+
+
+class AlertClosuresTest(unittest.TestCase):
+  def setUp(self):
+    self.network = ClosableNetwork(_ORDERED_STOP_NAMES, branch_links=_BRANCH_LINKS)
+
+  def closures(self, alerts, now=None):
+    return alert_closures(alerts, self.network, _STOP_NAMES, _ROUTE_NAMES, now=now)
+
+  def test_effects(self):
+    alerts = [
+      alert_object("1", "STATION_CLOSURE", ["place-state"]),
+      alert_object("2", "SUSPENSION", ["place-state", "place-gover"], route_id="Blue"),
+      # Listed out of order: the shuttle follows the order of the stops along the route.
+      alert_object("3", "SHUTTLE", ["place-jfk", "place-pktrm", "place-dwnxg"], route_id="Red"),
+      alert_object("4", "DELAY", ["place-knncl"], route_id="Red"),
+    ]
+    closed, suspended, shuttles = self.closures(alerts)
+    self.assertEqual(closed, {"State"})
+    self.assertEqual(suspended, {("Blue Line", "State"), ("Blue Line", "Government Center"),
+                                 ("Red Line", "Downtown Crossing")})
+    self.assertEqual(shuttles, {"Red Line Shuttle": ["Park Street", "Downtown Crossing", "JFK/UMass"]})
+
+  def test_two_shuttles_on_one_route(self):
+    alerts = [alert_object("1", "SHUTTLE", ["place-knncl", "place-pktrm"], route_id="Red"),
+              alert_object("2", "SHUTTLE", ["place-dwnxg", "place-jfk"], route_id="Red")]
+    _, suspended, shuttles = self.closures(alerts)
+    self.assertEqual(suspended, set())
+    self.assertEqual(shuttles, {"Red Line Shuttle": ["Kendall/MIT", "Park Street"],
+                                "Red Line Shuttle 2": ["Downtown Crossing", "JFK/UMass"]})
+
+  def test_active_period(self):
+    alert = alert_object("1", "STATION_CLOSURE", ["place-state"],
+                         active_period=[("2020-03-01T04:30:00-05:00", "2020-03-02T02:30:00-05:00"),
+                                        ("2020-03-08T04:30:00-04:00", None)])
+    for now, is_closed in [("2020-02-29T12:00:00-05:00", False), ("2020-03-01T12:00:00-05:00", True),
+                           ("2020-03-05T12:00:00-05:00", False), ("2021-01-01T12:00:00-05:00", True)]:
+      closed, _, _ = self.closures([alert], now=_timestamp(now))
+      self.assertEqual(closed == {"State"}, is_closed, now)
+
+
+def _timestamp(value):
+  from datetime import datetime
+  return datetime.fromisoformat(value).timestamp()
+
+
+class AlertConsumerTest(unittest.TestCase):
+  def setUp(self):
+    self.network = ClosableNetwork(_ORDERED_STOP_NAMES, branch_links=_BRANCH_LINKS)
+    self.updates = []
+    self.consumer = AlertConsumer(self.network, _STOP_NAMES, _ROUTE_NAMES, on_update=self.updates.append)
+
+  def test_handle(self):
+    closure = alert_object("1", "STATION_CLOSURE", ["place-pktrm"])
+    self.consumer.handle("reset", [closure])
+    self.assertNotIn("Park Street", self.network.graph)
+    self.assertEqual(self.network.graph.routes_at("Kendall/MIT"), {"Red Line-0"})
+
+    shuttle = alert_object("2", "SHUTTLE", ["place-knncl", "place-pktrm", "place-dwnxg"], route_id="Red")
+    self.consumer.handle("add", shuttle)
+    # The shuttle can't stop at Park Street either, so it's split in two like any other route.
+    self.assertEqual(self.network.graph.routes_at("Kendall/MIT"), {"Red Line-0", "Red Line Shuttle-0"})
+    self.assertEqual(self.network.graph.routes_at("Downtown Crossing"), {"Orange Line", "Red Line-1", "Red Line Shuttle-1"})
+
+    # Reopening Park Street lets the shuttle stop there, while the Red Line still skips it.
+    self.consumer.handle("remove", {"id": "1", "type": "alert"})
+    self.assertEqual(self.network.graph.routes_at("Park Street"), {"Green Line", "Red Line Shuttle"})
+    self.assertTrue(find_coarse_route("Alewife", "Braintree", self.network.graph)[0])
+
+    self.consumer.handle("update", dict(shuttle, attributes=dict(shuttle["attributes"], effect="DELAY")))
+    self.assertEqual(self.network.graph.routes_at("Park Street"), {"Green Line", "Red Line"})
+    self.assertEqual(self.network.extra_routes, {})
+
+    # Events that don't change anything don't swap the graph.
+    graph = self.network.graph
+    self.assertEqual(self.consumer.handle("remove", {"id": "2", "type": "alert"}), set())
+    self.assertIs(self.network.graph, graph)
+    self.assertEqual(self.consumer.num_events, 5)
+    self.assertEqual(self.consumer.num_updates, 4)
+    self.assertEqual(len(self.updates), 4)
+
+  def test_malformed_events_are_skipped(self):
+    closure = alert_object("1", "STATION_CLOSURE", ["place-pktrm"])
+    events = [("add", {"type": "alert"}), ("add", {"id": "2", "attributes": None}),
+              ("update", dict(closure, attributes=dict(closure["attributes"], informed_entity=5))),
+              ("reset", [closure, {"attributes": {}}]), ("add", "not json"), ("add", closure)]
+    lines = []
+    for event, data in events:
+      lines += ["event: " + event, "data: " + (data if isinstance(data, str) else json.dumps(data)), ""]
+    self.consumer.consume(lines)
+    self.assertEqual(self.consumer.num_skipped, 5)
+    self.assertEqual(self.consumer.num_events, 1)
+    self.assertEqual(list(self.consumer.alerts), ["1"])
+    self.assertNotIn("Park Street", self.network.graph)
+
+  def test_stream(self):
+    server = AlertStreamServer([alert_object("1", "STATION_CLOSURE", ["place-state"])])
+    thread = self.consumer.start(server.url, reconnect_delay=0.01)
+    self.assertTrue(wait_for(lambda: "State" not in self.network.graph))
+
+    server.push("add", alert_object("2", "STATION_CLOSURE", ["place-pktrm"]))
+    self.assertTrue(wait_for(lambda: "Park Street" not in self.network.graph))
+    server.push("remove", {"id": "1", "type": "alert"})
+    self.assertTrue(wait_for(lambda: "State" in self.network.graph))
+
+    # After the stream drops, the consumer reconnects and catches up from the reset.
+    server.disconnect()
+    server.alerts = {}
+    self.assertTrue(wait_for(lambda: server.num_connections == 2))
+    self.assertTrue(wait_for(lambda: "Park Street" in self.network.graph))
+
+    self.consumer.stop()
+    server.close()
+    thread.join(timeout=5.0)
+    self.assertFalse(thread.is_alive())
+
+  def test_queries_see_whole_updates(self):
+    # One alert closes both Park Street and State. A query should never see just one of them closed.
+    server = AlertStreamServer()
+    thread = self.consumer.start(server.url, reconnect_delay=0.01)
+    self.assertTrue(server.wait_for_streams())
+
+    torn = []
+    done = threading.Event()
+
+    def query():
+      while not done.is_set():
+        graph = self.network.graph
+        if ("Park Street" in graph) != ("State" in graph):
+          torn.append(graph)
+        find_coarse_route("Alewife", "Wonderland", graph)
+
+    readers = [threading.Thread(target=query) for _ in range(2)]
+    for reader in readers:
+      reader.start()
+    for _ in range(10):
+      server.push("add", alert_object("1", "STATION_CLOSURE", ["place-pktrm", "place-state"]))
+      self.assertTrue(wait_for(lambda: "State" not in self.network.graph))
+      server.push("remove", {"id": "1", "type": "alert"})
+      self.assertTrue(wait_for(lambda: "State" in self.network.graph))
+    done.set()
+    for reader in readers:
+      reader.join()
+
+    self.assertEqual(torn, [])
+    self.assertEqual(self.consumer.num_updates, 20)
+    self.consumer.stop()
+    server.close()
+    thread.join(timeout=5.0)
+
+
+if __name__ == "__main__":
+  unittest.main()
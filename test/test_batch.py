@@ -0,0 +1,69 @@
+import io, json, os, tempfile, unittest
+from unittest import mock
+
+from utils.batch import *
+from utils.routing import preprocess_nominal
+
+
+_ROUTES_CONTAINING_STOP_NOMINAL = preprocess_nominal(allow_cache=True)
+
+_QUERIES = [
+  ("Wonderland", "Boston College"),
+  ("Harvard", "Harvard"),
+  ("Nowhere", "Harvard"),
+  ("Kendall/MIT", "Braintree"),
+]
+
+
+class BatchTest(unittest.TestCase):
+  def route(self, queries, **kwargs):
+    out = io.StringIO()
+    num_routed = route_batch(queries, _ROUTES_CONTAINING_STOP_NOMINAL, out, **kwargs)
+    self.assertEqual(num_routed, len(queries))
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+  def test_results(self):
+    results = self.route(_QUERIES, chunk_size=3)
+    self.assertEqual([(r["A"], r["B"]) for r in results], _QUERIES)
+    self.assertTrue(results[0]["feasible"])
+    self.assertEqual(results[0]["routes"][0]["name"], "Blue Line")
+    self.assertEqual(results[0]["routes"][-1]["name"], "Green Line B")
+    self.assertEqual(results[1]["routes"], [])
+    self.assertFalse(results[2]["feasible"])
+    self.assertIn("error", results[2])
+    self.assertEqual(results[3]["routes"], [{"name": "Red Line", "connect_stop": "Kendall/MIT"}])
+
+  def test_workers_and_table_match(self):
+    queries = _QUERIES * 50
+    expected = self.route(queries)
+    self.assertEqual(self.route(queries, workers=2, chunk_size=16), expected)
+    table_results = self.route(queries, precompute_all_pairs=True)
+    self.assertEqual([len(r.get("routes", [])) for r in table_results], [len(r.get("routes", [])) for r in expected])
+    self.assertEqual(self.route(queries, workers=2, chunk_size=16, precompute_all_pairs=True), table_results)
+
+  def test_workers_load_table(self):
+    from utils import batch
+    from utils.routing import TransitGraph
+    with tempfile.TemporaryDirectory() as folder:
+      path = os.path.join(folder, "transfer_table.pkl")
+      TransferTable.build(TransitGraph(_ROUTES_CONTAINING_STOP_NOMINAL)).save(path)
+      # Workers should load the saved table instead of building their own.
+      with mock.patch.object(TransferTable, "build", side_effect=AssertionError("rebuilt the table")):
+        batch._init_worker(_ROUTES_CONTAINING_STOP_NOMINAL, path)
+    self.assertEqual(batch._WORKER_ROUTE_FN.__self__.__class__, TransferTable)
+
+  def test_read_queries(self):
+    with tempfile.TemporaryDirectory() as folder:
+      path_csv = os.path.join(folder, "queries.csv")
+      with open(path_csv, "w") as f:
+        f.write("A,B\n" + "\n".join("{},{}".format(a, b) for a, b in _QUERIES) + "\n")
+      self.assertEqual(list(read_queries(path_csv)), _QUERIES)
+
+      path_jsonl = os.path.join(folder, "queries.jsonl")
+      with open(path_jsonl, "w") as f:
+        f.write("\n".join(json.dumps({"A": a, "B": b}) for a, b in _QUERIES) + "\n")
+      self.assertEqual(list(read_queries(path_jsonl)), _QUERIES)
+
+
+if __name__ == "__main__":
+  unittest.main()
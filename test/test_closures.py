@@ -0,0 +1,118 @@
+import unittest
+
+from utils.closures import *
+from utils.routing import *
+
+
+# Made-up ordered stop lists, with a branch on the "Red Line" after JFK/UMass.
+_ORDERED_STOP_NAMES = {
+  "Blue Line": ["Wonderland", "Airport", "State", "Government Center", "Bowdoin"],
+  "Orange Line": ["Oak Grove", "North Station", "Haymarket", "State", "Downtown Crossing", "Forest Hills"],
+  "Green Line": ["Lechmere", "North Station", "Haymarket", "Government Center", "Park Street", "Kenmore"],
+  "Red Line": ["Alewife", "Kendall/MIT", "Park Street", "Downtown Crossing", "JFK/UMass", "Savin Hill",
+               "Ashmont", "North Quincy", "Braintree"],
+}
+_BRANCH_LINKS = {"Red Line": [("JFK/UMass", "North Quincy")]}
+
+
+def edges_by_name(graph):
+  edges = set()
+  for route, adjacent in enumerate(graph.adjacent):
+    for other, stop in adjacent:
+      edges.add((graph.route_names[route], graph.route_names[other], graph.stop_names[stop]))
+  return edges
+
+
+class ClosableNetworkTest(unittest.TestCase):
+  def assertMatchesRebuild(self, network):
+    """
+    The incrementally updated graph should be equivalent to one built from scratch.
+    """
+    routes_containing_stop = network.routes_containing_stop()
+    rebuilt = TransitGraph(routes_containing_stop)
+    for stop in network.routes_of_stop:
+      self.assertEqual(stop in network.graph, stop in rebuilt)
+      if stop in rebuilt:
+        self.assertEqual(network.graph.routes_at(stop), rebuilt.routes_at(stop))
+    self.assertEqual(edges_by_name(network.graph), edges_by_name(rebuilt))
+
+  def test_no_closures(self):
+    network = ClosableNetwork(_ORDERED_STOP_NAMES, branch_links=_BRANCH_LINKS)
+    self.assertEqual(network.graph.routes_at("State"), {"Blue Line", "Orange Line"})
+    is_feasible, S = find_coarse_route("Ashmont", "Braintree", network.graph)
+    self.assertTrue(is_feasible)
+    self.assertEqual(len(S), 1)
+
+  def test_close_and_reopen(self):
+    network = ClosableNetwork(_ORDERED_STOP_NAMES, branch_links=_BRANCH_LINKS)
+
+    changed = network.close("Park Street")
+    self.assertIn("Kendall/MIT", changed)
+    self.assertNotIn("Park Street", network.graph)
+    self.assertEqual(network.graph.routes_at("Kendall/MIT"), {"Red Line-0"})
+    self.assertEqual(network.graph.routes_at("Braintree"), {"Red Line-1"})
+    self.assertEqual(network.graph.routes_at("Wonderland"), {"Blue Line"})
+    self.assertMatchesRebuild(network)
+
+    # Kendall/MIT is cut off from the rest of the network, but Braintree can still transfer downtown.
+    is_feasible, _ = find_coarse_route("Kendall/MIT", "Lechmere", network.graph)
+    self.assertFalse(is_feasible)
+    is_feasible, S = find_coarse_route("Braintree", "Lechmere", network.graph)
+    self.assertTrue(is_feasible)
+    self.assertEqual([node.name for node in S], ["Red Line-1", "Orange Line", "Green Line-0"])
+
+    # The branch link keeps Braintree connected to JFK/UMass when Ashmont closes.
+    network.close(["Ashmont"])
+    self.assertEqual(network.graph.routes_at("Braintree"), network.graph.routes_at("JFK/UMass"))
+    self.assertMatchesRebuild(network)
+
+    network.reopen(["Park Street", "Ashmont"])
+    self.assertEqual(network.closed, set())
+    self.assertEqual(network.graph.routes_at("Kendall/MIT"), {"Red Line"})
+    self.assertMatchesRebuild(network)
+
+  def test_close_where(self):
+    network = ClosableNetwork(_ORDERED_STOP_NAMES, branch_links=_BRANCH_LINKS)
+    network.close_where(check_covid_shutdown)
+    self.assertEqual(network.closed, {stop for stop in network.routes_of_stop if check_covid_shutdown(stop)})
+    self.assertMatchesRebuild(network)
+
+    # Changing the predicate only touches the stops that changed.
+    network.close_where(lambda stop: stop == "State")
+    self.assertEqual(network.closed, {"State"})
+    self.assertMatchesRebuild(network)
+    self.assertEqual(network.set_closed(["State"]), set())
+
+  def test_set_state_with_shuttle(self):
+    network = ClosableNetwork(_ORDERED_STOP_NAMES, branch_links=_BRANCH_LINKS)
+
+    # Shuttle buses replace the Red Line between Park Street and JFK/UMass.
+    shuttle = {"Red Line Shuttle": ["Park Street", "Downtown Crossing", "JFK/UMass"]}
+    network.set_state([], [("Red Line", "Downtown Crossing")], shuttle)
+    self.assertEqual(network.graph.routes_at("Downtown Crossing"), {"Orange Line", "Red Line Shuttle"})
+    self.assertEqual(network.graph.routes_at("Park Street"), {"Green Line", "Red Line-0", "Red Line Shuttle"})
+    self.assertEqual(network.graph.routes_at("Braintree"), {"Red Line-1"})
+    self.assertMatchesRebuild(network)
+    is_feasible, S = find_coarse_route("Alewife", "Ashmont", network.graph)
+    self.assertTrue(is_feasible)
+    self.assertEqual([node.name for node in S], ["Red Line-0", "Red Line Shuttle", "Red Line-1"])
+
+    # Closures still apply on top of the shuttle, and set_closed keeps it running.
+    network.set_closed(["Park Street"])
+    self.assertNotIn("Park Street", network.graph)
+    self.assertEqual(network.graph.routes_at("Downtown Crossing"), {"Orange Line", "Red Line Shuttle"})
+    self.assertMatchesRebuild(network)
+
+    # Ending the shuttle restores the original route.
+    network.set_state([], [], {})
+    self.assertEqual(network.extra_routes, {})
+    self.assertEqual(network.graph.routes_at("Downtown Crossing"), {"Orange Line", "Red Line"})
+    self.assertMatchesRebuild(network)
+    self.assertEqual(network.set_state([], [], {}), set())
+
+    with self.assertRaises(ValueError):
+      network.set_state([], [], {"Red Line": ["Alewife", "Braintree"]})
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,80 @@
+import os, tempfile, unittest
+
+from utils.gtfs import *
+from utils.mbta_api import MbtaClient
+from utils.routing import preprocess_all_routes, preprocess_covid, preprocess_nominal
+from test.gtfs_fixture import write_fixture_gtfs, write_gtfs
+from test.stub_api import StubApiServer, FIXTURE_STOPS
+
+
+class GtfsTest(unittest.TestCase):
+  def setUp(self):
+    self.folder = tempfile.TemporaryDirectory()
+    self.path = os.path.join(self.folder.name, "gtfs.zip")
+    write_fixture_gtfs(self.path)
+
+  def tearDown(self):
+    self.folder.cleanup()
+
+  def test_read_gtfs(self):
+    ordered_stop_names, coordinates, stats = read_gtfs(self.path, verbose=False)
+    self.assertEqual(ordered_stop_names, {route_id + " Line": [name for name, _, _ in stops]
+                                          for route_id, stops in FIXTURE_STOPS.items()})
+    self.assertEqual(coordinates["State"], (42.3589, -71.0576))
+    self.assertEqual(stats.trips, 9)
+    self.assertEqual(stats.patterns, 6)
+    self.assertEqual(stats.stop_times_rows, 3 * (4 + 5 + 5) + 3 * (3 + 2)) # Every trip is read, even buses.
+
+    ordered_stop_names, _, _ = read_gtfs(self.path, route_types=None, verbose=False)
+    self.assertEqual(ordered_stop_names["Bus 111"], ["Woodlawn", "Haymarket"])
+
+  def test_matches_api(self):
+    """
+    Preprocessing from the GTFS feed and from the API (a stub server with the same network) should agree.
+    """
+    server = StubApiServer()
+    client = MbtaClient(base_url=server.url)
+    from_api = preprocess_all_routes(allow_cache=False, verbose=False, client=client)
+    client.close()
+    server.close()
+    from_gtfs = preprocess_all_routes(allow_cache=False, verbose=False, gtfs_path=self.path)
+    self.assertEqual(from_gtfs, from_api)
+
+  def test_preprocess_nominal(self):
+    routes_containing_stop = preprocess_nominal(allow_cache=False, verbose=False, gtfs_path=self.path)
+    self.assertEqual(routes_containing_stop["Downtown Crossing"], {"Orange Line", "Red Line"})
+    self.assertEqual(routes_containing_stop["Wonderland"], {"Blue Line"})
+    self.assertNotIn("Harvard", routes_containing_stop)
+
+  def test_branches(self):
+    self.assertEqual(merge_stop_patterns([("A", "B", "C", "D"), ("A", "B", "X", "Y"), ("B", "C")]),
+                     ["A", "B", "X", "Y", "C", "D"])
+    self.assertEqual(merge_stop_patterns([("B", "C"), ("A", "B")]), ["A", "B", "C"])
+    self.assertEqual(merge_stop_patterns([]), [])
+
+    # The Ashmont branch goes between JFK/UMass and the Braintree branch, like the API's ordering.
+    names = ["Park Street", "JFK/UMass", "Savin Hill", "Ashmont", "North Quincy", "Braintree"]
+    stops = [(name, name, 42.0 + 0.01 * i, -71.0, "") for i, name in enumerate(names)]
+    trips = [("Red", "braintree", "0", [("Park Street", 0), ("JFK/UMass", 60), ("North Quincy", 120), ("Braintree", 180)]),
+             ("Red", "ashmont", "0", [("Park Street", 0), ("JFK/UMass", 60), ("Savin Hill", 120), ("Ashmont", 180)])]
+    write_gtfs(self.path, [("Red", "", "Red Line", 1)], stops, trips)
+    ordered_stop_names, _, _ = read_gtfs(self.path, verbose=False)
+    self.assertEqual(ordered_stop_names["Red Line"], names)
+
+    routes_containing_stop = preprocess_covid(allow_cache=False, verbose=False, gtfs_path=self.path)
+    self.assertEqual(routes_containing_stop["North Quincy"], {"Red Line-0"})
+
+  def test_ungrouped_stop_times(self):
+    stops = [(name, name, 42.0, -71.0, "") for name in "ABC"]
+    # Trip 2 is written in between the stops of trip 1.
+    def trips():
+      yield ("R", "1", "0", [("A", 0)])
+      yield ("R", "2", "0", [("A", 60), ("B", 120)])
+      yield ("R", "1", "0", [("B", 60)])
+    write_gtfs(self.path, [("R", "", "R Line", 1)], stops, trips())
+    with self.assertRaises(ValueError):
+      read_gtfs(self.path, verbose=False)
+
+
+if __name__ == "__main__":
+  unittest.main()
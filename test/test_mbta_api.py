@@ -1,7 +1,11 @@
-import unittest, json
+import os, threading, unittest, json, tempfile, time
+from unittest import mock
 
+from utils import profiling
 from utils.mbta_api import *
 from utils.utils import *
+from utils.routing import discover_routes, preprocess_all_routes, route_display_name
+from test.stub_api import StubApiServer, FIXTURE_STOPS, FIXTURE_BUS_STOPS
 
 
 class MbtaApiTest(unittest.TestCase):
@@ -54,5 +58,260 @@ class MbtaApiTest(unittest.TestCase):
     self.assertEqual(stop_names_actual, stop_names_expected)
 
 
+class MbtaClientTest(unittest.TestCase):
+  """
+  Tests for the pooled client, run against a local stub server instead of the real API.
+  """
+  def setUp(self):
+    self.server = StubApiServer()
+    self.client = MbtaClient(base_url=self.server.url, backoff=0.01)
+
+  def tearDown(self):
+    self.client.close()
+    self.server.close()
+
+  def test_get_routes_and_stops(self):
+    success, routes_json = get_routes(route_types=[0, 1], client=self.client)
+    self.assertTrue(success)
+    self.assertEqual(strip_attributes(routes_json, "/attributes/long_name"), ["Blue Line", "Orange Line", "Red Line"])
+    self.assertEqual(self.server.requests[0][1]["filter[type]"], "0,1")
+
+    success, stops_json = get_stops(["Blue"], sort_by="name", client=self.client)
+    self.assertTrue(success)
+    self.assertEqual(strip_attributes(stops_json, "/attributes/name"),
+                     ["Airport", "Government Center", "State", "Wonderland"])
+
+  def test_get_stops_each_route(self):
+    stops_each_route = get_stops_each_route(list(FIXTURE_STOPS), sort_by=None, client=self.client)
+    self.assertEqual(set(stops_each_route), set(FIXTURE_STOPS))
+    for route_id, (success, stops_json) in stops_each_route.items():
+      self.assertTrue(success)
+      self.assertEqual(strip_attributes(stops_json, "/attributes/name"), [s[0] for s in FIXTURE_STOPS[route_id]])
+    self.assertEqual(len(self.server.requests), len(FIXTURE_STOPS))
+
+  def test_retry_after_rate_limit(self):
+    num_rejected = [0]
+
+    def handler(path, params, headers):
+      if num_rejected[0] < 2:
+        num_rejected[0] += 1
+        return 429, {"Content-Type": "application/json"}, b'{"errors": [{"status": "429"}]}'
+      return StubApiServer.fixture_handler(path, params, headers)
+
+    self.server.handler = handler
+    success, stops_json = get_stops(["Red"], client=self.client)
+    self.assertTrue(success)
+    self.assertEqual(len(stops_json["data"]), len(FIXTURE_STOPS["Red"]))
+    self.assertEqual(len(self.server.requests), 3)
+
+  def test_give_up_after_max_retries(self):
+    self.server.handler = lambda path, params, headers: (429, {"Retry-After": "0"}, b'{"errors": []}')
+    client = MbtaClient(base_url=self.server.url, max_retries=2, backoff=0.01)
+    success, _ = get_routes(client=client)
+    self.assertFalse(success)
+    self.assertEqual(len(self.server.requests), 3)
+    client.close()
+
+  def test_iter_stop_pages(self):
+    pages = list(iter_stop_pages(["Orange"], sort_by=None, page_limit=2, client=self.client))
+    self.assertEqual([len(page_json["data"]) for _, page_json in pages], [2, 2, 1])
+    self.assertTrue(all(success for success, _ in pages))
+    names = [name for _, page_json in pages for name in strip_attributes(page_json, "/attributes/name")]
+    self.assertEqual(names, [s[0] for s in FIXTURE_STOPS["Orange"]])
+    self.assertEqual([params["page[offset]"] for _, params, _ in self.server.requests], ["0", "2", "4"])
+
+    # A route that fits in one page takes one request.
+    self.assertEqual(len(list(iter_stop_pages(["Blue"], page_limit=10, client=self.client))), 1)
+
+  def test_iter_route_pages(self):
+    pages = list(iter_route_pages(page_limit=2, client=self.client))
+    self.assertEqual([len(page_json["data"]) for _, page_json in pages], [2, 2, 1])
+    self.assertEqual([params["page[offset]"] for _, params, _ in self.server.requests], ["0", "2", "4"])
+
+  def test_sparse_fields_and_gzip(self):
+    _, stops_json = get_stops(["Red"], client=self.client)
+    self.assertEqual(self.server.requests[-1][1]["fields[stop]"], "name,latitude,longitude")
+    self.assertEqual(self.server.requests[-1][1]["fields[route]"], "")
+    self.assertEqual(self.server.requests[-1][2]["Accept-Encoding"], "gzip")
+    self.assertEqual(set(stops_json["data"][0]["attributes"]), set(STOP_FIELDS))
+    _, routes_json = get_routes(fields=["long_name"], client=self.client)
+    self.assertEqual(routes_json["data"][0]["attributes"], {"long_name": "Blue Line"})
+    _, stops_json = get_stops(["Red"], fields=None, client=self.client)
+    self.assertNotIn("fields[stop]", self.server.requests[-1][1])
+    self.assertNotIn("fields[route]", self.server.requests[-1][1])
+
+    # Responses are gzipped on the wire, unless compress=False, and either way decode to the same JSON.
+    decoded = []
+    for compress in [True, False]:
+      client = MbtaClient(base_url=self.server.url, compress=compress, loads=lambda b: decoded.append(b) or json.loads(b))
+      profiler = profiling.enable()
+      self.assertEqual(get_stops(list(FIXTURE_STOPS), client=client)[1]["data"][0]["attributes"]["name"], "Airport")
+      profiling.disable()
+      client.close()
+      if compress:
+        self.assertLess(profiler.counters["api_bytes"], profiler.counters["api_body_bytes"])
+      else:
+        self.assertEqual(profiler.counters["api_bytes"], profiler.counters["api_body_bytes"])
+      self.assertEqual(profiler.histograms["api_decode"].count, 1)
+    self.assertEqual(decoded[0], decoded[1])
+
+  def test_get_route_stops_bulk(self):
+    route_ids = list(FIXTURE_STOPS) + list(FIXTURE_BUS_STOPS) + ["Silver"]
+    success, route_stops = get_route_stops_bulk(route_ids, client=self.client)
+    self.assertTrue(success)
+    self.assertEqual(len(self.server.requests), 1)
+    self.assertEqual(route_stops, dict(FIXTURE_STOPS, Silver=[], **FIXTURE_BUS_STOPS))
+
+    # The same stops (in the same order) as one get_stops request per route.
+    for route_id, (_, stops_json) in get_stops_each_route(route_ids, sort_by=None, client=self.client).items():
+      self.assertEqual([name for name, _, _ in route_stops[route_id]], strip_attributes(stops_json, "/attributes/name"))
+
+    self.server.requests.clear()
+    self.assertEqual(get_route_stops_bulk(route_ids, routes_per_request=2, client=self.client), (True, route_stops))
+    self.assertEqual(sorted(params["filter[route]"] for _, params, _ in self.server.requests),
+                     ["111,Silver", "Blue,Orange", "Red,1"])
+
+  def test_route_stop_sequences(self):
+    _, patterns_json = get_route_patterns(["Blue"], client=self.client)
+    sequences = list(route_stop_sequences(patterns_json))
+    self.assertEqual([(route_id, direction_id) for route_id, direction_id, _ in sequences], [("Blue", 0), ("Blue", 1)])
+    self.assertEqual([stop["attributes"]["name"] for stop in sequences[1][2]], [s[0] for s in FIXTURE_STOPS["Blue"][::-1]])
+
+    # Without the included trips and stops, the patterns can't be decoded.
+    _, patterns_json = get_route_patterns(["Blue"], include=None, client=self.client)
+    with self.assertRaises(ValueError):
+      list(route_stop_sequences(patterns_json))
+
+
+class ResponseCacheTest(unittest.TestCase):
+  """
+  Tests for cached and conditional requests, against a local stub server that returns 304s.
+  """
+  def setUp(self):
+    self.version = "v1"
+
+    def handler(path, params, headers):
+      etag = '"{}"'.format(self.version)
+      if headers.get("If-None-Match") == etag:
+        return 304, {"ETag": etag}, b""
+      status, response_headers, body = StubApiServer.fixture_handler(path, params, headers)
+      response_headers.update({"ETag": etag, "Last-Modified": "Mon, 01 Jun 2020 00:00:00 GMT"})
+      return status, response_headers, body
+
+    self.server = StubApiServer(handler)
+    self.folder = tempfile.TemporaryDirectory()
+
+  def tearDown(self):
+    self.server.close()
+    self.folder.cleanup()
+
+  def test_fresh_entries_skip_network(self):
+    client = MbtaClient(base_url=self.server.url, cache=ResponseCache(self.folder.name, ttl=60))
+    _, first = get_stops(["Red"], client=client)
+    success, second = get_stops(["Red"], client=client)
+    self.assertTrue(success)
+    self.assertEqual(first, second)
+    self.assertEqual(len(self.server.requests), 1)
+    self.assertEqual((client.cache.hits, client.cache.misses), (1, 1))
+
+    # Different params are a different cache key.
+    get_stops(["Blue"], client=client)
+    self.assertEqual(len(self.server.requests), 2)
+
+  def test_stale_entries_are_revalidated(self):
+    client = MbtaClient(base_url=self.server.url, cache=ResponseCache(self.folder.name, ttl=0))
+    _, first = get_stops(["Red"], client=client)
+    success, second = get_stops(["Red"], client=client)
+    self.assertTrue(success)
+    self.assertEqual(first, second)
+    self.assertEqual(self.server.requests[1][2]["If-None-Match"], '"v1"')
+    self.assertEqual(self.server.requests[1][2]["If-Modified-Since"], "Mon, 01 Jun 2020 00:00:00 GMT")
+    self.assertEqual(client.cache.revalidated, 1)
+
+    # Once the data changes, the server sends a full response and the cache is updated.
+    self.version = "v2"
+    get_stops(["Red"], client=client)
+    self.assertEqual(client.cache.misses, 2)
+    get_stops(["Red"], client=client)
+    self.assertEqual(self.server.requests[3][2]["If-None-Match"], '"v2"')
+    self.assertEqual(client.cache.revalidated, 2)
+
+  def test_lru_eviction(self):
+    cache = ResponseCache(self.folder.name, ttl=60, max_bytes=10000)
+    payload = "x" * 3000
+    for i in range(3):
+      cache.put("key{}".format(i), payload)
+      time.sleep(0.01)
+    cache.get("key0") # Now key1 is the least recently used.
+    time.sleep(0.01)
+    cache.put("key3", payload)
+    self.assertIsNotNone(cache.get("key0"))
+    self.assertIsNone(cache.get("key1"))
+    self.assertIsNotNone(cache.get("key2"))
+    self.assertIsNotNone(cache.get("key3"))
+
+  def test_put_does_not_scan_folder(self):
+    payload = "x" * 3000
+    ResponseCache(self.folder.name, ttl=60).put("old", payload)
+
+    # The folder is scanned once (finding "old"), and after that puts only update the in-memory sizes.
+    cache = ResponseCache(self.folder.name, ttl=60, max_bytes=10000)
+    cache.put("key0", payload)
+    with mock.patch("utils.mbta_api.os.scandir", side_effect=AssertionError("scanned the folder")):
+      for i in range(1, 6):
+        cache.put("key{}".format(i), payload)
+    self.assertIsNone(cache.get("old"))
+    self.assertEqual([cache.get("key{}".format(i)) is not None for i in range(6)], [False] * 3 + [True] * 3)
+    self.assertEqual(cache.num_bytes, sum(os.path.getsize(cache.path_for("key{}".format(i))) for i in range(3, 6)))
+
+  def test_counts_from_threads(self):
+    cache = ResponseCache(self.folder.name, ttl=60)
+    threads = [threading.Thread(target=lambda: [cache.count("hits") for _ in range(10000)]) for _ in range(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(cache.hits, 40000)
+
+
+class AllRoutesTest(unittest.TestCase):
+  """
+  Tests for preprocessing every route type, against a local stub server with bus routes as well.
+  """
+  def setUp(self):
+    self.server = StubApiServer()
+    self.client = MbtaClient(base_url=self.server.url)
+
+  def tearDown(self):
+    self.client.close()
+    self.server.close()
+
+  def test_discover_routes(self):
+    self.assertEqual(discover_routes(client=self.client),
+                     {"Blue": "Blue Line", "Orange": "Orange Line", "Red": "Red Line", "1": "Bus 1", "111": "Bus 111"})
+    self.assertEqual(set(discover_routes(route_types=[0, 1], client=self.client)), {"Blue", "Orange", "Red"})
+    self.assertEqual(route_display_name(3, "", "Crosstown", "CT"), "Crosstown")
+
+  def test_preprocess_all_routes(self):
+    routes_containing_stop = preprocess_all_routes(allow_cache=False, verbose=False, page_limit=2, client=self.client,
+                                                   routes_per_request=None)
+    expected = {}
+    for route_id, stops in list(FIXTURE_STOPS.items()) + list(FIXTURE_BUS_STOPS.items()):
+      route_name = "Bus " + route_id if route_id in FIXTURE_BUS_STOPS else route_id + " Line"
+      for name, _, _ in stops:
+        expected.setdefault(name, set()).add(route_name)
+    self.assertEqual(routes_containing_stop, expected)
+
+    # Every route was fetched in pages of 2 stops.
+    stop_requests = [params for path, params, _ in self.server.requests if path == "/stops"]
+    num_stops = [len(stops) for stops in list(FIXTURE_STOPS.values()) + list(FIXTURE_BUS_STOPS.values())]
+    self.assertEqual(len(stop_requests), sum((n + 1) // 2 for n in num_stops))
+
+    # By default, every route's stops come from one request for their route patterns.
+    self.server.requests.clear()
+    self.assertEqual(preprocess_all_routes(allow_cache=False, verbose=False, client=self.client), expected)
+    self.assertEqual([path for path, _, _ in self.server.requests], ["/routes", "/route_patterns"])
+
+
 if __name__ == "__main__":
   unittest.main()
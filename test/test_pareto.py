@@ -0,0 +1,96 @@
+import random, unittest
+
+from utils.pareto import *
+from utils.routing import TransitGraph, find_coarse_route
+from utils.stop_graph import StopGraph
+
+
+# "Direct" goes the long way around from X to Y. A + B and C + D are shorter, but need a transfer.
+_ORDERED_STOP_NAMES = {"Direct": ["X", "N", "Y"], "A": ["X", "M"], "B": ["M", "Y"], "C": ["X", "M2"], "D": ["M2", "Y"]}
+_COORDINATES = {"X": (42.0, -71.0), "Y": (42.0, -70.9), "N": (42.1, -70.95), "M": (42.0, -70.95), "M2": (41.99, -70.95)}
+
+
+def random_network(rng, num_routes=12, grid_size=6, stops_per_route=6):
+  ordered_stop_names = {}
+  for route in range(num_routes):
+    row, col = rng.randrange(grid_size), rng.randrange(grid_size)
+    stops = []
+    for _ in range(stops_per_route):
+      name = "{}-{}".format(row, col)
+      if name not in stops:
+        stops.append(name)
+      row = min(grid_size - 1, max(0, row + rng.choice([-1, 0, 1])))
+      col = min(grid_size - 1, max(0, col + rng.choice([-1, 0, 1])))
+    ordered_stop_names["Route {}".format(route)] = stops
+  coordinates = {"{}-{}".format(row, col): (42.0 + 0.01 * row + 0.003 * rng.random(), -71.0 + 0.01 * col)
+                 for row in range(grid_size) for col in range(grid_size)}
+  return ordered_stop_names, coordinates
+
+
+class ParetoTest(unittest.TestCase):
+  def setUp(self):
+    self.graph = StopGraph(_ORDERED_STOP_NAMES, _COORDINATES, transfer_penalty_km=1.0)
+
+  def test_frontier(self):
+    frontier = pareto_routes(self.graph, "X", "Y")
+    self.assertEqual([it.transfers for it in frontier], [0, 1])
+    self.assertEqual([leg.route for leg in frontier[0].legs], ["Direct"])
+    self.assertEqual([leg.route for leg in frontier[1].legs], ["A", "B"])
+    self.assertGreater(frontier[0].distance_km, frontier[1].distance_km)
+    self.assertAlmostEqual(frontier[1].distance_km, sum(leg.distance_km for leg in frontier[1].legs))
+
+    self.assertEqual(len(pareto_routes(self.graph, "X", "Y", max_transfers=0)), 1)
+    self.assertEqual(pareto_routes(self.graph, "X", "X"), [Itinerary(0, 0.0, [])])
+    self.assertEqual(pareto_routes(self.graph, "X", "Nowhere"), [])
+
+  def test_k_best(self):
+    alternatives = k_best_routes(self.graph, "X", "Y", k=5)
+    self.assertEqual([[leg.route for leg in it.legs] for _, it in alternatives], [["A", "B"], ["C", "D"], ["Direct"]])
+    costs = [cost for cost, _ in alternatives]
+    self.assertEqual(costs, sorted(costs))
+    self.assertAlmostEqual(costs[0], alternatives[0][1].distance_km + 1.0)
+    self.assertEqual(len(k_best_routes(self.graph, "X", "Y", k=1)), 1)
+
+    # With a big enough transfer penalty, the direct route is the best.
+    best_cost, best = k_best_routes(self.graph, "X", "Y", k=1, transfer_penalty_km=100)[0]
+    self.assertEqual([leg.route for leg in best.legs], ["Direct"])
+
+  def test_matches_single_criterion_searches(self):
+    """
+    The ends of the frontier should match the shortest path (ignoring transfers), and the fewest transfers.
+    """
+    rng = random.Random(0)
+    for _ in range(5):
+      ordered_stop_names, coordinates = random_network(rng)
+      graph = StopGraph(ordered_stop_names, coordinates, transfer_penalty_km=0.0)
+      penalty_graph = StopGraph(ordered_stop_names, coordinates, transfer_penalty_km=1.0)
+      routes_containing_stop = {}
+      for route, stops in ordered_stop_names.items():
+        for stop in stops:
+          routes_containing_stop.setdefault(stop, set()).add(route)
+      transit_graph = TransitGraph(routes_containing_stop)
+
+      for stop_A in graph.stop_names:
+        for stop_B in graph.stop_names[::3]:
+          frontier = pareto_routes(graph, stop_A, stop_B)
+          is_feasible, _, cost, _ = graph.shortest_path(stop_A, stop_B)
+          self.assertEqual(len(frontier) > 0, is_feasible)
+          if not is_feasible or stop_A == stop_B:
+            continue
+          self.assertAlmostEqual(frontier[-1].distance_km, cost)
+          self.assertEqual(frontier[0].transfers, len(find_coarse_route(stop_A, stop_B, transit_graph)[1]) - 1)
+          for a, b in zip(frontier[:-1], frontier[1:]):
+            self.assertLess(a.transfers, b.transfers)
+            self.assertGreater(a.distance_km, b.distance_km)
+
+          # k_best_routes never rides a route twice, so it only matches shortest_path when that doesn't either.
+          _, legs, cost, _ = penalty_graph.shortest_path(stop_A, stop_B)
+          best_cost, _ = k_best_routes(penalty_graph, stop_A, stop_B, k=1)[0]
+          if len(legs) == len({leg.route for leg in legs}):
+            self.assertAlmostEqual(best_cost, cost)
+          else:
+            self.assertGreater(best_cost, cost)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,90 @@
+import json, os, subprocess, sys, tempfile, unittest
+
+from utils import profiling
+from utils.mbta_api import MbtaClient, ResponseCache, get_stops
+from utils.routing import TransitGraph, find_coarse_route, load_snapshot
+from test.stub_api import StubApiServer
+
+
+class ProfilerTest(unittest.TestCase):
+  def tearDown(self):
+    profiling.disable()
+
+  def test_disabled_is_a_no_op(self):
+    profiling.disable()
+    profiling.count("anything")
+    profiling.record("anything", 1.0)
+    self.assertIs(profiling.timed("anything"), profiling.timed("something else"))
+    with profiling.timed("anything"):
+      pass
+
+  def test_counters_and_histograms(self):
+    profiler = profiling.enable()
+    profiling.count("bytes", 100)
+    profiling.count("bytes", 20)
+    profiling.record("query", 0.0015)
+    profiling.record("query", 0.5)
+    with profiling.timed("build"):
+      pass
+
+    self.assertEqual(profiler.counters, {"bytes": 120})
+    self.assertEqual(profiler.histograms["query"].count, 2)
+    self.assertEqual(profiler.histograms["build"].count, 1)
+    self.assertEqual(json.loads(profiler.export("json"))["latency"]["query"]["p50_ms"], 2)
+    with self.assertRaises(ValueError):
+      profiler.export("xml")
+
+    lines = profiler.to_prometheus().splitlines()
+    self.assertIn("# TYPE mbta_bytes_total counter", lines)
+    self.assertIn("mbta_bytes_total 120", lines)
+    self.assertIn("# TYPE mbta_query_seconds histogram", lines)
+    # Buckets are cumulative, and in seconds.
+    self.assertIn('mbta_query_seconds_bucket{le="0.001"} 0', lines)
+    self.assertIn('mbta_query_seconds_bucket{le="0.002"} 1', lines)
+    self.assertIn('mbta_query_seconds_bucket{le="0.5"} 2', lines)
+    self.assertIn('mbta_query_seconds_bucket{le="+Inf"} 2', lines)
+    self.assertIn("mbta_query_seconds_sum 0.501500", lines)
+    self.assertIn("mbta_query_seconds_count 2", lines)
+
+  def test_find_coarse_route(self):
+    graph = TransitGraph({"A": {"Red"}, "B": {"Red", "Blue"}, "C": {"Blue", "Green"}, "D": {"Green"}})
+    profiler = profiling.enable()
+    self.assertTrue(find_coarse_route("A", "D", graph)[0])
+    self.assertTrue(find_coarse_route("A", "B", graph)[0]) # Same route, so there's no search.
+    self.assertEqual(profiler.histograms["route_query"].count, 2)
+    self.assertEqual(profiler.counters["route_searches"], 1)
+    self.assertGreater(profiler.counters["routes_expanded"], 0)
+
+  def test_api_client(self):
+    server = StubApiServer()
+    folder = tempfile.TemporaryDirectory()
+    client = MbtaClient(base_url=server.url, cache=ResponseCache(folder.name, ttl=60))
+    profiler = profiling.enable()
+    get_stops(["Red"], client=client)
+    get_stops(["Red"], client=client)
+    get_stops(["Blue"], client=client)
+    self.assertEqual(profiler.histograms["api_request"].count, 2)
+    self.assertGreater(profiler.counters["api_bytes"], 0)
+    self.assertEqual(profiler.counters["http_cache_misses"], 2)
+    self.assertEqual(profiler.counters["http_cache_hits"], 1)
+    client.close()
+    server.close()
+    folder.cleanup()
+
+  def test_routing_main_flag(self):
+    load_snapshot("nominal", allow_cache=True, verbose=False) # Make sure the network is cached.
+    folder = tempfile.TemporaryDirectory()
+    path = os.path.join(folder.name, "profile.prom")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, "routing_main.py", "--A", "Wonderland", "--B", "Alewife", "--profile", "prometheus",
+                    "--profile-out", path], cwd=root, stdout=subprocess.DEVNULL, check=True)
+    with open(path) as f:
+      lines = f.read().splitlines()
+    self.assertIn("mbta_snapshot_cache_hits_total 1", lines)
+    self.assertIn("mbta_route_query_seconds_count 1", lines)
+    self.assertIn("mbta_graph_build_seconds_count 1", lines)
+    folder.cleanup()
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,153 @@
+import os, random, tempfile, unittest
+
+from utils.raptor import *
+from test.gtfs_fixture import write_fixture_gtfs
+from test.test_pareto import random_network
+
+
+def hours(h, m=0):
+  return 3600 * h + 60 * m
+
+
+def trip(route, trip_id, start, stops, minutes_between=5):
+  return (route, trip_id, [(stop, start + 60 * minutes_between * i, start + 60 * minutes_between * i)
+                           for i, stop in enumerate(stops)])
+
+
+def connection_scan(trips, stop_A, stop_B, departure_time, footpaths={}):
+  """
+  Earliest arrival with the Connection Scan Algorithm, as a simple reference for RAPTOR.
+  """
+  connections = []
+  for _, trip_id, stop_times in trips:
+    for (a, _, departure), (b, arrival, _) in zip(stop_times[:-1], stop_times[1:]):
+      connections.append((departure, arrival, a, b, trip_id))
+  connections.sort()
+  arrival_at = {stop_A: departure_time}
+  for (a, b), seconds in footpaths.items():
+    if a == stop_A:
+      arrival_at[b] = min(arrival_at.get(b, float("inf")), departure_time + seconds)
+  on_trip = set()
+  for departure, arrival, a, b, trip_id in connections:
+    if trip_id in on_trip or arrival_at.get(a, float("inf")) <= departure:
+      on_trip.add(trip_id)
+      if arrival < arrival_at.get(b, float("inf")):
+        arrival_at[b] = arrival
+        for (c, d), seconds in footpaths.items():
+          if c == b:
+            arrival_at[d] = min(arrival_at.get(d, float("inf")), arrival + seconds)
+  return arrival_at.get(stop_B)
+
+
+class RaptorTest(unittest.TestCase):
+  def setUp(self):
+    # The direct route is slow, and A + B is faster but needs a transfer at M.
+    self.trips = [
+      trip("Direct", "d1", hours(8), ["X", "N", "Y"], minutes_between=30),
+      trip("A", "a1", hours(8), ["X", "M"]),
+      trip("A", "a2", hours(8, 30), ["X", "M"]),
+      trip("B", "b1", hours(8, 5), ["M", "Y"]),
+      trip("B", "b2", hours(8, 20), ["M", "Y"]),
+    ]
+    self.timetable = Timetable(self.trips, footpaths={("Y", "Z"): 120})
+
+  def test_earliest_arrival(self):
+    journey = earliest_arrival(self.timetable, "X", "Y", hours(7, 55))
+    self.assertEqual(journey.arrival_time, hours(8, 10))
+    self.assertEqual(journey.transfers, 1)
+    self.assertEqual([(leg.route, leg.trip_id, leg.board_stop, leg.alight_stop) for leg in journey.legs],
+                     [("A", "a1", "X", "M"), ("B", "b1", "M", "Y")])
+    self.assertEqual([(leg.departure_time, leg.arrival_time) for leg in journey.legs],
+                     [(hours(8), hours(8, 5)), (hours(8, 5), hours(8, 10))])
+
+    # Needing time to transfer misses b1, so the direct route is just as fast.
+    journey = earliest_arrival(self.timetable, "X", "Y", hours(7, 55), min_transfer_seconds=60)
+    self.assertEqual(journey.arrival_time, hours(8, 25))
+    self.assertEqual(journey.legs[1].trip_id, "b2")
+    journey = earliest_arrival(self.timetable, "X", "Y", hours(7, 55), max_transfers=0)
+    self.assertEqual([leg.route for leg in journey.legs], ["Direct"])
+    self.assertEqual(journey.arrival_time, hours(9))
+
+  def test_footpaths_and_edge_cases(self):
+    journey = earliest_arrival(self.timetable, "X", "Z", hours(7, 55))
+    self.assertEqual(journey.arrival_time, hours(8, 12))
+    self.assertEqual(journey.legs[-1], TimedLeg(None, None, "Y", "Z", hours(8, 10), hours(8, 12)))
+
+    self.assertIsNone(earliest_arrival(self.timetable, "X", "Y", hours(9)))
+    self.assertIsNone(earliest_arrival(self.timetable, "Y", "X", hours(7)))
+    self.assertIsNone(earliest_arrival(self.timetable, "X", "Nowhere", hours(7)))
+    self.assertEqual(earliest_arrival(self.timetable, "X", "X", hours(7)), Journey(hours(7), hours(7), 0, []))
+
+  def test_two_hop_walk(self):
+    self.assertEqual(transitive_footpaths({("Y", "Z"): 120, ("Z", "W"): 60, ("Y", "W"): 300, ("W", "W"): 0}),
+                     {("Y", "Z"): 120, ("Z", "W"): 60, ("Y", "W"): 180})
+
+    # W is only reachable by walking Y => Z => W after the ride to Y, and then the ride from W to V.
+    trips = self.trips + [trip("C", "c1", hours(8, 20), ["W", "V"])]
+    timetable = Timetable(trips, footpaths={("Y", "Z"): 120, ("Z", "W"): 60})
+    journey = earliest_arrival(timetable, "X", "W", hours(7, 55))
+    self.assertEqual(journey.arrival_time, hours(8, 13))
+    self.assertEqual(journey.legs[-1], TimedLeg(None, None, "Y", "W", hours(8, 10), hours(8, 13)))
+    journey = earliest_arrival(timetable, "X", "V", hours(7, 55))
+    self.assertEqual([leg.route for leg in journey.legs], ["A", "B", None, "C"])
+    self.assertEqual(journey.arrival_time, hours(8, 25))
+
+  def test_overtaking_trips(self):
+    # The express leaves later but arrives earlier, so it has to go in a separate pattern.
+    trips = [("Line", "local", [("P", 0, 0), ("Q", 600, 600), ("R", 1200, 1200)]),
+             ("Line", "express", [("P", 60, 60), ("Q", 300, 300), ("R", 400, 400)])]
+    timetable = Timetable(trips)
+    self.assertEqual(len(timetable.pattern_route), 2)
+    self.assertEqual(earliest_arrival(timetable, "P", "R", 0).arrival_time, 400)
+
+  def test_matches_connection_scan(self):
+    rng = random.Random(0)
+    for _ in range(3):
+      ordered_stop_names, _ = random_network(rng)
+      trips = []
+      for route, stops in ordered_stop_names.items():
+        for direction, sequence in enumerate([stops, stops[::-1]]):
+          for i in range(6):
+            start = hours(6) + rng.randrange(0, 3 * 3600)
+            trips.append(trip(route, "{}-{}-{}".format(route, direction, i), start, sequence,
+                              minutes_between=rng.randrange(2, 6)))
+      footpaths = {("0-0", "0-1"): 300, ("0-1", "0-0"): 300, ("3-3", "4-4"): 200}
+      timetable = Timetable(trips, footpaths)
+      stops = sorted(timetable.stop_names)
+      for stop_A in stops[::2]:
+        for stop_B in stops[::3]:
+          departure_time = hours(6) + rng.randrange(0, 2 * 3600)
+          journey = earliest_arrival(timetable, stop_A, stop_B, departure_time, max_transfers=20)
+          expected = connection_scan(trips, stop_A, stop_B, departure_time, footpaths)
+          self.assertEqual(journey.arrival_time if journey is not None else None,
+                           departure_time if stop_A == stop_B else expected)
+          if journey is not None:
+            # Legs connect, and never leave before the rider gets there.
+            time, stop = departure_time, stop_A
+            for leg in journey.legs:
+              self.assertEqual(leg.board_stop, stop)
+              self.assertLessEqual(time, leg.departure_time)
+              time, stop = leg.arrival_time, leg.alight_stop
+            self.assertEqual((time, stop), (journey.arrival_time, stop_B))
+
+  def test_from_gtfs(self):
+    folder = tempfile.TemporaryDirectory()
+    path = os.path.join(folder.name, "gtfs.zip")
+    write_fixture_gtfs(path)
+
+    timetable = Timetable.from_gtfs(path, verbose=False)
+    self.assertIn("Downtown Crossing", timetable)
+    # Trips leave at 6:00 and 7:00, two minutes between stops. Wonderland to Braintree is Blue to State,
+    # Orange to Downtown Crossing, then Red.
+    journey = earliest_arrival(timetable, "Wonderland", "Braintree", hours(6, 30))
+    self.assertEqual([leg.route for leg in journey.legs], ["Blue Line", "Orange Line", "Red Line"])
+    self.assertEqual(journey.arrival_time, hours(7, 8))
+
+    # The fixture's service runs every day in 2020-2030.
+    self.assertEqual(len(Timetable.from_gtfs(path, date="20240101", verbose=False).trip_ids), 15)
+    self.assertEqual(len(Timetable.from_gtfs(path, date="20350101", verbose=False).trip_ids), 0)
+    folder.cleanup()
+
+
+if __name__ == "__main__":
+  unittest.main()
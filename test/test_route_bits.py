@@ -0,0 +1,66 @@
+import unittest
+
+from utils.route_bits import *
+from utils.routing import *
+
+
+_ROUTES_CONTAINING_STOP_NOMINAL = preprocess_nominal(allow_cache=True)
+_ROUTES_CONTAINING_STOP_COVID = preprocess_covid(allow_cache=True)
+
+
+class BitGraphTest(unittest.TestCase):
+  def assertValidRoute(self, graph, stop_A, stop_B, S):
+    """
+    Every leg should be boarded at a stop that the route visits, and the last route should visit stop_B.
+    """
+    self.assertEqual(S[0].connect_stop, stop_A)
+    for node in S:
+      self.assertIn(node.name, graph.routes_at(node.connect_stop))
+    for previous, node in zip(S[:-1], S[1:]):
+      self.assertIn(previous.name, graph.routes_at(node.connect_stop))
+      self.assertIs(node.parent_node, previous)
+    self.assertIn(S[-1].name, graph.routes_at(stop_B))
+
+  def test_masks(self):
+    self.assertEqual(route_mask([0, 3, 5]), 0b101001)
+    self.assertEqual(mask_route_ids(0b101001), [0, 3, 5])
+    self.assertEqual(mask_route_ids(1 << 170 | 1), [0, 170])
+
+    graph = TransitGraph(_ROUTES_CONTAINING_STOP_NOMINAL)
+    bit_graph = BitGraph(graph)
+    for stop_id, routes in enumerate(graph.stop_routes):
+      self.assertEqual(mask_route_ids(bit_graph.stop_masks[stop_id]), list(routes))
+
+  def test_same_transfers_as_find_coarse_route(self):
+    for network in [_ROUTES_CONTAINING_STOP_NOMINAL, _ROUTES_CONTAINING_STOP_COVID]:
+      graph = TransitGraph(network)
+      bit_graph = BitGraph(graph)
+      stops = sorted(network)
+      for stop_A in stops:
+        for stop_B in stops:
+          if stop_A == stop_B:
+            continue
+          is_feasible, S = find_coarse_route(stop_A, stop_B, graph)
+          is_feasible_bits, S_bits = bit_graph.find_coarse_route(stop_A, stop_B)
+          self.assertEqual(is_feasible_bits, is_feasible)
+          self.assertEqual(len(S_bits), len(S))
+          if is_feasible:
+            self.assertValidRoute(graph, stop_A, stop_B, S_bits)
+
+  def test_transfer_counts(self):
+    graph = TransitGraph(_ROUTES_CONTAINING_STOP_COVID)
+    bit_graph = BitGraph(graph)
+    stops = sorted(_ROUTES_CONTAINING_STOP_COVID)
+    masks = [bit_graph.stop_masks[graph.stop_ids[stop]] for stop in stops]
+    counts = transfer_counts(bit_graph, masks, masks)
+    for i, stop_A in enumerate(stops):
+      for j, stop_B in enumerate(stops):
+        if stop_A != stop_B:
+          is_feasible, S = find_coarse_route(stop_A, stop_B, graph)
+          self.assertEqual(counts[i][j], len(S) - 1 if is_feasible else -1, (stop_A, stop_B))
+        else:
+          self.assertEqual(counts[i][j], 0)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+
+from utils.closures import ClosableNetwork
+from utils.route_cache import RouteCache
+from utils.routing import *
+from test.test_closures import _BRANCH_LINKS, _ORDERED_STOP_NAMES
+
+
+_ROUTES_CONTAINING_STOP_NOMINAL = preprocess_nominal(allow_cache=True)
+
+
+class RouteCacheTest(unittest.TestCase):
+  def assertSameAsSearch(self, cache, graph, pairs):
+    for stop_A, stop_B in pairs:
+      self.assertEqual(cache.find_coarse_route(stop_A, stop_B, graph), find_coarse_route(stop_A, stop_B, graph))
+
+  def test_matches_find_coarse_route(self):
+    graph = TransitGraph(_ROUTES_CONTAINING_STOP_NOMINAL)
+    cache = RouteCache()
+    stops = sorted(_ROUTES_CONTAINING_STOP_NOMINAL)
+    pairs = [(stop_A, stop_B) for stop_A in stops for stop_B in stops if stop_A != stop_B]
+    self.assertSameAsSearch(cache, graph, pairs)
+
+    # There's one search for each pair of distinct route sets, and every other pair is a hit.
+    num_classes = len(set(graph.stop_routes))
+    self.assertEqual(len(cache.class_of_routes), num_classes)
+    self.assertLessEqual(cache.misses, num_classes * num_classes)
+    self.assertEqual(cache.hits + cache.misses, len(pairs))
+    self.assertGreater(cache.hit_rate(), 0.9)
+
+  def test_connect_stop_is_stop_A(self):
+    graph = TransitGraph(_ROUTES_CONTAINING_STOP_NOMINAL)
+    cache = RouteCache()
+    _, S = cache.find_coarse_route("Arlington", "Wonderland", graph)
+    _, T = cache.find_coarse_route("Boylston", "Wonderland", graph)
+    self.assertEqual(cache.hits, 1)
+    self.assertEqual((S[0].connect_stop, T[0].connect_stop), ("Arlington", "Boylston"))
+    self.assertEqual([node.name for node in S], [node.name for node in T])
+
+  def test_lru_eviction(self):
+    graph = TransitGraph(_ROUTES_CONTAINING_STOP_NOMINAL)
+    cache = RouteCache(max_entries=2)
+    for stop_A, stop_B in [("Alewife", "Wonderland"), ("Alewife", "Oak Grove"), ("Alewife", "Wonderland"),
+                           ("Alewife", "Riverside"), ("Alewife", "Oak Grove")]:
+      cache.find_coarse_route(stop_A, stop_B, graph)
+    # Wonderland was used more recently than Oak Grove, so Oak Grove was evicted for Riverside.
+    self.assertEqual((cache.hits, cache.misses), (1, 4))
+    self.assertEqual(len(cache.entries), 2)
+
+  def test_invalidation(self):
+    network = ClosableNetwork(_ORDERED_STOP_NAMES, branch_links=_BRANCH_LINKS)
+    cache = RouteCache()
+    old_graph = network.graph
+    self.assertEqual([n.name for n in cache.find_coarse_route("Kendall/MIT", "Lechmere", old_graph)[1]],
+                     ["Red Line", "Green Line"])
+
+    network.close("Park Street")
+    self.assertGreater(network.graph.version, old_graph.version)
+    self.assertEqual(cache.find_coarse_route("Kendall/MIT", "Lechmere", network.graph), (False, []))
+    self.assertEqual((cache.invalidations, cache.misses), (1, 2))
+
+    # A query that's still running on the old graph gets the old answer, without touching the cache.
+    self.assertTrue(cache.find_coarse_route("Kendall/MIT", "Lechmere", old_graph)[0])
+    self.assertEqual(cache.version, network.graph.version)
+    self.assertEqual(cache.find_coarse_route("Kendall/MIT", "Lechmere", network.graph), (False, []))
+    self.assertEqual(cache.hits, 1)
+
+  def test_invalidate_current_version(self):
+    graph = TransitGraph(_ROUTES_CONTAINING_STOP_NOMINAL)
+    cache = RouteCache()
+    expected = cache.find_coarse_route("Wonderland", "Boston College", graph)
+    cache.invalidate(graph.version)
+    self.assertEqual(len(cache.entries), 0)
+    self.assertEqual(cache.find_coarse_route("Wonderland", "Boston College", graph), expected)
+    self.assertEqual((cache.invalidations, cache.misses, cache.hits), (1, 2, 0))
+
+    # Invalidating before the first query works too.
+    cache = RouteCache()
+    cache.invalidate(graph.version)
+    self.assertEqual(cache.find_coarse_route("Wonderland", "Boston College", graph), expected)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -1,4 +1,4 @@
-import unittest
+import random, unittest
 
 from utils.routing import *
 from utils.utils import *
@@ -7,11 +7,13 @@ from utils.utils import *
 # Just do this once and use cached results.
 _ROUTES_CONTAINING_STOP_NOMINAL = preprocess_nominal(allow_cache=True)
 _ROUTES_CONTAINING_STOP_COVID = preprocess_covid(allow_cache=True)
+_GRAPH_NOMINAL = TransitGraph(_ROUTES_CONTAINING_STOP_NOMINAL)
+_GRAPH_COVID = TransitGraph(_ROUTES_CONTAINING_STOP_COVID)
 
 
 class NominalRoutingTest(unittest.TestCase):
   def test_red_to_green_C(self):
-    is_feasible, S = find_coarse_route("Kendall/MIT", "Boston College", _ROUTES_CONTAINING_STOP_NOMINAL)
+    is_feasible, S = find_coarse_route("Kendall/MIT", "Boston College", _GRAPH_NOMINAL)
     print_coarse_route(S, "Kendall/MIT", "Boston College")
 
     self.assertTrue(is_feasible)
@@ -25,7 +27,7 @@ class NominalRoutingTest(unittest.TestCase):
     self.assertEqual(S[1].connect_stop, "Park Street")
 
   def test_green_C_to_red(self):
-    is_feasible, S = find_coarse_route("Boston College", "Kendall/MIT", _ROUTES_CONTAINING_STOP_NOMINAL)
+    is_feasible, S = find_coarse_route("Boston College", "Kendall/MIT", _GRAPH_NOMINAL)
     print_coarse_route(S, "Boston College", "Kendall/MIT")
 
     self.assertTrue(is_feasible)
@@ -39,7 +41,7 @@ class NominalRoutingTest(unittest.TestCase):
     self.assertEqual(S[1].connect_stop, "Park Street")
 
   def test_mattapan_to_mattapan(self):
-    is_feasible, S = find_coarse_route("Valley Road", "Ashmont", _ROUTES_CONTAINING_STOP_NOMINAL)
+    is_feasible, S = find_coarse_route("Valley Road", "Ashmont", _GRAPH_NOMINAL)
     print_coarse_route(S, "Valley Road", "Ashmont")
 
     self.assertTrue(is_feasible)
@@ -49,7 +51,7 @@ class NominalRoutingTest(unittest.TestCase):
     self.assertEqual(S[0].connect_stop, "Valley Road")
 
   def test_same_start_and_end(self):
-    is_feasible, S = find_coarse_route("Forest Hills", "Forest Hills", _ROUTES_CONTAINING_STOP_NOMINAL)
+    is_feasible, S = find_coarse_route("Forest Hills", "Forest Hills", _GRAPH_NOMINAL)
     print_coarse_route(S, "Forest Hills", "Forest Hills")
 
     self.assertTrue(is_feasible)
@@ -60,7 +62,7 @@ class NominalRoutingTest(unittest.TestCase):
       Blue ==> Green X ==> Red  OR
       Blue ==> Orange ==> Red
     """
-    is_feasible, S = find_coarse_route("Revere Beach", "Braintree", _ROUTES_CONTAINING_STOP_NOMINAL)
+    is_feasible, S = find_coarse_route("Revere Beach", "Braintree", _GRAPH_NOMINAL)
     print_coarse_route(S, "Reverse Beach", "Braintree")
 
     self.assertTrue(is_feasible)
@@ -85,30 +87,83 @@ class NominalRoutingTest(unittest.TestCase):
       self.assertEqual(S[2].connect_stop, "Downtown Crossing")
 
 
+class TransitGraphTest(unittest.TestCase):
+  def test_interned_ids(self):
+    for stop_name, route_names in _ROUTES_CONTAINING_STOP_NOMINAL.items():
+      self.assertIn(stop_name, _GRAPH_NOMINAL)
+      self.assertEqual(_GRAPH_NOMINAL.routes_at(stop_name), set(route_names))
+    self.assertEqual(len(_GRAPH_NOMINAL.route_names), 8)
+
+  def test_adjacency_is_symmetric(self):
+    for route, edges in enumerate(_GRAPH_NOMINAL.adjacent):
+      for other, stop in edges:
+        self.assertIn((route, stop), _GRAPH_NOMINAL.adjacent[other])
+        self.assertIn(route, _GRAPH_NOMINAL.stop_routes[stop])
+        self.assertIn(other, _GRAPH_NOMINAL.stop_routes[stop])
+
+  def test_dict_and_graph_agree(self):
+    for stop_A, stop_B in [("Kendall/MIT", "Boston College"), ("Revere Beach", "Braintree"), ("Harvard", "Harvard")]:
+      is_feasible_dict, S_dict = find_coarse_route(stop_A, stop_B, _ROUTES_CONTAINING_STOP_NOMINAL)
+      is_feasible_graph, S_graph = find_coarse_route(stop_A, stop_B, _GRAPH_NOMINAL)
+      self.assertEqual(is_feasible_dict, is_feasible_graph)
+      self.assertEqual([n.name for n in S_dict], [n.name for n in S_graph])
+
+
 class CovidRoutingTest(unittest.TestCase):
   def test_red_to_green_C_infeasible(self):
-    is_feasible, S = find_coarse_route("Kendall/MIT", "Boston College", _ROUTES_CONTAINING_STOP_COVID)
+    is_feasible, S = find_coarse_route("Kendall/MIT", "Boston College", _GRAPH_COVID)
     self.assertFalse(is_feasible)
 
   def test_green_C_to_red_infeasible(self):
-    is_feasible, S = find_coarse_route("Boston College", "Kendall/MIT", _ROUTES_CONTAINING_STOP_COVID)
+    is_feasible, S = find_coarse_route("Boston College", "Kendall/MIT", _GRAPH_COVID)
     self.assertFalse(is_feasible)
 
   def test_feasible_01(self):
-    is_feasible, S = find_coarse_route("Harvard", "Porter", _ROUTES_CONTAINING_STOP_COVID)
+    is_feasible, S = find_coarse_route("Harvard", "Porter", _GRAPH_COVID)
     print_coarse_route(S, "Harvard", "Porter")
     self.assertTrue(is_feasible)
 
   def test_feasible_02(self):
-    is_feasible, S = find_coarse_route("North Station", "Airport", _ROUTES_CONTAINING_STOP_COVID)
+    is_feasible, S = find_coarse_route("North Station", "Airport", _GRAPH_COVID)
     print_coarse_route(S, "North Station", "Airport")
     self.assertTrue(is_feasible)
 
   def test_feasible_03(self):
-    is_feasible, S = find_coarse_route("Wollaston", "South Station", _ROUTES_CONTAINING_STOP_COVID)
+    is_feasible, S = find_coarse_route("Wollaston", "South Station", _GRAPH_COVID)
     print_coarse_route(S, "Wollaston", "South Station")
     self.assertTrue(is_feasible)
 
 
+class SearchRouteIdsTest(unittest.TestCase):
+  def assert_same_paths(self, graph, pairs):
+    for stop_A, stop_B in pairs:
+      start, goal = graph.stop_routes[graph.stop_ids[stop_A]], graph.stop_routes[graph.stop_ids[stop_B]]
+      routes, connect_stops, _ = search_route_ids(graph, start, goal, bidirectional=True)
+      self.assertEqual((routes, connect_stops), search_route_ids(graph, start, goal, bidirectional=False)[:2])
+
+  def test_bidirectional_matches_one_sided(self):
+    for graph in [_GRAPH_NOMINAL, _GRAPH_COVID]:
+      stops = [name for name in graph.stop_names if name in graph]
+      self.assert_same_paths(graph, [(a, b) for a in stops for b in stops])
+
+  def test_bidirectional_matches_one_sided_large(self):
+    """
+    Random network with many overlapping routes, so that there are lots of ties between shortest paths.
+    """
+    rng = random.Random(0)
+    routes_containing_stop = {}
+    for route in range(150):
+      for stop in rng.sample(range(2000), 30):
+        routes_containing_stop.setdefault("Stop {}".format(stop), set()).add("Route {}".format(route))
+    graph = TransitGraph(routes_containing_stop)
+    stops = sorted(routes_containing_stop)
+    self.assert_same_paths(graph, [(rng.choice(stops), rng.choice(stops)) for _ in range(500)])
+
+  def test_infeasible(self):
+    graph = TransitGraph({"X": {"A"}, "Y": {"A", "B"}, "Z": {"C"}})
+    self.assertEqual(search_route_ids(graph, (0,), (2,))[:2], (None, []))
+    self.assertEqual(search_route_ids(graph, (0,), (1,))[:2], ([0, 1], [-1, 1]))
+
+
 if __name__ == "__main__":
   unittest.main()
@@ -0,0 +1,103 @@
+import asyncio, json, os, tempfile, threading, time, unittest
+from urllib.error import HTTPError
+from urllib.parse import quote
+from urllib.request import Request, urlopen
+
+from utils.routing import *
+from utils.server import *
+from utils.snapshot import write_snapshot
+
+
+_ROUTES_CONTAINING_STOP_NOMINAL = preprocess_nominal(allow_cache=True)
+_ROUTES_CONTAINING_STOP_COVID = preprocess_covid(allow_cache=True)
+
+
+class LatencyHistogramTest(unittest.TestCase):
+  def test_percentiles(self):
+    histogram = LatencyHistogram(buckets_ms=(1, 10, 100))
+    self.assertEqual(histogram.percentile(50), None)
+    for seconds in [0.0005] * 90 + [0.005] * 9 + [0.5]:
+      histogram.record(seconds)
+    self.assertEqual(histogram.counts, [90, 9, 0, 1])
+    self.assertEqual(histogram.percentile(50), 1)
+    self.assertEqual(histogram.percentile(99), 10)
+    self.assertEqual(histogram.percentile(100), float("inf"))
+    self.assertEqual(histogram.to_json()["count"], 100)
+
+
+class RoutingServerTest(unittest.TestCase):
+  def setUp(self):
+    self.folder = tempfile.TemporaryDirectory()
+    self.path = os.path.join(self.folder.name, "network.snap")
+    write_snapshot(self.path, _ROUTES_CONTAINING_STOP_NOMINAL)
+
+    # Run the server on its own event loop in a background thread.
+    self.server = RoutingServer(RoutingService(self.path), port=0, reload_interval=0.05)
+    self.loop = asyncio.new_event_loop()
+    self.loop.run_until_complete(self.server.start())
+    self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+    self.thread.start()
+    self.url = "http://127.0.0.1:{}".format(self.server.port)
+
+  def tearDown(self):
+    asyncio.run_coroutine_threadsafe(self.server.close(), self.loop).result()
+    self.loop.call_soon_threadsafe(self.loop.stop)
+    self.thread.join()
+    self.loop.close()
+    self.folder.cleanup()
+
+  def get(self, path):
+    with urlopen(self.url + path) as response:
+      return json.loads(response.read().decode("utf-8"))
+
+  def post(self, path, payload):
+    request = Request(self.url + path, data=json.dumps(payload).encode("utf-8"), method="POST")
+    with urlopen(request) as response:
+      return json.loads(response.read().decode("utf-8"))
+
+  def test_route(self):
+    result = self.get("/route?from=Kendall%2FMIT&to={}".format(quote("Boston College")))
+    self.assertTrue(result["feasible"])
+    self.assertEqual([r["name"] for r in result["routes"]], ["Red Line", "Green Line B"])
+
+    result = self.get("/route?from=Kendall%2FMIT&to=Nowhere")
+    self.assertFalse(result["feasible"])
+    self.assertIn("error", result)
+
+  def test_bulk_routes(self):
+    results = self.post("/routes", [{"from": "Wonderland", "to": "Alewife"}, {"A": "Alewife", "B": "Alewife"}])
+    self.assertEqual(len(results), 2)
+    names = [r["name"] for r in results[0]["routes"]]
+    self.assertEqual((len(names), names[0], names[-1]), (3, "Blue Line", "Red Line"))
+    self.assertEqual(results[1], {"A": "Alewife", "B": "Alewife", "feasible": True, "routes": []})
+
+    metrics = self.get("/metrics")
+    self.assertEqual(metrics["num_routed"], 2)
+    self.assertEqual(metrics["latency"]["/routes"]["count"], 1)
+    self.assertGreater(metrics["route_cache"]["misses"], 0)
+
+  def test_errors(self):
+    for path, status in [("/route?from=Wonderland", 400), ("/unknown", 404)]:
+      with self.assertRaises(HTTPError) as context:
+        self.get(path)
+      self.assertEqual(context.exception.code, status)
+    with self.assertRaises(HTTPError) as context:
+      self.post("/routes", {"from": "Wonderland"})
+    self.assertEqual(context.exception.code, 400)
+
+  def test_hot_reload(self):
+    self.assertTrue(self.get("/route?from=Wonderland&to=Alewife")["feasible"])
+    self.assertEqual(self.get("/healthz")["version"], 1)
+
+    # Swap in the COVID network, where Wonderland can't reach Alewife, and wait for the server to notice.
+    write_snapshot(self.path, _ROUTES_CONTAINING_STOP_COVID)
+    deadline = time.time() + 5
+    while self.get("/healthz")["version"] == 1 and time.time() < deadline:
+      time.sleep(0.02)
+
+    self.assertEqual(self.get("/metrics")["num_reloads"], 1)
+    self.assertFalse(self.get("/route?from=Wonderland&to=Alewife")["feasible"])
+
+
+if __name__ == "__main__":
+  unittest.main()
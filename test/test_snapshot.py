@@ -0,0 +1,68 @@
+import math, os, tempfile, unittest
+
+from utils.routing import *
+from utils.snapshot import *
+
+
+_ROUTES_CONTAINING_STOP_NOMINAL = preprocess_nominal(allow_cache=True)
+_ROUTES_CONTAINING_STOP_COVID = preprocess_covid(allow_cache=True)
+
+
+class SnapshotTest(unittest.TestCase):
+  def setUp(self):
+    self.folder = tempfile.TemporaryDirectory()
+    self.path = os.path.join(self.folder.name, "network.snap")
+
+  def tearDown(self):
+    self.folder.cleanup()
+
+  def test_round_trip(self):
+    for routes_containing_stop in [_ROUTES_CONTAINING_STOP_NOMINAL, _ROUTES_CONTAINING_STOP_COVID]:
+      write_snapshot(self.path, routes_containing_stop)
+      snapshot = Snapshot(self.path)
+      self.assertEqual(snapshot.routes_containing_stop(), {k: set(v) for k, v in routes_containing_stop.items()})
+      self.assertEqual(snapshot.stop_names(), sorted(routes_containing_stop))
+      snapshot.close()
+
+  def test_lookups_and_coordinates(self):
+    route_stops = {"Blue Line": ["Wonderland", "Airport", "State"], "Orange Line": ["Oak Grove", "State"]}
+    routes_containing_stop = {"Wonderland": {"Blue Line"}, "Airport": {"Blue Line"},
+                              "State": {"Blue Line", "Orange Line"}, "Oak Grove": {"Orange Line"}}
+    write_snapshot(self.path, routes_containing_stop, route_stops=route_stops,
+                   coordinates={"Wonderland": (42.4134, -70.9916), "State": (42.3589, -71.0576)})
+    snapshot = Snapshot(self.path)
+
+    self.assertEqual(snapshot.stop_id("Airport"), 0)
+    self.assertEqual(snapshot.stop_id("Wonderland"), 3)
+    self.assertEqual(snapshot.stop_id("Nowhere"), -1)
+    self.assertNotIn("Nowhere", snapshot)
+
+    blue = snapshot.route_names().index("Blue Line")
+    self.assertEqual([snapshot.stop_name(i) for i in snapshot.route_stops(blue)], route_stops["Blue Line"])
+    self.assertEqual(sorted(snapshot.route_name(r) for r in snapshot.stop_routes(snapshot.stop_id("State"))),
+                     ["Blue Line", "Orange Line"])
+
+    self.assertEqual(snapshot.stop_coordinate(snapshot.stop_id("Wonderland")), (42.4134, -70.9916))
+    self.assertTrue(all(math.isnan(c) for c in snapshot.stop_coordinate(snapshot.stop_id("Airport"))))
+    snapshot.close()
+
+  def test_graph_from_snapshot(self):
+    write_snapshot(self.path, _ROUTES_CONTAINING_STOP_NOMINAL)
+    snapshot = Snapshot(self.path)
+    graph_snapshot = TransitGraph.from_snapshot(snapshot)
+    graph_dict = TransitGraph(_ROUTES_CONTAINING_STOP_NOMINAL)
+    for attr in TransitGraph.__slots__:
+      if attr != "version": # Every graph gets its own version.
+        self.assertEqual(getattr(graph_snapshot, attr), getattr(graph_dict, attr))
+    self.assertNotEqual(graph_snapshot.version, graph_dict.version)
+    snapshot.close()
+
+  def test_rejects_other_files(self):
+    with open(self.path, "wb") as f:
+      f.write(b"\0" * 64)
+    with self.assertRaises(ValueError):
+      Snapshot(self.path)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,54 @@
+import random, unittest
+
+from test.stub_api import FIXTURE_STOPS
+from utils.routing import TransitGraph, find_coarse_route
+from utils.spatial import *
+from utils.utils import haversine_distance
+
+
+_COORDINATES = {name: (lat, lng) for stops in FIXTURE_STOPS.values() for name, lat, lng in stops}
+
+
+class StopIndexTest(unittest.TestCase):
+  def test_matches_linear_scan(self):
+    rng = random.Random(0)
+    coordinates = {"Stop {}".format(i): (42.1 + 0.4 * rng.random(), -71.3 + 0.4 * rng.random()) for i in range(2000)}
+    index = StopIndex(coordinates)
+
+    for _ in range(100):
+      lat, lng = 42.1 + 0.4 * rng.random(), -71.3 + 0.4 * rng.random()
+      k = rng.randint(1, 8)
+      expected = sorted((haversine_distance(c[1], c[0], lng, lat), name) for name, c in coordinates.items())[:k]
+      actual = index.nearest_stops(lat, lng, k=k)
+      self.assertEqual([name for _, name in expected], [name for name, _ in actual])
+      for (distance_expected, _), (_, distance_actual) in zip(expected, actual):
+        self.assertAlmostEqual(distance_expected, distance_actual, places=6)
+
+  def test_accept_filter(self):
+    index = StopIndex(_COORDINATES)
+    self.assertEqual(index.nearest_stops(42.3589, -71.0576)[0], ("State", 0.0))
+    nearest = index.nearest_stops(42.3589, -71.0576, k=2, accept={"Wonderland", "Alewife"})
+    self.assertEqual([name for name, _ in nearest], ["Alewife", "Wonderland"])
+    self.assertEqual(StopIndex({}).nearest_stops(42.0, -71.0), [])
+
+  def test_find_coarse_route_with_coordinates(self):
+    routes_containing_stop = {}
+    for route_id, stops in FIXTURE_STOPS.items():
+      for name, _, _ in stops:
+        routes_containing_stop.setdefault(name, set()).add(route_id)
+    graph = TransitGraph(routes_containing_stop)
+
+    # Near Airport and Alewife.
+    is_feasible, S = find_coarse_route((42.375, -71.03), (42.395, -71.14), graph, stop_index=StopIndex(_COORDINATES))
+    self.assertTrue(is_feasible)
+    self.assertEqual(S[0].connect_stop, "Airport")
+    self.assertEqual(S[-1].name, "Red")
+
+  def test_parse_coordinates(self):
+    self.assertEqual(parse_coordinates("42.3601,-71.0589"), (42.3601, -71.0589))
+    self.assertEqual(parse_coordinates(" 42.36 , -71 "), (42.36, -71.0))
+    self.assertIsNone(parse_coordinates("Kendall/MIT"))
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,42 @@
+import os, subprocess, sys, unittest
+
+from utils.routing import load_snapshot
+
+
+# Modules that a query on a cached network shouldn't load (see the NOTEs in routing_main.py and utils/routing.py).
+_HEAVY_MODULES = ["requests", "jsonpointer", "numpy", "multiprocessing", "concurrent.futures", "json", "csv",
+                  "utils.mbta_api", "utils.gtfs", "utils.raptor", "utils.batch", "utils.stop_names", "utils.pareto"]
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def loaded_heavy_modules(code):
+  """
+  Runs code in a fresh interpreter, and returns which of _HEAVY_MODULES it imported.
+  """
+  script = code + "\nimport sys\nprint(' '.join(['LOADED:'] + [m for m in {!r} if m in sys.modules]))".format(
+      _HEAVY_MODULES)
+  result = subprocess.run([sys.executable, "-c", script], cwd=_ROOT, stdout=subprocess.PIPE, check=True,
+                          universal_newlines=True)
+  return result.stdout.splitlines()[-1].split()[1:]
+
+
+class StartupTest(unittest.TestCase):
+  def test_import_is_minimal(self):
+    self.assertEqual(loaded_heavy_modules("import routing_main"), [])
+
+  def test_cached_query_is_minimal(self):
+    load_snapshot("nominal", allow_cache=True, verbose=False) # Make sure the network is cached.
+    code = "\n".join([
+      "import runpy, sys",
+      "sys.argv = ['routing_main.py', '--A', 'Wonderland', '--B', 'Alewife']",
+      "runpy.run_path('routing_main.py', run_name='__main__')"])
+    self.assertEqual(loaded_heavy_modules(code), [])
+
+    # Options that need more modules still get them.
+    code = code.replace("'Alewife'", "'Alewfe'")
+    self.assertEqual(loaded_heavy_modules(code), ["utils.stop_names"])
+
+
+if __name__ == "__main__":
+  unittest.main()
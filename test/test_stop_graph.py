@@ -0,0 +1,61 @@
+import unittest
+
+from test.stub_api import FIXTURE_STOPS
+from utils.stop_graph import *
+from utils.utils import haversine_distance
+
+
+_ORDERED_STOP_NAMES = {route_id: [name for name, _, _ in stops] for route_id, stops in FIXTURE_STOPS.items()}
+_COORDINATES = {name: (lat, lng) for stops in FIXTURE_STOPS.values() for name, lat, lng in stops}
+
+
+class StopGraphTest(unittest.TestCase):
+  def setUp(self):
+    self.graph = StopGraph(_ORDERED_STOP_NAMES, _COORDINATES, transfer_penalty_km=0.5)
+
+  def test_distance_matches_haversine(self):
+    for stop_i in ["Wonderland", "State"]:
+      for stop_j in ["Alewife", "Braintree"]:
+        lat_i, lng_i = _COORDINATES[stop_i]
+        lat_j, lng_j = _COORDINATES[stop_j]
+        self.assertAlmostEqual(self.graph.distance(self.graph.stop_ids[stop_i], self.graph.stop_ids[stop_j]),
+                               haversine_distance(lng_i, lat_i, lng_j, lat_j))
+
+  def test_wonderland_to_alewife(self):
+    is_feasible, legs, cost, _ = self.graph.shortest_path("Wonderland", "Alewife")
+    self.assertTrue(is_feasible)
+    self.assertEqual([leg.route for leg in legs], ["Blue", "Orange", "Red"])
+    self.assertEqual([(leg.board_stop, leg.alight_stop) for leg in legs],
+                     [("Wonderland", "State"), ("State", "Downtown Crossing"), ("Downtown Crossing", "Alewife")])
+    self.assertEqual(legs[0].num_stops, 2)
+    self.assertAlmostEqual(cost, sum(leg.distance_km for leg in legs) + 2 * 0.5)
+
+  def test_transfer_penalty(self):
+    """
+    With a huge transfer penalty, staying on one route wins even when it's longer.
+    """
+    graph = StopGraph({"A": ["X", "Y", "Z"], "B": ["X", "Z"]},
+                      {"X": (42.0, -71.0), "Y": (42.1, -71.0), "Z": (42.0, -71.01)}, transfer_penalty_km=100)
+    _, legs, _, _ = graph.shortest_path("Y", "X")
+    self.assertEqual([leg.route for leg in legs], ["A"])
+    _, legs, _, _ = graph.shortest_path("Y", "Z")
+    self.assertEqual([leg.route for leg in legs], ["A"])
+
+  def test_astar_matches_dijkstra(self):
+    for stop_A in self.graph.stop_names:
+      for stop_B in self.graph.stop_names:
+        feasible_d, _, cost_d, expanded_d = self.graph.shortest_path(stop_A, stop_B, use_astar=False)
+        feasible_a, _, cost_a, expanded_a = self.graph.shortest_path(stop_A, stop_B, use_astar=True)
+        self.assertEqual(feasible_a, feasible_d)
+        self.assertAlmostEqual(cost_a, cost_d)
+        self.assertLessEqual(expanded_a, expanded_d)
+
+  def test_edge_cases(self):
+    self.assertEqual(self.graph.shortest_path("State", "State"), (True, [], 0.0, 0))
+    self.assertFalse(self.graph.shortest_path("State", "Nowhere")[0])
+    with self.assertRaises(ValueError):
+      StopGraph({"A": ["X", "Y"]}, {"X": (42.0, -71.0)})
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+from test.stub_api import FIXTURE_STOPS
+from utils.stop_names import *
+
+
+_STOP_NAMES = sorted({name for stops in FIXTURE_STOPS.values() for name, _, _ in stops} |
+                     {"Kendall/MIT", "Boston College", "Boston University Central", "Government Center", "Park Street"})
+
+
+class StopNameResolverTest(unittest.TestCase):
+  def setUp(self):
+    self.resolver = StopNameResolver(_STOP_NAMES)
+
+  def test_normalize_name(self):
+    self.assertEqual(normalize_name("Kendall/MIT"), "kendall mit")
+    self.assertEqual(normalize_name("  Park   Street "), "park street")
+    self.assertEqual(normalize_name("Café"), "cafe")
+    self.assertEqual(trigrams("mit"), {"  m", " mi", "mit", "it "})
+
+  def test_exact_match(self):
+    self.assertEqual(self.resolver.resolve("Park Street")[0], ("Park Street", 1.0))
+    self.assertEqual(self.resolver.resolve("kendall mit")[0], ("Kendall/MIT", 1.0))
+
+  def test_typos(self):
+    for query, expected in [("Kendal MIT", "Kendall/MIT"), ("Bostn Colege", "Boston College"),
+                            ("Govt Center", "Government Center"), ("Alewif", "Alewife")]:
+      name, score = self.resolver.resolve(query)[0]
+      self.assertEqual(name, expected)
+      self.assertLess(score, 1.0)
+
+  def test_prefix(self):
+    self.assertEqual(self.resolver.resolve("boston col")[0][0], "Boston College")
+    self.assertEqual(self.resolver.complete("mit"), ["Kendall/MIT"])
+    self.assertEqual(self.resolver.complete("Boston"), ["Boston College", "Boston University Central"])
+    self.assertEqual(self.resolver.complete("center", k=1), ["Government Center"])
+
+  def test_no_match(self):
+    self.assertEqual(self.resolver.resolve("xyz"), [])
+    self.assertEqual(self.resolver.resolve(" / "), [])
+    self.assertEqual(self.resolver.complete(""), [])
+    self.assertEqual(StopNameResolver([]).resolve("Park"), [])
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,75 @@
+import os, tempfile, unittest
+
+from utils.routing import *
+from utils.transfer_table import *
+
+
+_GRAPH_NOMINAL = TransitGraph(preprocess_nominal(allow_cache=True))
+_GRAPH_COVID = TransitGraph(preprocess_covid(allow_cache=True))
+
+
+class TransferTableTest(unittest.TestCase):
+  def check_all_pairs(self, graph):
+    """
+    Every pair should have the same feasibility and number of transfers as find_coarse_route,
+    and each transfer should happen at a stop that both routes visit.
+    """
+    table = TransferTable.build(graph)
+    for stop_A in graph.stop_names:
+      for stop_B in graph.stop_names:
+        if stop_A == stop_B:
+          continue
+        is_feasible_bfs, S_bfs = find_coarse_route(stop_A, stop_B, graph)
+        is_feasible, S = table.lookup(stop_A, stop_B)
+        self.assertEqual(is_feasible, is_feasible_bfs)
+        self.assertEqual(len(S), len(S_bfs))
+        if not is_feasible:
+          continue
+        self.assertIn(S[0].name, graph.routes_at(stop_A))
+        self.assertIn(S[-1].name, graph.routes_at(stop_B))
+        self.assertEqual(S[0].connect_stop, stop_A)
+        for node in S[1:]:
+          self.assertIn(node.name, graph.routes_at(node.connect_stop))
+          self.assertIn(node.parent_node.name, graph.routes_at(node.connect_stop))
+
+  def test_all_pairs_nominal(self):
+    self.check_all_pairs(_GRAPH_NOMINAL)
+
+  def test_all_pairs_covid(self):
+    self.check_all_pairs(_GRAPH_COVID)
+
+  def test_red_to_green_B(self):
+    table = TransferTable.build(_GRAPH_NOMINAL)
+    is_feasible, S = table.lookup("Kendall/MIT", "Boston College")
+    self.assertTrue(is_feasible)
+    self.assertEqual([n.name for n in S], ["Red Line", "Green Line B"])
+    self.assertEqual(S[1].connect_stop, "Park Street")
+
+  def test_only_route_pairs_are_stored(self):
+    table = TransferTable.build(_GRAPH_NOMINAL)
+    num_routes = len(_GRAPH_NOMINAL.route_names)
+    for values in [table.transfers, table.parent_route, table.parent_stop]:
+      self.assertEqual(len(values), num_routes * num_routes)
+
+    # "b" is on both R and B, and the best pair of routes is picked when the stop is looked up.
+    table = TransferTable.build(TransitGraph({"a": {"R"}, "b": {"R", "B"}, "c": {"G"}, "d": {"G", "B"}}))
+    self.assertEqual([n.name for n in table.lookup("b", "c")[1]], ["B", "G"])
+    self.assertEqual([(n.name, n.connect_stop) for n in table.lookup("a", "c")[1]],
+                     [("R", "a"), ("B", "b"), ("G", "d")])
+    self.assertEqual(table.lookup("a", "b")[1][0].name, "R")
+
+  def test_load_rejects_changed_routes(self):
+    folder = tempfile.TemporaryDirectory()
+    path = os.path.join(folder.name, "table.pkl")
+    TransferTable.build(TransitGraph({"a": {"R"}, "b": {"R", "G"}, "c": {"G"}})).save(path)
+
+    # Same stop and route names, but different routes visit each stop.
+    graph = TransitGraph({"a": {"R", "G"}, "b": {"R"}, "c": {"G"}})
+    self.assertIsNone(TransferTable.load(path, graph))
+    table = TransferTable.load(path, TransitGraph({"a": {"R"}, "b": {"R", "G"}, "c": {"G"}}))
+    self.assertEqual([n.name for n in table.lookup("a", "c")[1]], ["R", "G"])
+    folder.cleanup()
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,79 @@
+import random, unittest
+
+from jsonpointer import JsonPointerException, resolve_pointer
+
+from utils.utils import *
+from mbta_main import compute_route_distances
+from test.stub_api import fixture_response
+
+
+_STOPS_JSON = {"data": [
+  {"id": "place-wondl", "attributes": {"name": "Wonderland", "latitude": 42.4134, "longitude": -70.9916,
+                                       "tags": ["north", "blue"], "a/b": 1, "m~n": 2}},
+  {"id": "place-state", "attributes": {"name": "State", "latitude": 42.3589, "longitude": -71.0576,
+                                       "tags": ["downtown"], "a/b": 3, "m~n": 4}},
+]}
+
+
+class CompiledPointerTest(unittest.TestCase):
+  def test_matches_resolve_pointer(self):
+    for ptr in ["", "/id", "/attributes/name", "/attributes/tags/0", "/attributes/a~1b", "/attributes/m~0n"]:
+      getter = compile_pointer(ptr)
+      for obj in _STOPS_JSON["data"]:
+        self.assertEqual(getter(obj), resolve_pointer(obj, ptr))
+
+  def test_missing_attribute_raises(self):
+    with self.assertRaises(JsonPointerException):
+      compile_pointer("/attributes/missing")(_STOPS_JSON["data"][0])
+    with self.assertRaises(JsonPointerException):
+      compile_pointer("/attributes/tags/5")(_STOPS_JSON["data"][0])
+
+  def test_project_and_strip(self):
+    self.assertEqual(strip_attributes(_STOPS_JSON, "/attributes/name"), ["Wonderland", "State"])
+    self.assertEqual(project_attributes(_STOPS_JSON, ["/id", "/attributes/latitude"]),
+                     [("place-wondl", 42.4134), ("place-state", 42.3589)])
+    self.assertEqual(set(index_by_attribute(_STOPS_JSON, "/attributes/name")), {"Wonderland", "State"})
+
+
+class HaversineTest(unittest.TestCase):
+  def setUp(self):
+    rng = random.Random(0)
+    self.lons = [-71.3 + 0.4 * rng.random() for _ in range(50)]
+    self.lats = [42.1 + 0.4 * rng.random() for _ in range(50)]
+
+  def test_many_matches_scalar(self):
+    distances = haversine_many(self.lons, self.lats, self.lons[0], self.lats[0])
+    for i in range(len(self.lons)):
+      self.assertAlmostEqual(distances[i], haversine_distance(self.lons[i], self.lats[i], self.lons[0], self.lats[0]), places=9)
+
+  def test_matrix_matches_scalar(self):
+    distances = haversine_matrix(self.lons, self.lats, self.lons[:7], self.lats[:7])
+    self.assertEqual(distances.shape, (50, 7))
+    for i in range(50):
+      for j in range(7):
+        self.assertAlmostEqual(distances[i, j], haversine_distance(self.lons[i], self.lats[i], self.lons[j], self.lats[j]), places=9)
+
+    # Square matrix, and float32 output (accurate to well under a meter at city scale).
+    square = haversine_matrix(self.lons, self.lats, float32=True)
+    self.assertEqual(str(square.dtype), "float32")
+    self.assertEqual(square.shape, (50, 50))
+    for i in range(50):
+      self.assertEqual(square[i, i], 0)
+      for j in range(50):
+        self.assertLess(abs(square[i, j] - haversine_distance(self.lons[i], self.lats[i], self.lons[j], self.lats[j])), 1e-4)
+
+  def test_compute_route_distances(self):
+    stops_by_name = index_by_attribute(fixture_response("/stops", {}), "/attributes/name")
+    routes_by_name = index_by_attribute(fixture_response("/routes", {"filter[type]": "0,1"}), "/attributes/long_name")
+    route_distances = compute_route_distances(stops_by_name, routes_by_name)
+
+    # "Ashmont/Braintree" is split, and Ashmont isn't a stop in the fixture, so Braintree is the endpoint.
+    distance_km, stop_A, stop_B = route_distances["Red Line"]
+    self.assertEqual((stop_A, stop_B), ("Braintree", "Alewife"))
+    lat_A, lng_A = [stops_by_name["Braintree"]["attributes"][k] for k in ("latitude", "longitude")]
+    lat_B, lng_B = [stops_by_name["Alewife"]["attributes"][k] for k in ("latitude", "longitude")]
+    self.assertAlmostEqual(distance_km, haversine_distance(lng_A, lat_A, lng_B, lat_B))
+
+
+if __name__ == "__main__":
+  unittest.main()
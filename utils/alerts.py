@@ -0,0 +1,230 @@
+import json, threading, time
+from datetime import datetime
+
+import requests
+
+from utils import profiling
+from utils.mbta_api import MBTA_API_URL
+
+
+# Alert effects that close the stops they name, suspend a route at the stops they name, or replace a
+# route with shuttle buses between the stops they name. Other effects (delays, detours, elevator outages, ...)
+# don't change which routes serve which stops, so they're ignored.
+CLOSURE_EFFECTS = ("STATION_CLOSURE", "STOP_CLOSURE", "DOCK_CLOSURE")
+SUSPENSION_EFFECTS = ("SUSPENSION",)
+SHUTTLE_EFFECTS = ("SHUTTLE",)
+
+
+def iter_sse_events(lines):
+  """
+  Parses a server-sent event stream.
+
+  lines (iterable) : Lines of the stream (str or bytes), without their line endings.
+
+  Yields (event type, data) for every event, once the blank line that ends it arrives. Comments (i.e
+  keep-alives) and fields other than "event" and "data" are skipped.
+  """
+  event, data = None, []
+  for line in lines:
+    if isinstance(line, bytes):
+      line = line.decode("utf-8")
+    line = line.rstrip("\r\n")
+    if len(line) == 0:
+      if len(data) > 0:
+        yield (event or "message"), "\n".join(data)
+      event, data = None, []
+      continue
+    if line.startswith(":"):
+      continue
+    field, _, value = line.partition(":")
+    value = value[1:] if value.startswith(" ") else value
+    if field == "event":
+      event = value
+    elif field == "data":
+      data.append(value)
+
+
+def _timestamp(value):
+  return datetime.fromisoformat(value).timestamp() if value is not None else None
+
+
+def is_active(alert, now):
+  """
+  Whether an alert is in effect at time now (seconds since the epoch). An alert without any active periods
+  is always in effect, and a period without an end hasn't ended.
+  """
+  periods = alert["attributes"].get("active_period") or []
+  if len(periods) == 0:
+    return True
+  for period in periods:
+    start, end = _timestamp(period.get("start")), _timestamp(period.get("end"))
+    if (start is None or start <= now) and (end is None or now < end):
+      return True
+  return False
+
+
+def alert_closures(alerts, network, stop_names=None, route_names=None, now=None):
+  """
+  Works out the service changes that a set of alerts make to a network.
+
+  alerts (iterable) : Alert resources from the MBTA API (dicts with "id" and "attributes").
+  network (ClosableNetwork) : The network the alerts apply to. Only used to look up the order of the stops
+                              along each route.
+  stop_names (dict or None) : Maps stop IDs in the alerts (i.e "place-pktrm") to stop names in the network.
+                              IDs that aren't in it are used as names.
+  route_names (dict or None) : Maps route IDs in the alerts (i.e "Red") to route names in the network.
+                               IDs that aren't in it are used as names.
+  now (float or None) : Alerts that aren't active at this time are ignored. Defaults to time.time().
+
+  Returns:
+    (set) Names of the closed stops
+    (set) (route name, stop name) pairs where a route is suspended or replaced by a shuttle
+    (dict) Maps the name of every shuttle route (i.e "Red Line Shuttle") to its stop names in order
+  """
+  stop_names, route_names = stop_names or {}, route_names or {}
+  now = time.time() if now is None else now
+
+  closed, suspended, shuttles = set(), set(), {}
+  for alert in sorted(alerts, key=lambda alert: alert["id"]):
+    attributes = alert["attributes"]
+    effect = attributes.get("effect")
+    if effect not in CLOSURE_EFFECTS + SUSPENSION_EFFECTS + SHUTTLE_EFFECTS or not is_active(alert, now):
+      continue
+
+    stops_of_route = {}
+    for entity in attributes.get("informed_entity") or []:
+      if entity.get("stop") is None:
+        continue
+      stop = stop_names.get(entity["stop"], entity["stop"])
+      if effect in CLOSURE_EFFECTS:
+        closed.add(stop)
+      elif entity.get("route") is not None:
+        stops_of_route.setdefault(route_names.get(entity["route"], entity["route"]), set()).add(stop)
+
+    for route, stops in sorted(stops_of_route.items()):
+      ordered = [stop for stop in network.ordered_stop_names.get(route, []) if stop in stops]
+      if effect in SUSPENSION_EFFECTS:
+        suspended.update((route, stop) for stop in ordered)
+      elif len(ordered) >= 2:
+        # The route still serves the ends of the shuttle, which is where riders transfer to and from the bus.
+        suspended.update((route, stop) for stop in ordered[1:-1])
+        name = "{} Shuttle".format(route)
+        i = 2
+        while name in shuttles:
+          name = "{} Shuttle {}".format(route, i)
+          i += 1
+        shuttles[name] = ordered
+
+  return closed, suspended, shuttles
+
+
+class AlertConsumer(object):
+  """
+  Applies the alerts from an MBTA-style event stream (GET /alerts with Accept: text/event-stream) to a
+  ClosableNetwork as they arrive.
+
+  The stream starts with a "reset" event that holds every alert, followed by "add", "update" and "remove"
+  events for single alerts. After every event, the closures from all of the active alerts are applied to
+  the network with ClosableNetwork.set_state, which swaps in the new graph in one step. Queries that read
+  network.graph on other threads keep running on the graph they started with, and see the change on
+  their next read.
+
+  network (ClosableNetwork) : The network to update. The consumer should be the only thing changing it.
+  stop_names (dict or None) : Maps stop IDs to stop names (see alert_closures).
+  route_names (dict or None) : Maps route IDs to route names (see alert_closures).
+  on_update (function or None) : Called as on_update(changed stop names) after every event that changes
+                                 the graph (i.e to hand network.graph to a RoutingService).
+  """
+  def __init__(self, network, stop_names=None, route_names=None, on_update=None):
+    self.network = network
+    self.stop_names = stop_names
+    self.route_names = route_names
+    self.on_update = on_update
+    self.alerts = {}
+    self.num_events = 0
+    self.num_updates = 0
+    self.num_skipped = 0
+    self.stopped = threading.Event()
+
+  def handle(self, event, data):
+    """
+    Applies one event. data is the decoded JSON of the event. If the event (or an alert in it) doesn't have
+    the shape of an alert resource, the error is raised and the alerts are left as they were.
+
+    Returns (set) : Names of the stops whose routes changed.
+    """
+    if event == "reset":
+      alerts = {alert["id"]: alert for alert in data}
+    elif event in ("add", "update"):
+      alerts = dict(self.alerts)
+      alerts[data["id"]] = data
+    elif event == "remove":
+      alerts = dict(self.alerts)
+      alerts.pop(data["id"], None)
+    else:
+      return set()
+    changed = self.refresh(alerts)
+    self.num_events += 1
+    return changed
+
+  def refresh(self, alerts=None):
+    """
+    Re-applies the current alerts (or replaces them with alerts). Besides handle(), this should be called
+    now and then, so that alerts whose active periods start or end while the stream is quiet take effect.
+    """
+    alerts = self.alerts if alerts is None else alerts
+    with profiling.timed("alert_update"):
+      closed, suspended, shuttles = alert_closures(alerts.values(), self.network, self.stop_names, self.route_names)
+      self.alerts = alerts
+      changed = self.network.set_state(closed, suspended, shuttles)
+    if len(changed) > 0:
+      self.num_updates += 1
+      if self.on_update is not None:
+        self.on_update(changed)
+    return changed
+
+  def consume(self, lines):
+    """
+    Applies every event in a stream of lines (see iter_sse_events), until it ends or stop() is called.
+    Events that can't be applied (invalid JSON, or alerts without the expected fields) are skipped.
+    """
+    for event, data in iter_sse_events(lines):
+      if self.stopped.is_set():
+        break
+      try:
+        self.handle(event, json.loads(data))
+      except (KeyError, TypeError, AttributeError, ValueError) as e:
+        self.num_skipped += 1
+        print("WARNING: Skipping malformed \"{}\" alert event ({}: {})".format(event, type(e).__name__, e))
+
+  def run(self, base_url=MBTA_API_URL, params=None, reconnect_delay=1.0):
+    """
+    Consumes the alert stream of an API until stop() is called, reconnecting whenever the connection drops.
+    Every connection starts with a "reset", so nothing is missed while reconnecting.
+    """
+    session = requests.Session()
+    while not self.stopped.is_set():
+      try:
+        # NOTE: The stream isn't gzipped, so that every event can be decoded as soon as it arrives.
+        with session.get(base_url.rstrip("/") + "/alerts", params=params, stream=True, timeout=(10, None),
+                         headers={"Accept": "text/event-stream", "Accept-Encoding": "identity"}) as r:
+          r.raise_for_status()
+          self.consume(r.iter_lines(chunk_size=None))
+      except (requests.exceptions.RequestException, ValueError) as e:
+        print("WARNING: Alert stream failed ({}), reconnecting".format(e))
+      self.stopped.wait(reconnect_delay)
+    session.close()
+
+  def start(self, base_url=MBTA_API_URL, params=None, reconnect_delay=1.0):
+    """
+    Runs the consumer on a daemon thread, and returns the thread.
+    """
+    thread = threading.Thread(target=self.run, args=(base_url, params, reconnect_delay), daemon=True)
+    thread.start()
+    return thread
+
+  def stop(self):
+    """
+    Stops the consumer after the event it's waiting for (or the next reconnect).
+    """
+    self.stopped.set()
@@ -0,0 +1,155 @@
+import csv, json, os, sys, tempfile
+from itertools import islice
+
+from utils.route_cache import RouteCache
+from utils.routing import TransitGraph
+from utils.snapshot import Snapshot
+from utils.transfer_table import TransferTable, preprocess_transfer_table, transfer_table_path
+
+
+def read_queries(path):
+  """
+  Lazily yields (stop_A, stop_B) pairs from a batch file.
+
+  path (str) : A CSV file with "A" and "B" header columns, or a JSONL file (.jsonl or .json) where each
+               line is an object like {"A": "Wonderland", "B": "Boston College"}. Use "-" to read JSONL
+               from stdin.
+  """
+  if path == "-" or path.endswith(".jsonl") or path.endswith(".json"):
+    f = sys.stdin if path == "-" else open(path, "r")
+    try:
+      for line in f:
+        line = line.strip()
+        if len(line) > 0:
+          query = json.loads(line)
+          yield query["A"], query["B"]
+    finally:
+      if f is not sys.stdin:
+        f.close()
+  else:
+    with open(path, "r", newline="") as f:
+      for row in csv.DictReader(f):
+        yield row["A"], row["B"]
+
+
+def route_to_json(stop_A, stop_B, route_fn, stops):
+  """
+  Routes a single pair and returns the result as a JSON-serializable dictionary.
+
+  route_fn (function) : Takes (stop_A, stop_B) and returns the same values as find_coarse_route.
+  stops (container) : The valid stop names. Invalid pairs are reported in the result instead of
+                      being passed to route_fn.
+  """
+  result = {"A": stop_A, "B": stop_B}
+  if stop_A not in stops or stop_B not in stops:
+    result["feasible"] = False
+    result["error"] = "Invalid or closed stop"
+    return result
+
+  is_feasible, S = route_fn(stop_A, stop_B) if stop_A != stop_B else (True, [])
+  result["feasible"] = is_feasible
+  result["routes"] = [{"name": node.name, "connect_stop": node.connect_stop} for node in S] if is_feasible else []
+  return result
+
+
+# Per-process state for worker pools, set up once by _init_worker.
+_WORKER_ROUTE_FN = None
+_WORKER_STOPS = None
+
+
+def _load_graph(network):
+  if isinstance(network, str):
+    snapshot = Snapshot(network)
+    graph = TransitGraph.from_snapshot(snapshot)
+    snapshot.close()
+    return graph
+  return TransitGraph(network)
+
+
+def _init_worker(network, table_path=None, route_cache_size=65536):
+  graph = _load_graph(network)
+  table = None
+  if table_path is not None:
+    table = TransferTable.load(table_path, graph)
+    if table is None:
+      table = TransferTable.build(graph) # Only if the file was replaced by a table for another network.
+  _use_graph(graph, table, route_cache_size)
+
+
+def _use_graph(graph, table, route_cache_size):
+  global _WORKER_ROUTE_FN, _WORKER_STOPS
+  _WORKER_STOPS = graph
+  if table is not None:
+    _WORKER_ROUTE_FN = table.lookup
+  else:
+    cache = RouteCache(max_entries=route_cache_size)
+    _WORKER_ROUTE_FN = lambda stop_A, stop_B: cache.find_coarse_route(stop_A, stop_B, graph)
+
+
+def _route_chunk(pairs):
+  return [json.dumps(route_to_json(stop_A, stop_B, _WORKER_ROUTE_FN, _WORKER_STOPS)) for stop_A, stop_B in pairs]
+
+
+def _chunks(iterable, size):
+  iterator = iter(iterable)
+  while True:
+    chunk = list(islice(iterator, size))
+    if len(chunk) == 0:
+      return
+    yield chunk
+
+
+def route_batch(queries, network, out, workers=1, precompute_all_pairs=False, chunk_size=1000, route_cache_size=65536,
+                network_name=None):
+  """
+  Streams (stop_A, stop_B) pairs through the router, and writes one JSON result per line to out.
+  Results are written in the same order as the queries.
+
+  queries (iterable) : Yields (stop_A, stop_B) pairs (see read_queries).
+  network (dict or str) : Output of preprocess_nominal/preprocess_covid, or the path to a network snapshot.
+  out (file) : Where to write JSONL results.
+  workers (int) : If greater than 1, route with a pool of this many processes. Each worker builds
+                  its own graph once, and queries are sent to workers in chunks.
+  precompute_all_pairs (bool) : If True, answer queries from a TransferTable. It's built (or loaded) once,
+                                and workers load it from disk instead of building their own.
+  route_cache_size (int) : Otherwise, searches are memoized in a RouteCache of this many entries (per worker),
+                           so pairs of stops with the same routes only cost one search.
+  network_name (str) : Name of the network (i.e "nominal" or "covid"). If given, the TransferTable is cached
+                       in the output folder (see preprocess_transfer_table). Otherwise, it's saved to a
+                       temporary file for the workers.
+
+  Returns (int) : The number of pairs that were routed.
+  """
+  num_routed = 0
+  graph, table, table_path, temp_dir = None, None, None, None
+
+  if precompute_all_pairs:
+    graph = _load_graph(network)
+    if network_name is not None:
+      table = preprocess_transfer_table(graph, network_name, allow_cache=True, verbose=False)
+      table_path = transfer_table_path(network_name)
+    else:
+      table = TransferTable.build(graph)
+      if workers > 1:
+        temp_dir = tempfile.TemporaryDirectory()
+        table_path = os.path.join(temp_dir.name, "transfer_table.pkl")
+        table.save(table_path)
+
+  try:
+    if workers > 1:
+      from multiprocessing import Pool # NOTE: Only loaded when a process pool is used.
+      with Pool(workers, initializer=_init_worker, initargs=(network, table_path, route_cache_size)) as pool:
+        for lines in pool.imap(_route_chunk, _chunks(queries, chunk_size)):
+          out.write("\n".join(lines) + "\n")
+          num_routed += len(lines)
+    else:
+      _use_graph(graph if graph is not None else _load_graph(network), table, route_cache_size)
+      for chunk in _chunks(queries, chunk_size):
+        lines = _route_chunk(chunk)
+        out.write("\n".join(lines) + "\n")
+        num_routed += len(lines)
+  finally:
+    if temp_dir is not None:
+      temp_dir.cleanup()
+
+  return num_routed
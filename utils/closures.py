@@ -0,0 +1,186 @@
+from utils.routing import TransitGraph
+
+
+class ClosableNetwork(object):
+  """
+  A network where individual stops can be closed and reopened, without re-fetching or rebuilding it.
+
+  Like preprocess_covid, each route is broken into connected components around its closed stops, and each
+  component becomes a separate node in the route graph (i.e "Green Line C-1"). A route without any closures
+  keeps its original name. When stops are closed or reopened, only the routes that visit those stops are
+  split again, and the TransitGraph is patched with TransitGraph.updated().
+
+  Service changes that aren't whole-stop closures can be applied too (see set_state): a route can skip
+  some of its stops (i.e trains replaced by shuttle buses), and extra routes (i.e the shuttle buses) can be
+  added and removed.
+
+  Readers should grab self.graph once per query. Every change swaps in a new graph, so a query never sees
+  a half-applied change. Only one thread should make changes.
+
+  ordered_stop_names (dict) : Maps each route name to its stop names, in order along the route (i.e the
+                              first output of fetch_ordered_stops).
+  branch_links (dict or None) : Maps route names to extra (stop, stop) pairs that are adjacent along the route
+                                even though they aren't consecutive in the ordering (i.e where a line branches).
+  closed (iterable) : Stop names that start out closed.
+  """
+  def __init__(self, ordered_stop_names, branch_links=None, closed=()):
+    self.ordered_stop_names = {}
+    self.closed = set()
+    self.suspended = set()
+    self.extra_routes = {}
+
+    # Neighbors of each stop along each route, and the routes that visit each stop.
+    self.neighbors = {}
+    self.routes_of_stop = {}
+    for route, stops in ordered_stop_names.items():
+      self._add_route(route, stops, (branch_links or {}).get(route, []))
+
+    # Name of the component that each (route, stop) belongs to right now.
+    self.component_of = {}
+    for route in self.ordered_stop_names:
+      self.component_of.update(self._split(route))
+
+    self.graph = TransitGraph(self.routes_containing_stop())
+
+    if len(closed) > 0:
+      self.close(closed)
+
+  def _add_route(self, route, stops, links=()):
+    self.ordered_stop_names[route] = list(stops)
+    neighbors = {stop: [] for stop in stops}
+    for stop_i, stop_j in list(zip(stops[:-1], stops[1:])) + list(links):
+      neighbors[stop_i].append(stop_j)
+      neighbors[stop_j].append(stop_i)
+    self.neighbors[route] = neighbors
+    for stop in stops:
+      self.routes_of_stop.setdefault(stop, []).append(route)
+
+  def _remove_route(self, route):
+    for stop in self.ordered_stop_names.pop(route):
+      self.routes_of_stop[stop].remove(route)
+      self.component_of.pop((route, stop), None)
+    del self.neighbors[route]
+
+  def _is_open(self, route, stop):
+    return stop not in self.closed and (route, stop) not in self.suspended
+
+  def _split(self, route):
+    """
+    Finds the connected components of the open stops along a route (skipping any that are suspended on
+    it). Returns a dict that maps each (route, stop) to its component name, numbered in order of the first
+    stop in each component.
+    """
+    neighbors = self.neighbors[route]
+    components = []
+    seen = set()
+    for stop in self.ordered_stop_names[route]:
+      if stop in seen or not self._is_open(route, stop):
+        continue
+      component, stack = [], [stop]
+      seen.add(stop)
+      while len(stack) > 0:
+        current = stack.pop()
+        component.append(current)
+        for other in neighbors[current]:
+          if other not in seen and self._is_open(route, other):
+            seen.add(other)
+            stack.append(other)
+      components.append(component)
+
+    if len(components) == 1:
+      return {(route, stop): route for stop in components[0]}
+    return {(route, stop): "{}-{}".format(route, i) for i, component in enumerate(components) for stop in component}
+
+  def _routes_at(self, stop):
+    if stop in self.closed:
+      return set()
+    return {self.component_of[(route, stop)] for route in self.routes_of_stop[stop] if (route, stop) in self.component_of}
+
+  def routes_containing_stop(self):
+    """
+    Returns the same dictionary that preprocess_nominal/preprocess_covid return, for the open stops.
+    """
+    return {stop: self._routes_at(stop) for stop in self.routes_of_stop if stop not in self.closed}
+
+  def set_closed(self, closed):
+    """
+    Changes the set of closed stops, updating only the routes that visit stops that were closed or reopened.
+
+    closed (iterable) : Names of every stop that should be closed. Unknown names are ignored.
+
+    Returns (set) : Names of the stops whose routes changed.
+    """
+    return self.set_state(closed, self.suspended)
+
+  def set_state(self, closed, suspended=(), extra_routes=None):
+    """
+    Changes the closed stops, the stops that routes skip, and the extra routes all at once, with a single
+    swap of self.graph. Only the routes touched by the change are split again.
+
+    closed (iterable) : Names of every stop that should be closed. Unknown names are ignored.
+    suspended (iterable) : Every (route, stop) pair where the route should skip the stop, while other routes
+                           still serve it (i.e trains replaced by a shuttle). Unknown pairs are ignored.
+    extra_routes (dict or None) : Maps the name of every extra route (i.e "Red Line Shuttle") to its stop
+                                  names in order. Extra routes that aren't in it are removed. If None, the
+                                  extra routes are left as they are.
+
+    Returns (set) : Names of the stops whose routes changed.
+    """
+    affected_routes, affected_stops = set(), set()
+    if extra_routes is not None:
+      for route in extra_routes:
+        if route in self.ordered_stop_names and route not in self.extra_routes:
+          raise ValueError("Extra route {} has the same name as a route in the network".format(route))
+      for route in [route for route in self.extra_routes if extra_routes.get(route) != self.extra_routes[route]]:
+        affected_stops.update(self.ordered_stop_names[route])
+        self._remove_route(route)
+        del self.extra_routes[route]
+      for route, stops in extra_routes.items():
+        if route in self.extra_routes:
+          continue
+        self._add_route(route, stops)
+        self.extra_routes[route] = list(stops)
+        affected_routes.add(route)
+
+    closed = {stop for stop in closed if stop in self.routes_of_stop}
+    suspended = {(route, stop) for route, stop in suspended if stop in self.neighbors.get(route, ())}
+    affected_routes.update(route for stop in closed.symmetric_difference(self.closed) for route in self.routes_of_stop[stop])
+    affected_routes.update(route for route, _ in suspended.symmetric_difference(self.suspended)
+                           if route in self.ordered_stop_names)
+    self.closed = closed
+    self.suspended = suspended
+    if len(affected_routes) == 0 and len(affected_stops) == 0:
+      return set()
+
+    # Re-split the affected routes. Any stop on them might have moved to a different component.
+    for route in affected_routes:
+      for key in [(route, stop) for stop in self.ordered_stop_names[route]]:
+        self.component_of.pop(key, None)
+      self.component_of.update(self._split(route))
+      affected_stops.update(self.ordered_stop_names[route])
+
+    changes = {}
+    for stop in affected_stops:
+      routes = self._routes_at(stop)
+      if stop in self.graph.stop_ids:
+        if routes != self.graph.routes_at(stop):
+          changes[stop] = routes
+      elif len(routes) > 0:
+        changes[stop] = routes
+
+    if len(changes) > 0:
+      self.graph = self.graph.updated(changes)
+
+    return set(changes)
+
+  def close(self, stops):
+    return self.set_closed(self.closed.union([stops] if isinstance(stops, str) else stops))
+
+  def reopen(self, stops):
+    return self.set_closed(self.closed.difference([stops] if isinstance(stops, str) else stops))
+
+  def close_where(self, is_closed):
+    """
+    Closes exactly the stops where is_closed(stop_name) is True (i.e check_covid_shutdown), and reopens the rest.
+    """
+    return self.set_closed(stop for stop in self.routes_of_stop if is_closed(stop))
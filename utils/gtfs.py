@@ -0,0 +1,216 @@
+import csv, io, sys, time, zipfile
+from collections import namedtuple
+from operator import itemgetter
+
+from utils.utils import merge_stop_patterns, unique_route_names
+
+
+# Route types in GTFS (and the MBTA API): 0 = light rail, 1 = subway, 2 = commuter rail, 3 = bus, 4 = ferry.
+RAPID_TRANSIT_ROUTE_TYPES = (0, 1)
+
+# Counts from reading a feed.
+# "stop_times_rows" is every row in stop_times.txt, and "trips" and "patterns" count the trips (and distinct
+# stop sequences) on the routes that were read.
+GtfsStats = namedtuple("GtfsStats", ["stop_times_rows", "trips", "patterns", "seconds"])
+
+
+def parse_gtfs_time(value):
+  """
+  Parses a GTFS time (HH:MM:SS, where HH can be 24 or more) into seconds after midnight.
+  """
+  hours, minutes, seconds = value.strip().split(":")
+  return 3600 * int(hours) + 60 * int(minutes) + int(seconds)
+
+
+def format_gtfs_time(seconds):
+  """
+  The inverse of parse_gtfs_time.
+  """
+  return "{:02d}:{:02d}:{:02d}".format(seconds // 3600, (seconds // 60) % 60, seconds % 60)
+
+
+def iter_gtfs_rows(archive, member, columns, optional_columns=()):
+  """
+  Streams rows from one file in a GTFS zip, using csv over the zip member (without extracting it), so
+  only one row is in memory at a time.
+
+  archive (zipfile.ZipFile) : The open feed.
+  member (str) : File name, i.e "stop_times.txt".
+  columns (list of str) : Columns to yield. A ValueError is raised if one is missing.
+  optional_columns (list of str) : More columns to yield, as "" if the file doesn't have them.
+
+  Yields (tuple) : The values of columns followed by optional_columns, for each row.
+  """
+  with archive.open(member) as raw:
+    # NOTE: utf-8-sig skips the byte order mark that some feeds start with.
+    reader = csv.reader(io.TextIOWrapper(raw, encoding="utf-8-sig", newline=""))
+    header = [name.strip() for name in next(reader, [])]
+    missing = [name for name in columns if name not in header]
+    if len(missing) > 0:
+      raise ValueError("{} is missing columns: {}".format(member, ", ".join(missing)))
+
+    # Optional columns that aren't in the file are read from an empty value appended to each row.
+    indices = [header.index(name) for name in columns] + \
+              [header.index(name) if name in header else len(header) for name in optional_columns]
+    get = itemgetter(*indices)
+    width = max(indices) + 1
+    for row in reader:
+      if len(row) == 0:
+        continue
+      if len(row) < width:
+        row += [""] * (width - len(row))
+      values = get(row)
+      yield values if len(indices) > 1 else (values,)
+
+
+def read_route_names(archive, route_names=None, route_types=None, verbose=True):
+  """
+  Picks the routes to read from routes.txt.
+
+  route_names (dict or None) : Maps the route IDs to read to the names to give them. If None, routes are
+                               picked by route_types and named with unique_route_names.
+  route_types (list of int or None) : Route types to read when route_names is None (None for every type).
+
+  Returns (dict) : Maps each route ID to read to its name.
+  """
+  routes = [(route_id, int(route_type) if route_type else None, short_name, long_name)
+            for route_id, route_type, short_name, long_name in iter_gtfs_rows(
+                archive, "routes.txt", ["route_id", "route_type"], ["route_short_name", "route_long_name"])]
+  if route_names is None:
+    return unique_route_names([route for route in routes if route_types is None or route[1] in route_types])
+  feed_route_ids = {route[0] for route in routes}
+  for route_id in route_names:
+    if route_id not in feed_route_ids and verbose:
+      print("WARNING: Route {} isn't in {}".format(route_id, archive.filename))
+  return route_names
+
+
+def read_stations(archive):
+  """
+  Names every stop in stops.txt after its parent station (if it has one), so that platforms of the same
+  station are one stop, like the API's stop names.
+
+  Returns:
+    (dict) Maps each stop ID to its station name.
+    (dict) Maps each station name to its (latitude, longitude).
+  """
+  stops = {}
+  for stop_id, name, lat, lon, parent in iter_gtfs_rows(
+      archive, "stops.txt", ["stop_id", "stop_name"], ["stop_lat", "stop_lon", "parent_station"]):
+    stops[stop_id] = (name, lat, lon, parent)
+  station_of_stop = {}
+  coordinates_of_station = {}
+  for stop_id, (name, lat, lon, parent) in stops.items():
+    station = parent if parent in stops else stop_id
+    station_name, station_lat, station_lon, _ = stops[station]
+    station_of_stop[stop_id] = sys.intern(station_name)
+    if station_lat and station_lon:
+      coordinates_of_station[station_of_stop[stop_id]] = (float(station_lat), float(station_lon))
+  return station_of_stop, coordinates_of_station
+
+
+def iter_trip_stop_times(archive, trips, columns=(), counts=None):
+  """
+  Streams stop_times.txt one trip at a time. A trip is finished when the next one starts, so this needs
+  stop_times.txt to be grouped by trip_id (feeds are written that way, including the MBTA's), and a
+  ValueError is raised if it isn't.
+
+  trips (dict or set) : IDs of the trips to yield. Rows of other trips are skipped.
+  columns (list of str) : More stop_times.txt columns to yield, after the stop ID.
+  counts (dict or None) : If given, counts["stop_times_rows"] is set to the number of rows read.
+
+  Yields:
+    (str) Trip ID.
+    (list of tuple) (stop sequence, stop ID, *columns) for each of the trip's stop times, in order.
+  """
+  finished = set()
+  current_trip, current_stop_times = None, None
+  num_rows = 0
+  for row in iter_gtfs_rows(archive, "stop_times.txt", ["trip_id", "stop_sequence", "stop_id"] + list(columns)):
+    num_rows += 1
+    trip_id = row[0]
+    if trip_id != current_trip:
+      if current_stop_times is not None:
+        current_stop_times.sort()
+        yield current_trip, current_stop_times
+        finished.add(current_trip)
+      current_trip, current_stop_times = trip_id, None
+      if trip_id in trips:
+        if trip_id in finished:
+          raise ValueError("stop_times.txt in {} isn't grouped by trip_id (trip {} appears twice)".format(
+              archive.filename, trip_id))
+        current_stop_times = []
+    if current_stop_times is not None:
+      current_stop_times.append((int(row[1]),) + row[2:])
+  if current_stop_times is not None:
+    current_stop_times.sort()
+    yield current_trip, current_stop_times
+  if counts is not None:
+    counts["stop_times_rows"] = num_rows
+
+
+def read_gtfs(path, route_names=None, route_types=RAPID_TRANSIT_ROUTE_TYPES, verbose=True):
+  """
+  Reads the ordered stops along each route from a GTFS static feed (i.e MBTA_GTFS.zip), as an offline
+  alternative to fetch_ordered_stops. Files are streamed from the zip with the csv module.
+
+  Stops are named after their parent station (see read_stations). Each route's order merges the stop
+  sequences of its trips in direction 0 (see merge_stop_patterns).
+
+  stop_times.txt can have millions of rows, so it's read one trip at a time (see iter_trip_stop_times) and
+  only the distinct stop sequences are kept. Memory grows with the number of trips (on the routes being
+  read) and stops, but not with stop_times.txt.
+
+  path (str) : Path to the zip.
+  route_names (dict or None) : Maps the route IDs to read to the names to give them. If None, routes are
+                               picked by route_types and named with unique_route_names.
+  route_types (list of int or None) : Route types to read when route_names is None (None for every type).
+
+  Returns:
+    (dict) Maps each route name to its stop names, in order along the route.
+    (dict) Maps each stop name to its (latitude, longitude).
+    (GtfsStats) Counts and timing, for reporting ingest throughput.
+  """
+  t0 = time.perf_counter()
+  counts = {}
+  with zipfile.ZipFile(path) as archive:
+    route_names = read_route_names(archive, route_names=route_names, route_types=route_types, verbose=verbose)
+    station_of_stop, coordinates_of_station = read_stations(archive)
+
+    # The route and direction of every trip on the routes being read (trips on the same route and direction
+    # share a key).
+    trip_key, keys = {}, {}
+    for trip_id, route_id, direction_id in iter_gtfs_rows(
+        archive, "trips.txt", ["trip_id", "route_id"], ["direction_id"]):
+      if route_id in route_names:
+        key = (route_id, direction_id or "0")
+        trip_key[trip_id] = keys.setdefault(key, key)
+
+    patterns = {} # (route ID, direction) => set of distinct stop sequences.
+    for trip_id, stop_times in iter_trip_stop_times(archive, trip_key, counts=counts):
+      sequence, seen = [], set()
+      for _, stop_id in stop_times:
+        # Consecutive platforms of the same station, and loops back to a station, only count once.
+        station = station_of_stop[stop_id]
+        if station not in seen:
+          sequence.append(station)
+          seen.add(station)
+      patterns.setdefault(trip_key[trip_id], set()).add(tuple(sequence))
+
+  ordered_stop_names = {}
+  for route_id, route_name in route_names.items():
+    directions = sorted(direction for (other_id, direction) in patterns if other_id == route_id)
+    if len(directions) > 0:
+      ordered_stop_names[route_name] = merge_stop_patterns(patterns[(route_id, directions[0])])
+
+  used = {stop for stops in ordered_stop_names.values() for stop in stops}
+  coordinates = {name: coordinates_of_station[name] for name in used if name in coordinates_of_station}
+  stats = GtfsStats(counts["stop_times_rows"], len(trip_key), sum(len(value) for value in patterns.values()),
+                    time.perf_counter() - t0)
+
+  if verbose:
+    print("NOTE: Read {} stop_times rows ({} trips on {} routes) from {} in {:.2f} sec ({:.0f} rows/sec)".format(
+        stats.stop_times_rows, stats.trips, len(ordered_stop_names), path, stats.seconds,
+        stats.stop_times_rows / max(stats.seconds, 1e-9)))
+
+  return ordered_stop_names, coordinates, stats
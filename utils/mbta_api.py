@@ -1,8 +1,255 @@
+import hashlib, json, os, threading, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
 import requests
+from requests.adapters import HTTPAdapter
 from jsonpointer import resolve_pointer
 
+from utils import profiling
+from utils.utils import merge_stop_patterns
+
+# NOTE: orjson is optional. It decodes responses several times faster than json (see bench_api_transfer.py).
+try:
+  from orjson import loads as fast_json_loads
+except ImportError:
+  fast_json_loads = json.loads
+
+
+MBTA_API_URL = "https://api-v3.mbta.com"
+
+# Sparse fieldsets: the attributes that callers read from stops and routes. Everything else (addresses,
+# colors, fare classes, ...) is left out of responses.
+STOP_FIELDS = ("name", "latitude", "longitude")
+ROUTE_FIELDS = ("long_name", "short_name", "type", "direction_destinations")
+
+DEFAULT_CACHE_FOLDER = os.path.abspath(os.path.join(os.path.abspath(__file__), "../../output/http_cache/"))
+
 
-def get_routes(route_types=[0, 1], sort_by="long_name", descending=False):
+class ResponseCache(object):
+  """
+  On-disk cache of API responses, keyed by URL and query params.
+
+  Each response is stored as one JSON file along with its ETag/Last-Modified validators. Entries
+  younger than ttl are served without touching the network. Older entries are revalidated with a
+  conditional request, so unchanged data costs a 304 instead of a full download. When the folder grows
+  beyond max_bytes, the least recently used entries are evicted. The folder is only scanned once, on first
+  use (ordered by file modification time), and after that the size and order of entries are kept in memory,
+  so a put doesn't have to look at every other file.
+
+  Any object with the same get/put/refresh/count methods can be passed to MbtaClient instead.
+
+  folder (str) : Where to store cached responses.
+  ttl (float) : Seconds that a response is considered fresh.
+  max_bytes (int) : Maximum total size of the cached responses.
+  """
+  def __init__(self, folder=DEFAULT_CACHE_FOLDER, ttl=3600, max_bytes=64 * 1024 * 1024):
+    self.folder = folder
+    self.ttl = ttl
+    self.max_bytes = max_bytes
+    self.lock = threading.Lock()
+    self.hits = 0
+    self.misses = 0
+    self.revalidated = 0
+    self.entries = None # Path => size in bytes, least recently used first (see _load_entries).
+    self.num_bytes = 0
+    os.makedirs(folder, exist_ok=True)
+
+  def path_for(self, key):
+    return os.path.join(self.folder, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".json")
+
+  def get(self, key):
+    """
+    Returns the cached entry for a key (or None), and marks it as recently used. Entries are dicts
+    with "body", "etag", "last_modified" and "stored_at" fields.
+    """
+    path = self.path_for(key)
+    try:
+      with open(path, "r") as f:
+        entry = json.load(f)
+      os.utime(path)
+    except (OSError, ValueError):
+      return None
+    with self.lock:
+      if self.entries is not None and path in self.entries:
+        self.entries.move_to_end(path)
+    return entry if entry.get("key") == key else None
+
+  def is_fresh(self, entry):
+    return (time.time() - entry["stored_at"]) < self.ttl
+
+  def put(self, key, body, etag=None, last_modified=None):
+    entry = {"key": key, "body": body, "etag": etag, "last_modified": last_modified, "stored_at": time.time()}
+    path = self.path_for(key)
+    tmp_path = "{}.{}.tmp".format(path, threading.get_ident())
+    with open(tmp_path, "w") as f:
+      json.dump(entry, f)
+      size = f.tell()
+    with self.lock:
+      self._load_entries()
+      os.replace(tmp_path, path)
+      self.num_bytes += size - self.entries.pop(path, 0)
+      self.entries[path] = size
+      self._evict()
+    return entry
+
+  def refresh(self, key, entry):
+    """
+    Called when the server confirms (with a 304) that a cached entry is still valid.
+    """
+    return self.put(key, entry["body"], etag=entry["etag"], last_modified=entry["last_modified"])
+
+  def count(self, name):
+    """
+    Adds one to a counter (i.e "hits"), while holding the lock so that threads don't lose updates.
+    """
+    with self.lock:
+      setattr(self, name, getattr(self, name) + 1)
+
+  def evict(self):
+    """
+    Removes least recently used entries until the cache fits in max_bytes.
+    """
+    with self.lock:
+      self._load_entries()
+      self._evict()
+
+  def _load_entries(self):
+    if self.entries is not None:
+      return
+    files = []
+    for item in os.scandir(self.folder):
+      if item.name.endswith(".json"):
+        stat = item.stat()
+        files.append((stat.st_mtime, item.path, stat.st_size))
+    self.entries = OrderedDict((path, size) for _, path, size in sorted(files))
+    self.num_bytes = sum(self.entries.values())
+
+  def _evict(self):
+    while self.num_bytes > self.max_bytes and len(self.entries) > 0:
+      path, size = self.entries.popitem(last=False)
+      try:
+        os.remove(path)
+      except OSError:
+        pass
+      self.num_bytes -= size
+
+  def clear(self):
+    with self.lock:
+      for item in os.scandir(self.folder):
+        if item.name.endswith(".json"):
+          os.remove(item.path)
+      self.entries = None
+
+
+class MbtaClient(object):
+  """
+  Thin wrapper around a pooled requests.Session for the MBTA API.
+
+  Connections are kept alive and reused across requests (and threads), and requests that are rate
+  limited (HTTP 429) are retried with exponential backoff. Successful responses can optionally be kept
+  in a ResponseCache. Responses are gzipped by the server, and decoded with orjson if it's installed.
+
+  base_url (str) : Root of the API. Tests point this at a local stub server.
+  pool_size (int) : Maximum number of connections to keep open to the API.
+  max_retries (int) : How many times to retry a request that was rate limited.
+  backoff (float) : Seconds to wait before the first retry. Doubles after every retry, unless the
+                    server sends a Retry-After header, which is used instead.
+  cache (ResponseCache or None) : If given, responses are cached and revalidated with conditional requests.
+  compress (bool) : Whether to ask for gzipped responses.
+  loads (function or None) : Decodes the JSON bytes of a response. Defaults to fast_json_loads.
+  """
+  def __init__(self, base_url=MBTA_API_URL, pool_size=8, max_retries=5, backoff=0.5, cache=None, compress=True,
+               loads=None):
+    self.base_url = base_url.rstrip("/")
+    self.cache = cache
+    self.max_retries = max_retries
+    self.backoff = backoff
+    self.loads = loads if loads is not None else fast_json_loads
+    self.session = requests.Session()
+    self.session.headers["Accept-Encoding"] = "gzip" if compress else "identity"
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    self.session.mount("http://", adapter)
+    self.session.mount("https://", adapter)
+
+  def get(self, path, params=None):
+    """
+    GET a path (i.e "/stops") from the API.
+
+    Returns:
+      (bool) Whether the GET was successful
+      (dict) the JSON response.
+    """
+    url = self.base_url + path
+    key = url + "?" + urlencode(sorted((params or {}).items()))
+
+    # Serve fresh cache entries directly, and revalidate stale ones.
+    entry = self.cache.get(key) if self.cache is not None else None
+    headers = {}
+    if entry is not None:
+      if self.cache.is_fresh(entry):
+        self.cache.count("hits")
+        profiling.count("http_cache_hits")
+        return True, entry["body"]
+      if entry["etag"] is not None:
+        headers["If-None-Match"] = entry["etag"]
+      if entry["last_modified"] is not None:
+        headers["If-Modified-Since"] = entry["last_modified"]
+
+    t0 = time.perf_counter()
+    for attempt in range(self.max_retries + 1):
+      r = self.session.get(url, params=params, headers=headers)
+      if r.status_code != 429 or attempt == self.max_retries:
+        break
+      profiling.count("api_retries")
+      retry_after = r.headers.get("Retry-After")
+      time.sleep(float(retry_after) if retry_after is not None else self.backoff * (2 ** attempt))
+    profiling.record("api_request", time.perf_counter() - t0) # Includes time spent backing off.
+    # NOTE: The raw response counts the bytes read from the connection, before they're decompressed.
+    content = r.content
+    profiling.count("api_bytes", r.raw.tell() if hasattr(r.raw, "tell") else len(content))
+    profiling.count("api_body_bytes", len(content))
+
+    if entry is not None and r.status_code == 304:
+      self.cache.count("revalidated")
+      profiling.count("http_cache_revalidated")
+      self.cache.refresh(key, entry)
+      return True, entry["body"]
+
+    with profiling.timed("api_decode"):
+      body = self.loads(content)
+    success = (r.status_code == 200)
+    if self.cache is not None:
+      self.cache.count("misses")
+      profiling.count("http_cache_misses")
+      if success:
+        self.cache.put(key, body, etag=r.headers.get("ETag"), last_modified=r.headers.get("Last-Modified"))
+
+    return success, body
+
+  def close(self):
+    self.session.close()
+
+
+_DEFAULT_CLIENT = None
+_DEFAULT_CLIENT_LOCK = threading.Lock()
+
+
+def get_default_client():
+  """
+  Returns a shared MbtaClient, so that every call in this process reuses the same connection pool and
+  the same on-disk ResponseCache (in output/http_cache).
+  """
+  global _DEFAULT_CLIENT
+  with _DEFAULT_CLIENT_LOCK:
+    if _DEFAULT_CLIENT is None:
+      _DEFAULT_CLIENT = MbtaClient(cache=ResponseCache())
+    return _DEFAULT_CLIENT
+
+
+def get_routes(route_types=[0, 1], sort_by="long_name", descending=False, fields=ROUTE_FIELDS, page_limit=None,
+               page_offset=0, client=None):
   """
   Query routes from the MBTA API, optionally filtering by a route type.
   https://api-v3.mbta.com/docs/swagger/index.html#/Route/ApiWeb_RouteController_index
@@ -14,6 +261,12 @@ def get_routes(route_types=[0, 1], sort_by="long_name", descending=False):
     An attribute to sort by (e.g. "long_name"). If None, don't do sorting.
   descending (bool) :
     Return results in descending order, according to the sort_by attribute.
+  fields (list of str or None) :
+    Attributes to return for each route (a sparse fieldset), or None for all of them.
+  page_limit (int or None) :
+    If given, only return this many routes, starting at page_offset (see iter_route_pages).
+  client (MbtaClient or None) :
+    Client to send the request with. If None, uses the shared default client.
 
   Returns:
     (bool) Whether the GET was successful
@@ -21,19 +274,25 @@ def get_routes(route_types=[0, 1], sort_by="long_name", descending=False):
   """
   params = {}
 
-  if route_types is not None:
+  if route_types:
     params["filter[type]"] = ",".join([str(r) for r in route_types])
 
   if sort_by is not None:
     params["sort"] = ("-" if descending else "") + sort_by
 
-  r = requests.get("https://api-v3.mbta.com/routes", params=params)
-  success = (r.status_code == 200)
+  if fields is not None:
+    params["fields[route]"] = ",".join(fields)
+
+  if page_limit is not None:
+    params["page[limit]"] = str(page_limit)
+    params["page[offset]"] = str(page_offset)
 
-  return success, r.json()
+  client = client if client is not None else get_default_client()
+  return client.get("/routes", params=params)
 
 
-def get_stops(route_ids, sort_by="name", descending=False):
+def get_stops(route_ids, sort_by="name", descending=False, fields=STOP_FIELDS, page_limit=None, page_offset=0,
+              client=None):
   """
   Query all of the stops along a given route. Optionally sort by an attribute.
   https://api-v3.mbta.com/docs/swagger/index.html#/Stop/ApiWeb_StopController_index
@@ -45,6 +304,12 @@ def get_stops(route_ids, sort_by="name", descending=False):
     An attribute to sort by (e.g. "name"). If None, don't do sorting.
   descending (bool) :
     Return results in descending order, according to the sort_by attribute.
+  fields (list of str or None) :
+    Attributes to return for each stop (a sparse fieldset), or None for all of them.
+  page_limit (int or None) :
+    If given, only return this many stops, starting at page_offset (see iter_stop_pages).
+  client (MbtaClient or None) :
+    Client to send the request with. If None, uses the shared default client.
   """
   params = {}
   params["include"] = "route" # NOTE: Must include the "route" relationship to filter by it.
@@ -53,7 +318,181 @@ def get_stops(route_ids, sort_by="name", descending=False):
   if sort_by is not None:
     params["sort"] = ("-" if descending else "") + sort_by
 
-  r = requests.get("https://api-v3.mbta.com/stops", params=params)
-  success = (r.status_code == 200)
+  if fields is not None:
+    params["fields[stop]"] = ",".join(fields)
+    params["fields[route]"] = "" # The included routes are only needed for the filter, so trim them to their ids.
+
+  if page_limit is not None:
+    params["page[limit]"] = str(page_limit)
+    params["page[offset]"] = str(page_offset)
+
+  client = client if client is not None else get_default_client()
+  return client.get("/stops", params=params)
+
+
+def get_stops_each_route(route_ids, sort_by="name", descending=False, max_workers=8, client=None):
+  """
+  Query the stops along each route separately, with the requests sent concurrently.
+
+  When multiple route IDs are used to filter a single get_stops query, the route relationship
+  disappears from the returned items, so this is how to find out which stops are on which route.
+
+  route_ids (list of str) : The routes to query (see get_stops).
+  max_workers (int) : Maximum number of requests in flight at once.
+
+  Returns (dict) :
+    key (str) : Route ID.
+    value (tuple) : The (success, JSON response) from get_stops for that route.
+  """
+  client = client if client is not None else get_default_client()
+  with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(route_ids)))) as executor:
+    futures = [executor.submit(get_stops, [route_id], sort_by, descending, client=client) for route_id in route_ids]
+    return {route_id: future.result() for route_id, future in zip(route_ids, futures)}
+
+
+def iter_pages(get_page, page_limit=100):
+  """
+  Requests a paginated query one page at a time (with page[limit] and page[offset]), so that a large
+  result never has to be held in memory as a single response. Pages are requested until one comes back
+  short, or without a "next" link.
+
+  get_page (function) : Called as get_page(page_limit, page_offset) to request one page, i.e with
+                        get_stops. Returns (success, JSON response).
+
+  Yields:
+    (bool) Whether the GET was successful. Iteration stops after the first failed page.
+    (dict) The JSON response for one page.
+  """
+  page_offset = 0
+  while True:
+    success, page_json = get_page(page_limit, page_offset)
+    yield success, page_json
+    if not success or len(page_json.get("data", [])) < page_limit or (page_json.get("links") or {}).get("next") is None:
+      return
+    page_offset += page_limit
+
+
+def iter_stop_pages(route_ids, sort_by="name", descending=False, fields=STOP_FIELDS, page_limit=100, client=None):
+  """
+  Query the stops along the given routes one page at a time (see iter_pages and get_stops), so that a
+  long route (i.e a bus route with hundreds of stops) is never held in memory as a single response.
+  """
+  return iter_pages(lambda limit, offset: get_stops(route_ids, sort_by=sort_by, descending=descending, fields=fields,
+                                                    page_limit=limit, page_offset=offset, client=client), page_limit)
+
+
+def iter_route_pages(route_types=None, sort_by=None, descending=False, fields=ROUTE_FIELDS, page_limit=100, client=None):
+  """
+  Query routes one page at a time (see iter_pages and get_routes).
+  """
+  return iter_pages(lambda limit, offset: get_routes(route_types=route_types, sort_by=sort_by, descending=descending,
+                                                     fields=fields, page_limit=limit, page_offset=offset,
+                                                     client=client), page_limit)
+
+
+def get_route_patterns(route_ids, include="representative_trip.stops", client=None):
+  """
+  Query the route patterns (the distinct stop sequences that trips on a route follow) of several routes
+  in one request.
+  https://api-v3.mbta.com/docs/swagger/index.html#/RoutePattern/ApiWeb_RoutePatternController_index
+
+  Unlike get_stops, the route relationship is kept when filtering by several routes, since it's on each
+  pattern. With include="representative_trip.stops", a trip of each pattern and the stops that it visits
+  (in order) are returned in the "included" section of the response (see route_stop_sequences).
+
+  route_ids (list of str) : Routes to query.
+  include (str or None) : Related resources to include.
+  client (MbtaClient or None) : Client to send the request with. If None, uses the shared default client.
+
+  Returns:
+    (bool) Whether the GET was successful
+    (dict) the JSON response.
+  """
+  params = {"filter[route]": ",".join(route_ids)}
+  if include is not None:
+    params["include"] = include
+
+  client = client if client is not None else get_default_client()
+  return client.get("/route_patterns", params=params)
+
+
+def index_included(response_json):
+  """
+  Indexes the resource objects in the "included" section of a JSON:API response by (type, id), which is
+  how relationships refer to them.
+  """
+  return {(obj["type"], obj["id"]): obj for obj in response_json.get("included", [])}
+
+
+def route_stop_sequences(patterns_json):
+  """
+  Decodes a get_route_patterns response (with include="representative_trip.stops") into the stops along
+  each pattern. A ValueError is raised if a pattern's trip, or one of its stops, isn't included.
+
+  Yields:
+    (str) Route ID.
+    (int) Direction ID of the pattern.
+    (list of dict) The stop objects that the pattern's representative trip visits, in order.
+  """
+  included = index_included(patterns_json)
+  for pattern in patterns_json.get("data", []):
+    relationships = pattern["relationships"]
+    trip_ref = relationships["representative_trip"]["data"]
+    trip = included.get(("trip", trip_ref["id"])) if trip_ref is not None else None
+    if trip is None:
+      raise ValueError("The representative trip of route pattern {} isn't included".format(pattern["id"]))
+    stops = []
+    for stop_ref in trip["relationships"]["stops"]["data"]:
+      stop = included.get(("stop", stop_ref["id"]))
+      if stop is None:
+        raise ValueError("Stop {} of route pattern {} isn't included".format(stop_ref["id"], pattern["id"]))
+      stops.append(stop)
+    yield relationships["route"]["data"]["id"], pattern["attributes"]["direction_id"], stops
+
+
+def get_route_stops_bulk(route_ids, routes_per_request=50, max_workers=8, client=None):
+  """
+  Query the ordered stops along many routes with a few get_route_patterns requests (one for every
+  routes_per_request routes, sent concurrently), instead of one get_stops request per route like
+  get_stops_each_route.
+
+  A route's stops are the stop sequences of its patterns in its first direction, merged into one order
+  (see merge_stop_patterns), like read_gtfs does with the trips in a GTFS feed. Stops are named (and
+  located) by the stop objects that trips visit, which in the real API are platforms that carry the name
+  of their station.
+
+  route_ids (list of str) : The routes to query.
+  routes_per_request (int) : Maximum number of routes to filter each request by.
+  max_workers (int) : Maximum number of requests in flight at once.
+
+  Returns:
+    (bool) Whether every request was successful.
+    (dict) Maps each route ID to the (stop name, latitude, longitude) of each stop in order along the route,
+           or the JSON response of a failed request.
+  """
+  client = client if client is not None else get_default_client()
+  chunks = [route_ids[i:i + routes_per_request] for i in range(0, len(route_ids), routes_per_request)]
+
+  patterns = {} # Route ID => direction ID => set of distinct stop name sequences.
+  coordinates = {}
+  with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+    for success, patterns_json in executor.map(lambda chunk: get_route_patterns(chunk, client=client), chunks):
+      if not success:
+        return False, patterns_json
+      for route_id, direction_id, stops in route_stop_sequences(patterns_json):
+        sequence, seen = [], set()
+        for stop in stops:
+          # Consecutive platforms of the same station, and loops back to a stop, only count once.
+          name = stop["attributes"]["name"]
+          if name not in seen:
+            sequence.append(name)
+            seen.add(name)
+            coordinates[name] = (stop["attributes"]["latitude"], stop["attributes"]["longitude"])
+        patterns.setdefault(route_id, {}).setdefault(direction_id, set()).add(tuple(sequence))
 
-  return success, r.json()
+  route_stops = {}
+  for route_id in route_ids:
+    directions = patterns.get(route_id, {})
+    names = merge_stop_patterns(directions[min(directions)]) if len(directions) > 0 else []
+    route_stops[route_id] = [(name,) + coordinates[name] for name in names]
+  return True, route_stops
@@ -0,0 +1,190 @@
+import heapq
+from collections import namedtuple
+
+
+# One way of getting from A to B.
+# "transfers" is the number of times the rider changes routes, and "distance_km" is the distance travelled.
+# "legs" is the list of Leg rides along the way (see stop_graph.py).
+Itinerary = namedtuple("Itinerary", ["transfers", "distance_km", "legs"])
+
+
+def _heuristic(graph, goal):
+  """
+  Returns a function that gives the straight-line distance (km) from a node's stop to the goal stop. This
+  never overestimates the remaining distance, and values are cached per stop.
+  """
+  node_stop = graph.node_stop
+  cache = [None] * len(graph.stop_names)
+
+  def h(node):
+    stop = node_stop[node]
+    value = cache[stop]
+    if value is None:
+      value = cache[stop] = graph.distance(stop, goal)
+    return value
+
+  return h
+
+
+def _path(label, label_node, label_parent, label_distance):
+  path, distances = [], []
+  while label is not None:
+    path.append(label_node[label])
+    distances.append(label_distance[label])
+    label = label_parent[label]
+  path.reverse()
+  distances.reverse()
+  return path, distances
+
+
+def pareto_routes(graph, stop_A, stop_B, max_transfers=None):
+  """
+  Finds every Pareto-optimal itinerary from stop_A to stop_B over (number of transfers, distance). An
+  itinerary is on the frontier if every other itinerary with fewer transfers is longer.
+
+  This is a multi-criteria label-setting search on a StopGraph. Labels are expanded in order of transfers,
+  then distance plus the straight-line distance to stop_B (A*). In that order, a label is dominated exactly
+  when a label that was already expanded at the same node is at least as short, so each node only needs to
+  remember its shortest expanded distance. Labels that can't beat the shortest itinerary found so far are
+  pruned as well.
+
+  graph (StopGraph) : The stop-level network.
+  max_transfers (int or None) : If given, ignore itineraries with more transfers than this.
+
+  Returns (list of Itinerary) : The frontier, with the fewest transfers (and longest distance) first.
+  """
+  if stop_A not in graph.stop_ids or stop_B not in graph.stop_ids:
+    return []
+  source, goal = graph.stop_ids[stop_A], graph.stop_ids[stop_B]
+  if source == goal:
+    return [Itinerary(0, 0.0, [])]
+
+  h = _heuristic(graph, goal)
+  node_stop, node_route, adjacent = graph.node_stop, graph.node_route, graph.adjacent
+  max_transfers = float("inf") if max_transfers is None else max_transfers
+
+  # Labels are stored in flat lists, and referred to by index.
+  label_node, label_transfers, label_distance, label_parent = [], [], [], []
+  best_distance = [float("inf")] * len(node_stop)
+  best_goal_distance = float("inf")
+
+  frontier = []
+  for node in graph.stop_nodes[source]:
+    label_node.append(node)
+    label_transfers.append(0)
+    label_distance.append(0.0)
+    label_parent.append(None)
+    heapq.heappush(frontier, (0, h(node), len(label_node) - 1))
+
+  itineraries = []
+  while len(frontier) > 0:
+    transfers, _, label = heapq.heappop(frontier)
+    node, distance = label_node[label], label_distance[label]
+    if distance >= best_distance[node] or distance >= best_goal_distance:
+      continue
+    best_distance[node] = distance
+
+    if node_stop[node] == goal:
+      best_goal_distance = distance
+      path, distances = _path(label, label_node, label_parent, label_distance)
+      itineraries.append(Itinerary(transfers, distance, graph.legs_along(path, distances)))
+      continue
+
+    route = node_route[node]
+    for other, weight in adjacent[node]:
+      if node_route[other] == route:
+        other_transfers, other_distance = transfers, distance + weight
+      else:
+        # Transfer edges connect nodes at the same stop, so they don't add any distance.
+        other_transfers, other_distance = transfers + 1, distance
+        if other_transfers > max_transfers:
+          continue
+      other_h = h(other)
+      if other_distance >= best_distance[other] or other_distance + other_h >= best_goal_distance:
+        continue
+      label_node.append(other)
+      label_transfers.append(other_transfers)
+      label_distance.append(other_distance)
+      label_parent.append(label)
+      heapq.heappush(frontier, (other_transfers, other_distance + other_h, len(label_node) - 1))
+
+  return itineraries
+
+
+def k_best_routes(graph, stop_A, stop_B, k=3, transfer_penalty_km=None):
+  """
+  Finds the k lowest cost itineraries from stop_A to stop_B that use different sequences of routes, where
+  cost is the distance travelled plus transfer_penalty_km for each transfer (the same cost as
+  StopGraph.shortest_path). Itineraries never ride the same route twice.
+
+  This is a label-setting search where each node keeps the best label for up to k different route
+  sequences. Because routes can't be reused, a pruned label can occasionally be the only one that
+  continues to a good itinerary, so rarely a worse (or no) alternative is returned in its place.
+
+  graph (StopGraph) : The stop-level network.
+  k (int) : Number of alternatives to return.
+  transfer_penalty_km (float or None) : Defaults to the graph's transfer_penalty_km.
+
+  Returns (list of tuple) : Up to k (cost, Itinerary) pairs, cheapest first.
+  """
+  if stop_A not in graph.stop_ids or stop_B not in graph.stop_ids or k <= 0:
+    return []
+  source, goal = graph.stop_ids[stop_A], graph.stop_ids[stop_B]
+  if source == goal:
+    return [(0.0, Itinerary(0, 0.0, []))]
+
+  penalty = graph.transfer_penalty_km if transfer_penalty_km is None else transfer_penalty_km
+  h = _heuristic(graph, goal)
+  node_stop, node_route, adjacent = graph.node_stop, graph.node_route, graph.adjacent
+
+  label_node, label_routes, label_cost, label_distance, label_parent = [], [], [], [], []
+  label_rode = [] # Whether the label has ridden its current route, so that it can transfer.
+  settled = [None] * len(node_stop) # Route sequences expanded at each node.
+
+  frontier = []
+  for node in graph.stop_nodes[source]:
+    label_node.append(node)
+    label_routes.append((node_route[node],))
+    label_cost.append(0.0)
+    label_distance.append(0.0)
+    label_parent.append(None)
+    label_rode.append(False)
+    heapq.heappush(frontier, (h(node), len(label_node) - 1))
+
+  results = []
+  while len(frontier) > 0 and len(results) < k:
+    _, label = heapq.heappop(frontier)
+    node, routes = label_node[label], label_routes[label]
+    if settled[node] is None:
+      settled[node] = set()
+    if routes in settled[node] or len(settled[node]) >= k:
+      continue
+    settled[node].add(routes)
+
+    if node_stop[node] == goal:
+      path, distances = _path(label, label_node, label_parent, label_distance)
+      itinerary = Itinerary(len(routes) - 1, label_distance[label], graph.legs_along(path, distances))
+      results.append((label_cost[label], itinerary))
+      continue
+
+    cost, distance = label_cost[label], label_distance[label]
+    for other, weight in adjacent[node]:
+      other_route = node_route[other]
+      if other_route == routes[-1]:
+        other_routes, other_cost, other_distance = routes, cost + weight, distance + weight
+      elif other_route in routes or not label_rode[label]:
+        # Transferring twice in a row (or before riding anywhere) gives the same itinerary as one transfer.
+        continue
+      else:
+        other_routes, other_cost, other_distance = routes + (other_route,), cost + penalty, distance
+      if settled[other] is not None and (other_routes in settled[other] or len(settled[other]) >= k):
+        continue
+      label_node.append(other)
+      label_routes.append(other_routes)
+      label_cost.append(other_cost)
+      label_distance.append(other_distance)
+      label_parent.append(label)
+      label_rode.append(other_routes is routes)
+      heapq.heappush(frontier, (other_cost + h(other), len(label_node) - 1))
+
+  return results
@@ -0,0 +1,205 @@
+import sys, threading, time
+from bisect import bisect_left
+
+
+# Upper bounds (ms) of the latency histogram buckets, roughly 4 per factor of 10.
+LATENCY_BUCKETS_MS = (0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+# Profiles time things from microseconds (a route query) to minutes (preprocessing from the API).
+PROFILE_BUCKETS_MS = (0.001, 0.002, 0.005, 0.01, 0.02) + LATENCY_BUCKETS_MS + (10000, 30000, 60000, 300000)
+
+
+class LatencyHistogram(object):
+  """
+  Fixed-bucket latency histogram. Recording is a binary search and an increment, so it's cheap enough to
+  do for every request.
+
+  buckets_ms (tuple) : Sorted upper bounds of the buckets, in milliseconds. Slower requests go in an
+                       extra overflow bucket.
+  """
+  def __init__(self, buckets_ms=LATENCY_BUCKETS_MS):
+    self.buckets_ms = tuple(buckets_ms)
+    self.counts = [0] * (len(self.buckets_ms) + 1)
+    self.count = 0
+    self.total_ms = 0.0
+
+  def record(self, seconds):
+    ms = 1000 * seconds
+    self.counts[bisect_left(self.buckets_ms, ms)] += 1
+    self.count += 1
+    self.total_ms += ms
+
+  def percentile(self, p):
+    """
+    Returns the upper bound (ms) of the bucket that holds the p-th percentile (0 <= p <= 100), or None
+    if nothing has been recorded. Returns inf if it's in the overflow bucket.
+    """
+    if self.count == 0:
+      return None
+    rank = p / 100 * self.count
+    seen = 0
+    for i, count in enumerate(self.counts):
+      seen += count
+      if seen >= rank and count > 0:
+        return self.buckets_ms[i] if i < len(self.buckets_ms) else float("inf")
+    return float("inf")
+
+  def to_json(self):
+    return {
+      "count": self.count,
+      "mean_ms": self.total_ms / self.count if self.count > 0 else None,
+      "p50_ms": self.percentile(50),
+      "p99_ms": self.percentile(99),
+      "buckets": [{"le_ms": le, "count": count} for le, count in zip(self.buckets_ms + ("inf",), self.counts)],
+    }
+
+
+class Profiler(object):
+  """
+  Named counters (i.e bytes fetched, cache hits) and latency histograms (i.e API requests, graph builds,
+  route queries) for one process. Counts can come from several threads (API requests are sent
+  concurrently), so updates take a lock.
+
+  buckets_ms (tuple) : Upper bounds of the histogram buckets, in milliseconds (see LatencyHistogram).
+
+  Code that's instrumented goes through the module-level functions below (count, record, timed), which do
+  nothing unless a profiler has been enabled. Counts from worker processes (i.e --batch --workers) aren't
+  collected.
+  """
+  def __init__(self, buckets_ms=PROFILE_BUCKETS_MS):
+    self.buckets_ms = buckets_ms
+    self.counters = {}
+    self.histograms = {}
+    self.lock = threading.Lock()
+
+  def count(self, name, n=1):
+    with self.lock:
+      self.counters[name] = self.counters.get(name, 0) + n
+
+  def record(self, name, seconds):
+    with self.lock:
+      histogram = self.histograms.get(name)
+      if histogram is None:
+        histogram = self.histograms[name] = LatencyHistogram(self.buckets_ms)
+      histogram.record(seconds)
+
+  def to_json(self):
+    with self.lock:
+      return {
+        "counters": dict(sorted(self.counters.items())),
+        "latency": {name: self.histograms[name].to_json() for name in sorted(self.histograms)},
+      }
+
+  def to_prometheus(self, prefix="mbta_"):
+    """
+    Returns the counters and histograms in the Prometheus text exposition format. Counters are named
+    <prefix><name>_total, and histograms <prefix><name>_seconds (with cumulative buckets in seconds).
+    """
+    lines = []
+    with self.lock:
+      for name in sorted(self.counters):
+        metric = "{}{}_total".format(prefix, name)
+        lines.append("# TYPE {} counter".format(metric))
+        lines.append("{} {}".format(metric, self.counters[name]))
+      for name in sorted(self.histograms):
+        histogram = self.histograms[name]
+        metric = "{}{}_seconds".format(prefix, name)
+        lines.append("# TYPE {} histogram".format(metric))
+        cumulative = 0
+        for le_ms, count in zip(histogram.buckets_ms, histogram.counts):
+          cumulative += count
+          lines.append('{}_bucket{{le="{:g}"}} {}'.format(metric, le_ms / 1000, cumulative))
+        lines.append('{}_bucket{{le="+Inf"}} {}'.format(metric, histogram.count))
+        lines.append("{}_sum {:.6f}".format(metric, histogram.total_ms / 1000))
+        lines.append("{}_count {}".format(metric, histogram.count))
+    return "\n".join(lines) + "\n"
+
+  def export(self, format="json"):
+    """
+    Returns the profile as text, in "json" or "prometheus" format.
+    """
+    if format == "prometheus":
+      return self.to_prometheus()
+    if format == "json":
+      import json # NOTE: Imported here so that json is only loaded when a profile is exported.
+      return json.dumps(self.to_json(), indent=2) + "\n"
+    raise ValueError("Unknown profile format: {}".format(format))
+
+
+# The enabled Profiler, or None. Hot paths check this directly, so that they don't pay for a function call
+# (or time.perf_counter) when profiling is off.
+PROFILER = None
+
+
+def write_profile(profiler, format="json", path=None):
+  """
+  Writes profiler.export(format) to a file, or to stderr if path is None (so that it doesn't get mixed
+  into results written to stdout).
+  """
+  text = profiler.export(format)
+  if path is None:
+    sys.stderr.write(text)
+  else:
+    with open(path, "w") as f:
+      f.write(text)
+
+
+def enable():
+  """
+  Starts collecting counts in a new Profiler, and returns it.
+  """
+  global PROFILER
+  PROFILER = Profiler()
+  return PROFILER
+
+
+def disable():
+  global PROFILER
+  PROFILER = None
+
+
+def count(name, n=1):
+  if PROFILER is not None:
+    PROFILER.count(name, n)
+
+
+def record(name, seconds):
+  if PROFILER is not None:
+    PROFILER.record(name, seconds)
+
+
+class _Timer(object):
+  __slots__ = ("profiler", "name", "t0")
+
+  def __init__(self, profiler, name):
+    self.profiler = profiler
+    self.name = name
+
+  def __enter__(self):
+    self.t0 = time.perf_counter()
+    return self
+
+  def __exit__(self, *exc_info):
+    self.profiler.record(self.name, time.perf_counter() - self.t0)
+    return False
+
+
+class _NullTimer(object):
+  __slots__ = ()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timed(name):
+  """
+  Context manager that records how long its block takes in the histogram called name, i.e
+  `with timed("graph_build"): ...`. When profiling is off, it returns a shared no-op timer.
+  """
+  return _Timer(PROFILER, name) if PROFILER is not None else _NULL_TIMER
@@ -0,0 +1,420 @@
+import heapq, os, pickle, time, zipfile
+from array import array
+from collections import namedtuple
+from datetime import datetime
+
+from utils.gtfs import iter_gtfs_rows, iter_trip_stop_times, parse_gtfs_time, read_route_names, read_stations
+from utils.utils import haversine_distance
+
+
+# One part of a Journey. "route" and "trip_id" are None for a walk between stops. Times are seconds after
+# midnight on the service day (and can go past 24 hours, like GTFS times).
+TimedLeg = namedtuple("TimedLeg", ["route", "trip_id", "board_stop", "alight_stop", "departure_time", "arrival_time"])
+
+# The earliest arrival at a stop, leaving the origin at departure_time.
+# "transfers" is the number of times the rider changes vehicles, and "legs" is the list of TimedLeg.
+Journey = namedtuple("Journey", ["departure_time", "arrival_time", "transfers", "legs"])
+
+# Larger than any time in a schedule, and faster to compare with ints than float("inf").
+_INF = 1 << 40
+
+
+class Timetable(object):
+  """
+  A schedule stored in flat arrays, for RAPTOR (see earliest_arrival).
+
+  Trips that visit the same stops in the same order are grouped into one "pattern" (a route in the RAPTOR
+  paper), and sorted by departure time. Stop times are stored trip by trip, so the time of trip k of
+  pattern p at the i-th stop along it is at pattern_time_start[p] + k * (number of stops) + i. Patterns
+  where one trip would overtake another are split, so that the earliest trip that can be boarded at a
+  stop always arrives first at every later stop.
+
+  trips (iterable of tuple) : (route name, trip ID, [(stop name, arrival, departure)]) for each trip, with
+                              times in seconds after midnight.
+  footpaths (dict or None) : Maps (stop name, stop name) to the seconds it takes to walk between them. They're
+                             closed transitively (see transitive_footpaths).
+  """
+  def __init__(self, trips, footpaths=None):
+    self.stop_names = []
+    self.stop_ids = {}
+
+    def stop_id(name):
+      if name not in self.stop_ids:
+        self.stop_ids[name] = len(self.stop_names)
+        self.stop_names.append(name)
+      return self.stop_ids[name]
+
+    # Group trips by (route, stop sequence), and keep their times in compact arrays until they're sorted.
+    grouped = {}
+    for route_name, trip_id, stop_times in trips:
+      if len(stop_times) < 2:
+        continue
+      key = (route_name, tuple(stop_id(name) for name, _, _ in stop_times))
+      grouped.setdefault(key, []).append((stop_times[0][2], trip_id, array("i", [t for _, t, _ in stop_times]),
+                                          array("i", [t for _, _, t in stop_times])))
+
+    self.pattern_route = []
+    self.pattern_stop_start, self.pattern_stops = array("i", [0]), array("i")
+    self.pattern_trip_start, self.trip_ids = array("i", [0]), []
+    self.pattern_time_start, self.arrivals, self.departures = array("q"), array("i"), array("i")
+
+    for (route_name, stops), group in grouped.items():
+      group.sort(key=lambda trip: (trip[0], trip[1]))
+      # Split into lanes where no trip overtakes the one before it.
+      lanes = []
+      for trip in group:
+        for lane in lanes:
+          last = lane[-1]
+          if all(a <= b for a, b in zip(last[2], trip[2])) and all(a <= b for a, b in zip(last[3], trip[3])):
+            lane.append(trip)
+            break
+        else:
+          lanes.append([trip])
+
+      for lane in lanes:
+        self.pattern_route.append(route_name)
+        self.pattern_stops.extend(stops)
+        self.pattern_stop_start.append(len(self.pattern_stops))
+        self.pattern_time_start.append(len(self.arrivals))
+        for _, trip_id, arrivals, departures in lane:
+          self.trip_ids.append(trip_id)
+          self.arrivals.extend(arrivals)
+          self.departures.extend(departures)
+        self.pattern_trip_start.append(len(self.trip_ids))
+
+    # Stops that can only be walked to are stops too.
+    footpaths = transitive_footpaths(footpaths or {})
+    footpaths = [(stop_id(a), stop_id(b), seconds) for (a, b), seconds in sorted(footpaths.items())]
+
+    # For each stop, the patterns that visit it and where along them it is.
+    stop_patterns = [[] for _ in self.stop_names]
+    for pattern in range(len(self.pattern_route)):
+      start = self.pattern_stop_start[pattern]
+      for i in range(self.pattern_stop_start[pattern + 1] - start):
+        stop_patterns[self.pattern_stops[start + i]].append((pattern, i))
+    self.stop_pattern_start, self.stop_patterns, self.stop_pattern_positions = array("i", [0]), array("i"), array("i")
+    for entries in stop_patterns:
+      for pattern, i in entries:
+        self.stop_patterns.append(pattern)
+        self.stop_pattern_positions.append(i)
+      self.stop_pattern_start.append(len(self.stop_patterns))
+
+    # Footpaths between stops, in the same layout.
+    walks = [[] for _ in self.stop_names]
+    for a, b, seconds in footpaths:
+      walks[a].append((b, seconds))
+    self.footpath_start, self.footpath_stops, self.footpath_seconds = array("i", [0]), array("i"), array("i")
+    for entries in walks:
+      for other, seconds in entries:
+        self.footpath_stops.append(other)
+        self.footpath_seconds.append(seconds)
+      self.footpath_start.append(len(self.footpath_stops))
+
+  @staticmethod
+  def from_gtfs(path, date=None, route_types=None, walking_speed_kmh=5.0, verbose=True):
+    """
+    Builds a timetable from a GTFS static feed, streaming stop_times.txt one trip at a time (see
+    iter_trip_stop_times). Stops are named after their parent station, like read_gtfs.
+
+    Footpaths come from transfers.txt (if the feed has one), between stops at different stations. Without
+    a min_transfer_time, the walking time is the straight-line distance at walking_speed_kmh. Walks that
+    chain several transfers (A to B, then B to C) become one footpath (see transitive_footpaths).
+
+    path (str) : Path to the zip.
+    date (str or None) : Service day as YYYYMMDD. Only trips that run that day (per calendar.txt and
+                         calendar_dates.txt) are included. If None, every trip is included.
+    route_types (list of int or None) : Route types to include (None for every type).
+
+    Returns (Timetable)
+    """
+    t0 = time.perf_counter()
+    counts = {}
+    with zipfile.ZipFile(path) as archive:
+      route_names = read_route_names(archive, route_types=route_types, verbose=verbose)
+      station_of_stop, coordinates = read_stations(archive)
+      services = None if date is None else active_services(archive, date)
+
+      trip_route = {}
+      for trip_id, route_id, service_id in iter_gtfs_rows(archive, "trips.txt", ["trip_id", "route_id", "service_id"]):
+        if route_id in route_names and (services is None or service_id in services):
+          trip_route[trip_id] = route_names[route_id]
+
+      def trips():
+        for trip_id, stop_times in iter_trip_stop_times(archive, trip_route, ["arrival_time", "departure_time"], counts):
+          timed = []
+          for _, stop_id, arrival, departure in stop_times:
+            # Times can be left blank at stops that aren't timepoints, so carry the last time forward.
+            arrival = parse_gtfs_time(arrival) if arrival else (timed[-1][2] if timed else None)
+            departure = parse_gtfs_time(departure) if departure else arrival
+            if arrival is None:
+              continue
+            station = station_of_stop[stop_id]
+            if len(timed) > 0 and timed[-1][0] == station:
+              # Platforms of the same station in a row are one stop.
+              timed[-1] = (station, timed[-1][1], departure)
+            else:
+              timed.append((station, arrival, departure))
+          yield trip_route[trip_id], trip_id, timed
+
+      footpaths = {}
+      if "transfers.txt" in archive.namelist():
+        for from_stop, to_stop, transfer_type, min_transfer_time in iter_gtfs_rows(
+            archive, "transfers.txt", ["from_stop_id", "to_stop_id"], ["transfer_type", "min_transfer_time"]):
+          a, b = station_of_stop.get(from_stop), station_of_stop.get(to_stop)
+          if a is None or b is None or a == b or transfer_type == "3":
+            continue
+          if min_transfer_time:
+            seconds = int(min_transfer_time)
+          elif a in coordinates and b in coordinates:
+            km = haversine_distance(coordinates[a][1], coordinates[a][0], coordinates[b][1], coordinates[b][0])
+            seconds = int(3600 * km / walking_speed_kmh)
+          else:
+            continue
+          footpaths[(a, b)] = min(seconds, footpaths.get((a, b), seconds))
+
+      timetable = Timetable(trips(), footpaths)
+
+    if verbose:
+      elapsed = time.perf_counter() - t0
+      print("NOTE: Built a timetable of {} trips ({} patterns, {} stops) from {} stop_times rows in {:.2f} sec "
+            "({:.0f} rows/sec)".format(len(timetable.trip_ids), len(timetable.pattern_route), len(timetable.stop_names),
+                                      counts["stop_times_rows"], elapsed, counts["stop_times_rows"] / max(elapsed, 1e-9)))
+    return timetable
+
+  def __contains__(self, stop_name):
+    return stop_name in self.stop_ids
+
+
+def transitive_footpaths(footpaths):
+  """
+  Adds a footpath between every pair of stops that can be walked between through other stops (i.e A to C if
+  A to B and B to C are footpaths), with the shortest total walking time. RAPTOR only walks one footpath
+  after each round, so without this, walks of more than one hop would be missed.
+
+  footpaths (dict) : Maps (stop name, stop name) to seconds.
+
+  Returns (dict) : The same mapping, closed transitively (without footpaths from a stop to itself).
+  """
+  walks = {}
+  for (a, b), seconds in footpaths.items():
+    if a != b:
+      walks.setdefault(a, []).append((b, seconds))
+
+  closed = {}
+  for source in walks:
+    # Dijkstra over the footpaths, which only reaches the few stops that are near source.
+    seconds_to = {source: 0}
+    heap = [(0, source)]
+    while len(heap) > 0:
+      seconds, stop = heapq.heappop(heap)
+      if seconds > seconds_to[stop]:
+        continue
+      for other, walk_seconds in walks.get(stop, ()):
+        if seconds + walk_seconds < seconds_to.get(other, _INF):
+          seconds_to[other] = seconds + walk_seconds
+          heapq.heappush(heap, (seconds + walk_seconds, other))
+    for stop, seconds in seconds_to.items():
+      if stop != source:
+        closed[(source, stop)] = seconds
+  return closed
+
+
+def active_services(archive, date):
+  """
+  Finds the service IDs that run on a date (YYYYMMDD), from calendar.txt and the exceptions in
+  calendar_dates.txt (either file can be missing).
+
+  Returns (set of str)
+  """
+  weekday = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"][
+      datetime.strptime(date, "%Y%m%d").weekday()]
+  services = set()
+  names = archive.namelist()
+  if "calendar.txt" in names:
+    for service_id, runs, start_date, end_date in iter_gtfs_rows(
+        archive, "calendar.txt", ["service_id", weekday, "start_date", "end_date"]):
+      if runs == "1" and start_date <= date <= end_date:
+        services.add(service_id)
+  if "calendar_dates.txt" in names:
+    for service_id, exception_date, exception_type in iter_gtfs_rows(
+        archive, "calendar_dates.txt", ["service_id", "date", "exception_type"]):
+      if exception_date == date:
+        if exception_type == "1":
+          services.add(service_id)
+        elif exception_type == "2":
+          services.discard(service_id)
+  return services
+
+
+def load_timetable(gtfs_path, date=None, route_types=None, allow_cache=True, verbose=True):
+  """
+  Builds a Timetable with Timetable.from_gtfs, or loads it from output/ if it was already built from the
+  same feed (the cache is rebuilt when the zip changes).
+
+  Returns (Timetable)
+  """
+  from utils.routing import path_to_output_file
+
+  types = "all" if route_types is None else "-".join(str(t) for t in sorted(route_types))
+  path_to_save = path_to_output_file("timetable_{}_{}.pkl".format(date or "every_day", types))
+  stat = os.stat(gtfs_path)
+  source_key = (os.path.abspath(gtfs_path), stat.st_size, stat.st_mtime_ns)
+
+  if os.path.exists(path_to_save) and allow_cache:
+    with open(path_to_save, "rb") as f:
+      cached_key, timetable = pickle.load(f)
+    if cached_key == source_key:
+      if verbose: print("NOTE: Using cached timetable from", path_to_save)
+      return timetable
+
+  timetable = Timetable.from_gtfs(gtfs_path, date=date, route_types=route_types, verbose=verbose)
+  if allow_cache:
+    with open(path_to_save, "wb") as f:
+      pickle.dump((source_key, timetable), f, protocol=pickle.HIGHEST_PROTOCOL)
+  return timetable
+
+
+def earliest_arrival(timetable, stop_A, stop_B, departure_time, max_transfers=5, min_transfer_seconds=0):
+  """
+  Finds the earliest arrival at stop_B, leaving stop_A at departure_time, with RAPTOR (Delling et al.,
+  "Round-Based Public Transit Routing"). Round k finds the earliest arrival at every stop with k vehicles,
+  by scanning each pattern that visits a stop improved in the previous round once, boarding the earliest
+  trip that can be caught, and then relaxing footpaths. Arrivals that can't beat the best arrival at
+  stop_B so far are pruned.
+
+  Of the journeys that arrive earliest, the one with the fewest transfers is returned.
+
+  timetable (Timetable) : The schedule.
+  departure_time (int) : Seconds after midnight on the timetable's service day.
+  max_transfers (int) : The search stops after max_transfers + 1 vehicles.
+  min_transfer_seconds (int) : Time needed to change vehicles at a stop.
+
+  Returns (Journey or None) : None if stop_B can't be reached.
+  """
+  if stop_A not in timetable.stop_ids or stop_B not in timetable.stop_ids:
+    return None
+  source, target = timetable.stop_ids[stop_A], timetable.stop_ids[stop_B]
+  if source == target:
+    return Journey(departure_time, departure_time, 0, [])
+
+  pattern_stop_start, pattern_stops = timetable.pattern_stop_start, timetable.pattern_stops
+  pattern_trip_start, pattern_time_start = timetable.pattern_trip_start, timetable.pattern_time_start
+  arrivals, departures = timetable.arrivals, timetable.departures
+  stop_pattern_start, stop_patterns = timetable.stop_pattern_start, timetable.stop_patterns
+  stop_pattern_positions = timetable.stop_pattern_positions
+  footpath_start, footpath_stops, footpath_seconds = timetable.footpath_start, timetable.footpath_stops, \
+                                                     timetable.footpath_seconds
+
+  best = [_INF] * len(timetable.stop_names)
+  best[source] = departure_time
+  tau = list(best)
+  # Maps each stop improved in a round to (pattern, trip, board position, alight position) if it was reached
+  # on a trip, or (-1, stop walked from, None, None) if it was reached on foot.
+  parent = {}
+
+  def walk(tau, parent, marked):
+    for stop in list(marked):
+      start = tau[stop]
+      for j in range(footpath_start[stop], footpath_start[stop + 1]):
+        other, arrival = footpath_stops[j], start + footpath_seconds[j]
+        if arrival < best[other] and arrival < best[target]:
+          best[other] = tau[other] = arrival
+          parent[other] = (-1, stop, None, None)
+          marked.add(other)
+
+  marked = {source}
+  walk(tau, parent, marked)
+  rounds = [(tau, parent)] # Arrival times and parent pointers after each round.
+
+  for k in range(1, max_transfers + 2):
+    previous = rounds[-1][0]
+    tau, parent = list(previous), {}
+    change = min_transfer_seconds if k > 1 else 0
+
+    # Scan each pattern from the first marked stop along it.
+    queue = {}
+    for stop in marked:
+      for j in range(stop_pattern_start[stop], stop_pattern_start[stop + 1]):
+        pattern, position = stop_patterns[j], stop_pattern_positions[j]
+        if position < queue.get(pattern, _INF):
+          queue[pattern] = position
+
+    marked = set()
+    target_best = best[target]
+    for pattern, position in queue.items():
+      stops_start = pattern_stop_start[pattern]
+      n = pattern_stop_start[pattern + 1] - stops_start
+      num_trips = pattern_trip_start[pattern + 1] - pattern_trip_start[pattern]
+      base = pattern_time_start[pattern]
+      trip, board, row = -1, -1, -1 # row is where the boarded trip's times start.
+      for i, stop in enumerate(pattern_stops[stops_start + position:stops_start + n], position):
+        if trip >= 0:
+          arrival = arrivals[row + i]
+          if arrival < best[stop] and arrival < target_best:
+            best[stop] = tau[stop] = arrival
+            parent[stop] = (pattern, trip, board, i)
+            marked.add(stop)
+            if stop == target:
+              target_best = arrival
+          elif trip == 0 and arrival >= target_best:
+            # Arrivals only get later along the trip, and there's no earlier trip to switch to.
+            break
+
+        # Catch an earlier trip here, if possible.
+        ready = previous[stop]
+        if ready < _INF:
+          ready += change
+          if trip < 0:
+            # Binary search for the first trip that leaves after the rider is ready.
+            lo, hi = 0, num_trips
+            while lo < hi:
+              mid = (lo + hi) // 2
+              if departures[base + mid * n + i] < ready:
+                lo = mid + 1
+              else:
+                hi = mid
+            if lo < num_trips:
+              trip, board, row = lo, i, base + lo * n
+          elif trip > 0 and ready <= departures[row - n + i]:
+            # Usually only a trip or two earlier, so step back one at a time.
+            while trip > 0 and ready <= departures[row - n + i]:
+              trip, row = trip - 1, row - n
+            board = i
+
+    walk(tau, parent, marked)
+    rounds.append((tau, parent))
+    if len(marked) == 0:
+      break
+
+  # Of the rounds with the earliest arrival, the first has the fewest transfers.
+  arrival_time = best[target]
+  if arrival_time >= _INF:
+    return None
+  k = min(k for k, (tau, _) in enumerate(rounds) if tau[target] == arrival_time)
+
+  legs = []
+  stop = target
+  while stop != source:
+    tau, parent = rounds[k]
+    if stop not in parent:
+      k -= 1
+      continue
+    pattern, trip, board, alight = parent[stop]
+    if pattern < 0:
+      walked_from = trip
+      legs.append(TimedLeg(None, None, timetable.stop_names[walked_from], timetable.stop_names[stop],
+                           tau[walked_from], tau[stop]))
+      stop = walked_from
+    else:
+      n = pattern_stop_start[pattern + 1] - pattern_stop_start[pattern]
+      base = pattern_time_start[pattern]
+      board_stop = pattern_stops[pattern_stop_start[pattern] + board]
+      legs.append(TimedLeg(timetable.pattern_route[pattern], timetable.trip_ids[pattern_trip_start[pattern] + trip],
+                           timetable.stop_names[board_stop], timetable.stop_names[stop],
+                           departures[base + trip * n + board], arrivals[base + trip * n + alight]))
+      stop = board_stop
+      k -= 1
+  legs.reverse()
+
+  num_rides = sum(1 for leg in legs if leg.route is not None)
+  return Journey(departure_time, arrival_time, max(0, num_rides - 1), legs)
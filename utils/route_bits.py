@@ -0,0 +1,166 @@
+from array import array
+
+from utils.routing import find_coarse_route, route_nodes
+
+
+def route_mask(route_ids):
+  """
+  Returns the bitmask of a collection of route ids (bit i is set if route id i is in it).
+  """
+  mask = 0
+  for route in route_ids:
+    mask |= 1 << route
+  return mask
+
+
+def mask_route_ids(mask):
+  """
+  Returns the route ids in a bitmask, in increasing order.
+  """
+  route_ids = []
+  while mask:
+    low = mask & -mask
+    route_ids.append(low.bit_length() - 1)
+    mask ^= low
+  return route_ids
+
+
+class BitGraph(object):
+  """
+  The route graph of a TransitGraph, with every set of routes stored as one integer bitmask, where bit i
+  is route id i. Checking whether two stops share a route is a single AND, and a BFS level is expanded by
+  OR-ing together the neighbor masks of the routes in the frontier, with the explored set as another mask.
+
+  Python integers grow as needed, so any number of routes works (the full network's ~170 routes take three
+  machine words).
+
+  graph (TransitGraph) : The graph to convert. Like TransitGraph, a BitGraph is never modified, so build a
+                         new one after TransitGraph.updated().
+  """
+  __slots__ = ("graph", "stop_masks", "neighbor_masks", "neighbor_ids", "connect_stops")
+
+  def __init__(self, graph):
+    self.graph = graph
+    self.stop_masks = tuple(route_mask(routes) for routes in graph.stop_routes)
+    self.neighbor_masks = tuple(route_mask(other for other, _ in edges) for edges in graph.adjacent)
+    self.neighbor_ids = tuple(tuple(mask_route_ids(mask)) for mask in self.neighbor_masks)
+
+    # Where to transfer between two adjacent routes: the lowest stop id they share (edges are sorted).
+    self.connect_stops = {}
+    for route, edges in enumerate(graph.adjacent):
+      for other, stop in edges:
+        self.connect_stops.setdefault((route, other), stop)
+
+  def find_coarse_route(self, stop_A, stop_B):
+    """
+    Same interface and return values as find_coarse_route. The route has the same (minimum) number of
+    transfers, but when there are ties, it can pick different routes.
+    """
+    graph = self.graph
+    stop_id_A, stop_id_B = graph.stop_ids.get(stop_A), graph.stop_ids.get(stop_B)
+    if stop_id_A is None or stop_id_B is None or stop_A == stop_B or stop_A not in graph or stop_B not in graph:
+      return find_coarse_route(stop_A, stop_B, graph)
+
+    routes, connect_stops = search_route_bits(self, self.stop_masks[stop_id_A], self.stop_masks[stop_id_B])
+    if routes is None:
+      return False, []
+    return True, route_nodes(graph, stop_A, routes, connect_stops)
+
+
+def search_route_bits(bit_graph, start_mask, goal_mask):
+  """
+  Finds a path with the fewest transfers from any route in start_mask to any route in goal_mask, with a
+  BFS where each level (and the explored set) is a bitmask.
+
+  Returns:
+    (list of int or None) Route ids along the path, or None if there isn't one.
+    (list of int) For each route, the id of the stop where it's boarded, or -1 for the first route.
+  """
+  neighbor_masks = bit_graph.neighbor_masks
+  levels = [start_mask]
+  explored = frontier = start_mask
+  while not frontier & goal_mask:
+    reached = 0
+    remaining = frontier
+    while remaining:
+      low = remaining & -remaining
+      reached |= neighbor_masks[low.bit_length() - 1]
+      remaining ^= low
+    frontier = reached & ~explored
+    if not frontier:
+      return None, []
+    explored |= frontier
+    levels.append(frontier)
+
+  # Walk back from the lowest goal route that was reached, through the lowest adjacent route on each level.
+  hit = frontier & goal_mask
+  route = (hit & -hit).bit_length() - 1
+  routes = [route]
+  for level in reversed(levels[:-1]):
+    parents = level & neighbor_masks[route]
+    route = (parents & -parents).bit_length() - 1
+    routes.append(route)
+  routes.reverse()
+
+  connect_stops = [-1] + [bit_graph.connect_stops[(a, b)] for a, b in zip(routes[:-1], routes[1:])]
+  return routes, connect_stops
+
+
+def transfer_counts(bit_graph, source_masks, goal_masks):
+  """
+  Bit-parallel BFS that answers many sources at once. Instead of one BFS per source, each route keeps
+  an integer whose bit i says whether source i has reached it, so expanding a level for every source
+  costs one OR per edge of the route graph.
+
+  source_masks (list of int) : Route masks to start from (i.e bit_graph.stop_masks of the A stops).
+  goal_masks (list of int) : Route masks to reach (i.e bit_graph.stop_masks of the B stops).
+
+  Returns (list of array) : counts[i][j] is the fewest transfers from source i to goal j (the length of
+                            find_coarse_route's route, minus one), or -1 if goal j can't be reached.
+  """
+  neighbor_ids = bit_graph.neighbor_ids
+  num_routes = len(neighbor_ids)
+
+  # frontier[r] has bit i set if source i reached route r on the last level, and reached[r] if it ever did.
+  frontier = [0] * num_routes
+  for i, mask in enumerate(source_masks):
+    for route in mask_route_ids(mask):
+      frontier[route] |= 1 << i
+  reached = list(frontier)
+
+  all_sources = (1 << len(source_masks)) - 1
+  goal_routes = [mask_route_ids(mask) for mask in goal_masks]
+  answered = [0] * len(goal_masks) # Bit i is set once source i has reached goal j.
+  counts = [array("h", [-1]) * len(goal_masks) for _ in source_masks]
+
+  depth = 0
+  while True:
+    for j, routes in enumerate(goal_routes):
+      if answered[j] == all_sources:
+        continue
+      new = 0
+      for route in routes:
+        new |= frontier[route]
+      new &= ~answered[j]
+      if new:
+        answered[j] |= new
+        while new:
+          low = new & -new
+          counts[low.bit_length() - 1][j] = depth
+          new ^= low
+
+    next_frontier = [0] * num_routes
+    any_reached = False
+    for route in range(num_routes):
+      mask = 0
+      for other in neighbor_ids[route]:
+        mask |= frontier[other]
+      mask &= ~reached[route]
+      if mask:
+        next_frontier[route] = mask
+        reached[route] |= mask
+        any_reached = True
+    if not any_reached:
+      return counts
+    frontier = next_frontier
+    depth += 1
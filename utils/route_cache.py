@@ -0,0 +1,118 @@
+import threading
+from collections import OrderedDict
+
+from utils import profiling
+from utils.routing import RouteNode, find_coarse_route, route_ids_between
+
+
+_MISSING = object()
+
+
+class RouteCache(object):
+  """
+  Memoizes find_coarse_route by equivalence class instead of by stop pair.
+
+  The answer for (stop_A, stop_B) only depends on the set of routes at stop_A, the set of routes at
+  stop_B, and the graph: every Green Line trunk stop, for example, visits the same routes, so all of
+  them get the same answer. Each distinct set of route ids (a tuple in TransitGraph.stop_routes) is given
+  a class number the first time it's seen, and results are kept in an LRU keyed by (class of stop_A,
+  class of stop_B) for one graph version at a time. Only the first route's connect stop (stop_A itself)
+  differs between pairs in the same classes, and it's filled in when the result is returned.
+
+  A change to the network makes a new TransitGraph, with a new version (see TransitGraph.updated). The
+  first query on a newer graph invalidates everything that was cached for older ones. Queries that are
+  still running on an older graph are answered without the cache.
+
+  max_entries (int) : Most (class, class) results to keep. The least recently used are evicted first.
+
+  Safe to share between threads. A single lock is held only while the LRU is read or written.
+  """
+  def __init__(self, max_entries=65536):
+    self.max_entries = max_entries
+    self.entries = OrderedDict()
+    self.version = None
+    self.class_of_stop = []
+    self.class_of_routes = {}
+    self.hits = 0
+    self.misses = 0
+    self.invalidations = 0
+    self.lock = threading.Lock()
+
+  def invalidate(self, version=None):
+    """
+    Drops every cached result, and starts caching results for the graph with this version. The classes
+    of its stops are sized by the first query.
+    """
+    with self.lock:
+      self._reset(version)
+
+  def _reset(self, version, num_stops=0):
+    if self.version is not None:
+      self.invalidations += 1
+    self.version = version
+    self.entries.clear()
+    self.class_of_stop = [-1] * num_stops
+    self.class_of_routes = {}
+
+  def find_coarse_route(self, stop_A, stop_B, graph):
+    """
+    Same interface and return values as find_coarse_route (graph must be a TransitGraph), but answered
+    from the cache when possible.
+    """
+    stop_id_A, stop_id_B = graph.stop_ids.get(stop_A), graph.stop_ids.get(stop_B)
+    if stop_id_A is None or stop_id_B is None or stop_A == stop_B:
+      return find_coarse_route(stop_A, stop_B, graph)
+    routes_A, routes_B = graph.stop_routes[stop_id_A], graph.stop_routes[stop_id_B]
+    if len(routes_A) == 0 or len(routes_B) == 0:
+      return find_coarse_route(stop_A, stop_B, graph) # Closed stops.
+
+    with self.lock:
+      is_older = self.version is not None and graph.version < self.version
+      if not is_older:
+        if graph.version != self.version:
+          self._reset(graph.version, len(graph.stop_names))
+        elif len(self.class_of_stop) != len(graph.stop_names):
+          self.class_of_stop = [-1] * len(graph.stop_names) # The first query since invalidate().
+        # Classes are assigned lazily, so a new graph costs nothing up front.
+        class_of_stop = self.class_of_stop
+        class_A, class_B = class_of_stop[stop_id_A], class_of_stop[stop_id_B]
+        if class_A < 0:
+          class_A = class_of_stop[stop_id_A] = self.class_of_routes.setdefault(routes_A, len(self.class_of_routes))
+        if class_B < 0:
+          class_B = class_of_stop[stop_id_B] = self.class_of_routes.setdefault(routes_B, len(self.class_of_routes))
+        key = (class_A, class_B)
+        legs = self.entries.get(key, _MISSING)
+        if legs is not _MISSING:
+          self.entries.move_to_end(key)
+          self.hits += 1
+    if is_older:
+      return find_coarse_route(stop_A, stop_B, graph) # An older graph, that a query is still using.
+
+    if legs is _MISSING:
+      # Keep (route name, connect stop name) for each leg, with None for the first connect stop (stop_A).
+      path = route_ids_between(graph, routes_A, routes_B)
+      legs = None if path is None else tuple(
+          (graph.route_names[route], graph.stop_names[stop] if stop >= 0 else None) for route, stop in zip(*path))
+      with self.lock:
+        self.misses += 1
+        if graph.version == self.version:
+          self.entries[key] = legs
+          if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+      if profiling.PROFILER is not None:
+        profiling.PROFILER.count("route_cache_misses")
+    elif profiling.PROFILER is not None:
+      profiling.PROFILER.count("route_cache_hits")
+
+    if legs is None:
+      return False, []
+    sequence = []
+    node = None
+    for route_name, connect_stop in legs:
+      node = RouteNode(route_name, node, stop_A if connect_stop is None else connect_stop)
+      sequence.append(node)
+    return True, sequence
+
+  def hit_rate(self):
+    total = self.hits + self.misses
+    return self.hits / total if total > 0 else 0.0
@@ -1,8 +1,11 @@
-import pickle, os
-from collections import defaultdict, deque, namedtuple
-from itertools import combinations
-
-from utils.mbta_api import get_routes, get_stops
+import pickle, os, sys, time
+from collections import defaultdict, namedtuple
+from itertools import combinations, count
+
+# NOTE: The MBTA API client (and requests), the GTFS reader and thread pools are imported by the functions
+# that fetch the network, so that they're only loaded when there isn't a cached network to use.
+from utils import profiling
+from utils.snapshot import Snapshot, write_snapshot
 from utils.utils import *
 
 
@@ -25,34 +28,71 @@ ROUTE_LONGNAME_TO_ID = {
 RouteNode = namedtuple("RouteNode", ["name", "parent_node", "connect_stop"])
 
 
-def preprocess_nominal(allow_cache=True, verbose=True):
+def path_to_output_file(filename):
+  path_to_output = os.path.abspath(os.path.join(os.path.abspath(__file__), "../../output/"))
+  return os.path.join(path_to_output, filename)
+
+
+def fetch_ordered_stops(gtfs_path=None, verbose=True):
+  """
+  Queries the stops along each route in ROUTE_LONGNAME_TO_ID.
+
+  gtfs_path (str or None) : If given, read the stops from this GTFS zip instead of the API (see read_gtfs).
+
+  Returns:
+    (dict) Maps each route name to its stop names, in order along the route.
+    (dict) Maps each stop name to its (latitude, longitude).
+  """
+  if gtfs_path is not None:
+    from utils.gtfs import read_gtfs
+    route_names = {route_id: route_name for route_name, route_id in ROUTE_LONGNAME_TO_ID.items()}
+    ordered_stop_names, coordinates, _ = read_gtfs(gtfs_path, route_names=route_names, verbose=verbose)
+    return ordered_stop_names, coordinates
+
+  from utils.mbta_api import get_route_stops_bulk
+  ordered_stop_names = {}
+  coordinates = {}
+
+  # Every route comes back from one request for their route patterns (see get_route_stops_bulk).
+  success, route_stops = get_route_stops_bulk(list(ROUTE_LONGNAME_TO_ID.values()))
+  if not success:
+    print("Error during API call:", route_stops)
+    route_stops = {}
+  for (route_name, route_id) in ROUTE_LONGNAME_TO_ID.items():
+    stops = route_stops.get(route_id, [])
+    ordered_stop_names[route_name] = [name for name, _, _ in stops]
+    for name, latitude, longitude in stops:
+      coordinates[name] = (latitude, longitude)
+
+  return ordered_stop_names, coordinates
+
+
+def preprocess_nominal(allow_cache=True, verbose=True, gtfs_path=None):
   """
   Builds a dictionary that maps the name of each stop to the names of routes that visit it.
 
   allow_cache (bool) : If True, will try to load precomputed results. If the cache is unavailable,
-                       will compute the data structure and save it.
+                       will compute the data structure and save it (along with a snapshot, see load_snapshot).
+  gtfs_path (str or None) : If given, build from this GTFS zip instead of querying the API.
 
   Returns (dict) :
     key (str): Stop name.
     value (set) : Set of route names that visit this stop.
   """
-  path_to_output = os.path.abspath(os.path.join(os.path.abspath(__file__), "../../output/"))
-  path_to_save = os.path.join(path_to_output, "routes_containing_stop_nominal.pkl")
+  path_to_save = path_to_output_file("routes_containing_stop_nominal.pkl")
 
   # If cached results exist, return them.
   if os.path.exists(path_to_save) and allow_cache:
     if verbose: print("NOTE: Using cached results from", path_to_save)
+    profiling.count("pickle_cache_hits")
     with open(path_to_save, "rb") as f:
       return pickle.load(f)
 
   # Otherwise, build the dictionary using API queries.
   routes_containing_stop = defaultdict(lambda: set())
 
-  for (route_name, route_id) in ROUTE_LONGNAME_TO_ID.items():
-    success, stops_json = get_stops([route_id], sort_by="name", descending=False)
-    if not success:
-      print("Error during API call:", stops_json)
-    stop_names = strip_attributes(stops_json, "/attributes/name")
+  ordered_stop_names, coordinates = fetch_ordered_stops(gtfs_path=gtfs_path, verbose=verbose)
+  for route_name, stop_names in ordered_stop_names.items():
     for stop_name in stop_names:
       routes_containing_stop[stop_name].add(route_name)
 
@@ -60,6 +100,8 @@ def preprocess_nominal(allow_cache=True, verbose=True):
   if allow_cache:
     with open(path_to_save, "wb") as f:
       f.write(pickle.dumps(dict(routes_containing_stop)))
+    write_snapshot(path_to_output_file("network_nominal.snap"), routes_containing_stop,
+                   route_stops=ordered_stop_names, coordinates=coordinates)
 
   return routes_containing_stop
 
@@ -74,7 +116,7 @@ def check_covid_shutdown(stop_name):
   return False
 
 
-def preprocess_covid(allow_cache=True, verbose=True):
+def preprocess_covid(allow_cache=True, verbose=True, gtfs_path=None):
   """
   Builds a dictionary that maps the name of each stop to the names of routes that visit it.
 
@@ -83,31 +125,27 @@ def preprocess_covid(allow_cache=True, verbose=True):
 
   allow_cache (bool) : If True, will try to load precomputed results. If the cache is unavailable,
                        will compute the data structure and save it.
+  gtfs_path (str or None) : If given, build from this GTFS zip instead of querying the API.
 
   Returns (dict) :
     key (str): Stop name.
     value (set) : Set of (modified) route names that visit this stop.
   """
-  path_to_output = os.path.abspath(os.path.join(os.path.abspath(__file__), "../../output/"))
-  path_to_save = os.path.join(path_to_output, "routes_containing_stop_covid.pkl")
+  path_to_save = path_to_output_file("routes_containing_stop_covid.pkl")
 
   if os.path.exists(path_to_save) and allow_cache:
     if verbose: print("NOTE: Using cached results from", path_to_save)
+    profiling.count("pickle_cache_hits")
     with open(path_to_save, "rb") as f:
       return pickle.load(f)
 
   # Get an ordered list of stops for each route.
-  ordered_stop_names = {}
-  for (route_name, route_id) in ROUTE_LONGNAME_TO_ID.items():
-    # NOTE: Important to sort_by None here, so that the ordering of stops is preserved.
-    success, stops_json = get_stops([route_id], sort_by=None, descending=False)
-    if not success:
-      print("Error during API call:", stops_json)
-    ordered_stop_names[route_name] = strip_attributes(stops_json, "/attributes/name")
+  ordered_stop_names, coordinates = fetch_ordered_stops(gtfs_path=gtfs_path, verbose=verbose)
 
   # Find connected components along each route - each route will be broken into
   # segments due to closures.
   routes_containing_stop = defaultdict(lambda: set())
+  component_stop_names = {}
   for route_name, stop_names in ordered_stop_names.items():
     components = [[]]
     for stop in stop_names:
@@ -120,6 +158,7 @@ def preprocess_covid(allow_cache=True, verbose=True):
 
     # Create a new route name for each componenent (i.e Green-B-0).
     for cmp_id, cmp_stops in enumerate(components):
+      component_stop_names["{}-{}".format(route_name, cmp_id)] = cmp_stops
       for stop in cmp_stops:
         routes_containing_stop[stop].add("{}-{}".format(route_name, cmp_id))
 
@@ -133,70 +172,552 @@ def preprocess_covid(allow_cache=True, verbose=True):
   if allow_cache:
     with open(path_to_save, "wb") as f:
       f.write(pickle.dumps(dict(routes_containing_stop)))
+    write_snapshot(path_to_output_file("network_covid.snap"), routes_containing_stop,
+                   route_stops=component_stop_names, coordinates=coordinates)
+
+  return routes_containing_stop
+
+
+def discover_routes(route_types=None, client=None):
+  """
+  Queries the routes of some types (or every route, if route_types is None) with get_routes.
+
+  Returns (dict) : Maps each route ID to its display name (see unique_route_names).
+  """
+  from utils.mbta_api import get_routes
+  success, routes_json = get_routes(route_types=route_types, sort_by=None, client=client)
+  if not success:
+    print("Error during API call:", routes_json)
+    return {}
+
+  return unique_route_names(project_attributes(
+      routes_json, ["/id", "/attributes/type", "/attributes/short_name", "/attributes/long_name"]))
+
+
+def stream_route_stops(route_ids, page_limit=100, max_workers=8, client=None):
+  """
+  Fetches the ordered stops along each route, with routes fetched concurrently and each route fetched
+  one page at a time. Every page is reduced to (name, latitude, longitude) tuples as soon as it arrives,
+  so at most max_workers raw pages are in memory at once.
+
+  Yields (in the order that routes finish):
+    (str) Route ID.
+    (bool) Whether every page was fetched successfully.
+    (list of tuple) The (stop name, latitude, longitude) of each stop in order along the route, or the
+                    JSON response of the failed page.
+  """
+  from concurrent.futures import ThreadPoolExecutor, as_completed
+  from utils.mbta_api import get_default_client, iter_stop_pages
+  client = client if client is not None else get_default_client()
+
+  def fetch(route_id):
+    stops = []
+    # NOTE: Important to sort_by None here, so that the ordering of stops is preserved.
+    for success, page_json in iter_stop_pages([route_id], sort_by=None, page_limit=page_limit, client=client):
+      if not success:
+        return False, page_json
+      stops.extend(project_attributes(page_json, ["/attributes/name", "/attributes/latitude", "/attributes/longitude"]))
+    return True, stops
+
+  with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(route_ids)))) as executor:
+    futures = {executor.submit(fetch, route_id): route_id for route_id in route_ids}
+    for future in as_completed(futures):
+      success, stops = future.result()
+      yield futures[future], success, stops
+
+
+def preprocess_all_routes(route_types=None, allow_cache=True, verbose=True, page_limit=100, max_workers=8, client=None,
+                          gtfs_path=None, routes_per_request=50):
+  """
+  Like preprocess_nominal, but for every MBTA route (bus, commuter rail, ferry and rapid transit), or the
+  routes of some types. Routes are discovered with get_routes instead of ROUTE_LONGNAME_TO_ID.
+
+  The stops of every route are fetched with a handful of bulk route pattern requests (see
+  get_route_stops_bulk), or with routes_per_request=None, with paginated stop requests for each route
+  that are indexed as they arrive (see stream_route_stops). The result is only cached as a snapshot
+  (output/network_all.snap), since a pickle of sets for the whole network is much larger and slower to load.
+
+  route_types (list of int or None) : Route types to include (see get_routes), or None for all of them.
+  allow_cache (bool) : If True, will try to load the snapshot, and will write one after querying the API.
+  gtfs_path (str or None) : If given, read every route from this GTFS zip instead of querying the API.
+  routes_per_request (int or None) : Number of routes to fetch in each route pattern request. If None,
+                                     fetch each route's stops separately, page_limit stops at a time.
+
+  Returns (dict) :
+    key (str): Stop name.
+    value (set) : Set of route names that visit this stop.
+  """
+  path_to_snapshot = path_to_output_file("network_all.snap")
+
+  if os.path.exists(path_to_snapshot) and allow_cache:
+    if verbose: print("NOTE: Using snapshot from", path_to_snapshot)
+    snapshot = Snapshot(path_to_snapshot)
+    routes_containing_stop = snapshot.routes_containing_stop()
+    snapshot.close()
+    return routes_containing_stop
+
+  routes_containing_stop = {}
+  if gtfs_path is not None:
+    from utils.gtfs import read_gtfs
+    ordered_stop_names, coordinates, _ = read_gtfs(gtfs_path, route_types=route_types, verbose=verbose)
+    for route_name, stop_names in ordered_stop_names.items():
+      for stop_name in stop_names:
+        routes_containing_stop.setdefault(stop_name, set()).add(route_name)
+    if allow_cache:
+      write_snapshot(path_to_snapshot, routes_containing_stop, route_stops=ordered_stop_names, coordinates=coordinates)
+    return routes_containing_stop
+
+  route_names = discover_routes(route_types=route_types, client=client)
+  if verbose: print("NOTE: Fetching the stops along {} routes".format(len(route_names)))
+
+  if routes_per_request is not None:
+    from utils.mbta_api import get_route_stops_bulk
+    success, route_stops = get_route_stops_bulk(list(route_names), routes_per_request=routes_per_request,
+                                                max_workers=max_workers, client=client)
+    fetched = [(route_id, success, stops) for route_id, stops in route_stops.items()] if success else \
+              [(None, False, route_stops)]
+  else:
+    fetched = stream_route_stops(list(route_names), page_limit=page_limit, max_workers=max_workers, client=client)
+
+  ordered_stop_names = {}
+  coordinates = {}
+  for route_id, success, stops in fetched:
+    if not success:
+      print("Error during API call:", stops)
+      continue
+    route_name = route_names[route_id]
+    # Intern names, since the same stop names show up on many routes.
+    ordered_stop_names[route_name] = [sys.intern(name) for name, _, _ in stops]
+    for name, latitude, longitude in stops:
+      routes_containing_stop.setdefault(sys.intern(name), set()).add(route_name)
+      coordinates[name] = (latitude, longitude)
+
+  if allow_cache:
+    write_snapshot(path_to_snapshot, routes_containing_stop, route_stops=ordered_stop_names, coordinates=coordinates)
 
   return routes_containing_stop
 
 
-def find_coarse_route(stop_A, stop_B, routes_containing_stop):
+def network_name(all_routes=False, covid=False):
+  """
+  Returns (str) : The name of the network that the --all-routes and --covid options select, for load_snapshot.
+  """
+  return "all" if all_routes else ("covid" if covid else "nominal")
+
+
+def load_snapshot(name, allow_cache=True, verbose=True, gtfs_path=None):
+  """
+  Opens the binary snapshot of a network (see utils/snapshot.py), which loads much faster than the
+  pickle caches, and can be shared between processes.
+
+  If the snapshot doesn't exist yet, the network is preprocessed with preprocess_nominal/preprocess_covid
+  and a snapshot is written. Snapshots written from the pickle caches don't have stop coordinates.
+
+  name (str) : Either "nominal", "covid", or "all" (every route type, see preprocess_all_routes).
+  allow_cache (bool) : If False, always preprocess the network again (querying the API).
+  gtfs_path (str or None) : If given, preprocess from this GTFS zip instead of the API (see read_gtfs).
+
+  Returns (Snapshot)
+  """
+  path_to_snapshot = path_to_output_file("network_{}.snap".format(name))
+
+  if os.path.exists(path_to_snapshot) and allow_cache:
+    if verbose: print("NOTE: Using snapshot from", path_to_snapshot)
+    profiling.count("snapshot_cache_hits")
+    with profiling.timed("snapshot_load"):
+      return Snapshot(path_to_snapshot)
+
+  profiling.count("snapshot_cache_misses")
+  preprocess = {"nominal": preprocess_nominal, "covid": preprocess_covid, "all": preprocess_all_routes}[name]
+  with profiling.timed("preprocess_" + name):
+    routes_containing_stop = preprocess(allow_cache=allow_cache, verbose=verbose, gtfs_path=gtfs_path)
+
+  # Preprocessing from the API writes a snapshot with coordinates. Otherwise, write one from the dictionary.
+  if not os.path.exists(path_to_snapshot) or not allow_cache:
+    write_snapshot(path_to_snapshot, routes_containing_stop)
+
+  return Snapshot(path_to_snapshot)
+
+
+# Every TransitGraph that's built or updated gets the next number, so a version identifies one graph
+# for the lifetime of the process (i.e for caches of query results, see utils/route_cache.py).
+_GRAPH_VERSIONS = count(1)
+
+
+class TransitGraph(object):
+  """
+  Route-level graph that is built once from the output of preprocess_nominal/preprocess_covid,
+  and then shared across many calls to find_coarse_route.
+
+  Stops and routes are interned to integer ids (in sorted name order, so ids are stable for a given
+  network). All of the index structures are tuples, so the graph is never modified after it's built.
+  Changes to the network are made with updated(), which returns a new graph with a new version.
+
+  routes_containing_stop (dict) :
+    key (str): Stop name.
+    value (set) : Set of route names that visit this stop.
+  """
+  __slots__ = ("stop_names", "route_names", "stop_ids", "route_ids", "stop_routes", "route_stops", "adjacent",
+               "version")
+
+  def __init__(self, routes_containing_stop):
+    with profiling.timed("graph_build"):
+      stop_names = tuple(sorted(routes_containing_stop))
+      route_names = tuple(sorted(set().union(*routes_containing_stop.values())))
+      route_ids = {name: i for i, name in enumerate(route_names)}
+
+      # For each stop id, the sorted tuple of route ids that visit it.
+      stop_routes = tuple(
+          tuple(sorted(route_ids[r] for r in routes_containing_stop[name])) for name in stop_names)
+
+      self._index(stop_names, route_names, stop_routes)
+
+  @classmethod
+  def from_snapshot(cls, snapshot):
+    """
+    Builds the graph from the integer arrays in a Snapshot, without materializing any sets of names.
+    """
+    with profiling.timed("graph_build"):
+      graph = cls.__new__(cls)
+      indptr, indices = snapshot.stop_routes_indptr, snapshot.stop_routes_indices
+      stop_routes = tuple(tuple(indices[indptr[i]:indptr[i + 1]]) for i in range(snapshot.num_stops))
+      graph._index(tuple(snapshot.stop_names()), tuple(snapshot.route_names()), stop_routes)
+    return graph
+
+  def _index(self, stop_names, route_names, stop_routes):
+    stop_ids = {name: i for i, name in enumerate(stop_names)}
+    route_ids = {name: i for i, name in enumerate(route_names)}
+
+    route_stops = [[] for _ in route_names]
+    for stop_id, routes in enumerate(stop_routes):
+      for route_id in routes:
+        route_stops[route_id].append(stop_id)
+
+    # Adjacency list where node (route id) maps to (other route id, connecting stop id) pairs.
+    adjacent = [set() for _ in route_names]
+    for stop_id, routes in enumerate(stop_routes):
+      if len(routes) > 1:
+        for (route_i, route_j) in combinations(routes, r=2):
+          adjacent[route_i].add((route_j, stop_id))
+          adjacent[route_j].add((route_i, stop_id))
+
+    self.stop_names = stop_names
+    self.route_names = route_names
+    self.stop_ids = stop_ids
+    self.route_ids = route_ids
+    self.stop_routes = stop_routes
+    self.route_stops = tuple(tuple(stops) for stops in route_stops)
+    self.adjacent = tuple(tuple(sorted(edges)) for edges in adjacent)
+    self.version = next(_GRAPH_VERSIONS)
+
+  def updated(self, changes):
+    """
+    Returns a new graph where the routes visiting some stops have changed. Only the index entries for the
+    changed stops, and the routes that visit them, are rebuilt. Everything else is shared with this graph,
+    so an update costs time proportional to the size of the affected routes, not the whole network.
+
+    Existing stop and route ids never change: new stops and routes are appended, and a stop whose set of
+    routes is empty is treated as closed (it's no longer "in" the graph).
+
+    changes (dict) :
+      key (str) : Stop name.
+      value (set) : The new set of route names that visit this stop (empty to close it).
+    """
+    stop_names, stop_ids = self.stop_names, self.stop_ids
+    route_names, route_ids = self.route_names, self.route_ids
+
+    new_stops = [name for name in changes if name not in stop_ids]
+    if len(new_stops) > 0:
+      stop_names = stop_names + tuple(new_stops)
+      stop_ids = dict(stop_ids)
+      stop_ids.update((name, len(self.stop_names) + i) for i, name in enumerate(new_stops))
+
+    new_routes = sorted(set().union(*changes.values()).difference(route_ids))
+    if len(new_routes) > 0:
+      route_names = route_names + tuple(new_routes)
+      route_ids = dict(route_ids)
+      route_ids.update((name, len(self.route_names) + i) for i, name in enumerate(new_routes))
+
+    stop_routes = list(self.stop_routes) + [()] * len(new_stops)
+    route_stops = list(self.route_stops) + [()] * len(new_routes)
+    adjacent = list(self.adjacent) + [()] * len(new_routes)
+
+    # Update the changed stops, and keep track of every route that gained or lost one of them.
+    affected = set()
+    changed_stops = set()
+    changed_stops_on_route = {}
+    for stop_name, routes in changes.items():
+      stop_id = stop_ids[stop_name]
+      changed_stops.add(stop_id)
+      affected.update(stop_routes[stop_id])
+      stop_routes[stop_id] = tuple(sorted(route_ids[r] for r in routes))
+      for route in stop_routes[stop_id]:
+        changed_stops_on_route.setdefault(route, []).append(stop_id)
+      affected.update(stop_routes[stop_id])
+
+    for route in affected:
+      stops = [s for s in route_stops[route] if s not in changed_stops]
+      stops.extend(changed_stops_on_route.get(route, ()))
+      route_stops[route] = tuple(sorted(stops))
+
+    # Only routes that share a changed stop can gain or lose edges, and all of those are affected.
+    for route in affected:
+      edges = set()
+      for stop in route_stops[route]:
+        for other in stop_routes[stop]:
+          if other != route:
+            edges.add((other, stop))
+      adjacent[route] = tuple(sorted(edges))
+
+    graph = TransitGraph.__new__(TransitGraph)
+    graph.stop_names = stop_names
+    graph.route_names = route_names
+    graph.stop_ids = stop_ids
+    graph.route_ids = route_ids
+    graph.stop_routes = tuple(stop_routes)
+    graph.route_stops = tuple(route_stops)
+    graph.adjacent = tuple(adjacent)
+    graph.version = next(_GRAPH_VERSIONS)
+    return graph
+
+  def __contains__(self, stop_name):
+    stop_id = self.stop_ids.get(stop_name)
+    return stop_id is not None and len(self.stop_routes[stop_id]) > 0
+
+  def __len__(self):
+    return len(self.stop_names)
+
+  def routes_at(self, stop_name):
+    """
+    Returns the set of route names that visit stop_name.
+    """
+    return {self.route_names[r] for r in self.stop_routes[self.stop_ids[stop_name]]}
+
+
+def nearest_stop_name(stop_index, coordinates, graph):
+  """
+  Returns the name of the open stop in graph that is nearest to (latitude, longitude), or None.
+  """
+  nearest = stop_index.nearest_stops(coordinates[0], coordinates[1], k=1, accept=graph)
+  return nearest[0][0] if len(nearest) > 0 else None
+
+
+def find_coarse_route(stop_A, stop_B, graph, stop_index=None):
   """
   Finds an ordered list of routes that someone could take to go from stop_A to stop_B.
 
   Uses a graph representation where routes are nodes, and edges are shared stops where
   you could transfer from one route to the other.
+
+  graph (TransitGraph or dict) : A prebuilt TransitGraph. For convenience, a routes_containing_stop
+                                 dictionary is also accepted, but then the graph is rebuilt on every
+                                 call, so callers doing many queries should build a TransitGraph once.
+  stop_index (StopIndex or None) : If given, stop_A and stop_B can also be (latitude, longitude) tuples,
+                                   which are replaced by the nearest open stop.
   """
-  # Adjacency list where node (route) maps to a set of other nodes that it can connect to.
-  adjacent = defaultdict(lambda: set())
+  if profiling.PROFILER is None:
+    return _find_coarse_route(stop_A, stop_B, graph, stop_index)
+  t0 = time.perf_counter()
+  result = _find_coarse_route(stop_A, stop_B, graph, stop_index)
+  profiling.PROFILER.record("route_query", time.perf_counter() - t0)
+  return result
+
+
+def _find_coarse_route(stop_A, stop_B, graph, stop_index):
+  if not isinstance(graph, TransitGraph):
+    graph = TransitGraph(graph)
+
+  if stop_index is not None:
+    if isinstance(stop_A, tuple):
+      stop_A = nearest_stop_name(stop_index, stop_A, graph)
+    if isinstance(stop_B, tuple):
+      stop_B = nearest_stop_name(stop_index, stop_B, graph)
 
   # Easy case #0 (COVID): If stop_A or stop_B are no longer operating, return failure.
-  if stop_A not in routes_containing_stop or stop_B not in routes_containing_stop:
+  if stop_A not in graph or stop_B not in graph:
     print("WARNING: one of {} or {} is either invalid or closed due to COVID".format(stop_A, stop_B))
     return False, []
 
-  possible_routes_A = routes_containing_stop[stop_A] # Possible routes to start on.
-  possible_routes_B = routes_containing_stop[stop_B] # Possible routes to end on.
-
-  # Build the graph: for each pair of nodes (routes), add an edge if they share a stop.
-  for stop in routes_containing_stop:
-    if len(routes_containing_stop[stop]) > 1:
-      route_pairs = list(combinations(routes_containing_stop[stop], r=2))
-      for (route_i, route_j) in route_pairs:
-        adjacent[route_i].add((route_j, stop))
-        adjacent[route_j].add((route_i, stop))
-
   # Easy case #1: stop_A and stop_B are the same.
   if stop_A == stop_B:
     print("WARNING: {} and {} are the same, empty route returned".format(stop_A, stop_B))
     return True, []
 
-  # Easy case #2: If stop_A and stop_B are on the same route already, return that one.
-  if len(possible_routes_A.intersection(possible_routes_B)) > 0:
-    shared_route = possible_routes_A.intersection(possible_routes_B).pop()
-    return True, [RouteNode(name=shared_route, parent_node=None, connect_stop=stop_A)]
+  possible_routes_A = graph.stop_routes[graph.stop_ids[stop_A]] # Possible routes to start on.
+  possible_routes_B = graph.stop_routes[graph.stop_ids[stop_B]] # Possible routes to end on.
+  path = route_ids_between(graph, possible_routes_A, possible_routes_B)
+  if path is None:
+    return False, []
+  return True, route_nodes(graph, stop_A, *path)
 
-  # Otherwise, do BFS to find the path with the minimum # of transfers.
-  frontier = deque([RouteNode(name=name, parent_node=None, connect_stop=stop_A) for name in possible_routes_A])
-  explored = possible_routes_A.copy()
 
-  while len(frontier) > 0:
-    node = frontier.pop()
-    explored.add(node.name)
+def route_ids_between(graph, routes_A, routes_B):
+  """
+  Finds the routes to take from a stop visited by routes_A to a stop visited by routes_B. The answer
+  only depends on these two sets of route ids (and the graph), not on the stops themselves.
 
-    # If any route that contains the goal is explored, done.
-    if node.name in possible_routes_B:
-      break
+  Returns (tuple or None) : (route ids, connect stop ids) as returned by search_route_ids, or None if
+                            there isn't a path.
+  """
+  # Easy case #2: If stop_A and stop_B are on the same route already, return that one.
+  for route in routes_A:
+    if route in routes_B:
+      return (route,), (-1,)
 
-    # Add all adjacent routes that haven't been explored yet.
-    for other_name, connect_stop in adjacent[node.name]:
-      if other_name not in explored:
-        frontier.appendleft(RouteNode(name=other_name, parent_node=node, connect_stop=connect_stop))
+  # Otherwise, search for the path with the minimum # of transfers.
+  routes, connect_stops, num_expanded = search_route_ids(graph, routes_A, routes_B)
+  if profiling.PROFILER is not None:
+    profiling.PROFILER.count("route_searches")
+    profiling.PROFILER.count("routes_expanded", num_expanded)
+  if routes is None:
+    return None
+  return tuple(routes), tuple(connect_stops)
 
-  # Trace back parent points to reconstruction sequence, then reverse order.
-  did_find_route = (node.name in possible_routes_B)
 
-  sequence = [node]
-  while node.parent_node is not None:
-    node = node.parent_node
+def route_nodes(graph, stop_A, routes, connect_stops):
+  """
+  Turns the route ids and connect stop ids from route_ids_between into the RouteNodes that
+  find_coarse_route returns.
+  """
+  route_names, stop_names = graph.route_names, graph.stop_names
+  sequence = []
+  node = None
+  for route, connect_stop in zip(routes, connect_stops):
+    connect_name = stop_A if connect_stop < 0 else stop_names[connect_stop]
+    node = RouteNode(name=route_names[route], parent_node=node, connect_stop=connect_name)
     sequence.append(node)
-  sequence.reverse()
+  return sequence
 
-  return did_find_route, sequence
+
+def search_route_ids(graph, start_routes, goal_routes, bidirectional=True):
+  """
+  Finds a path with the fewest transfers from any of start_routes to any of goal_routes, in the route
+  graph of a TransitGraph. This is the search behind find_coarse_route.
+
+  The result is the same path that a one-sided BFS from start_routes would find (visiting start_routes
+  and each route's neighbors in id order, and stopping at the first goal route it reaches). With
+  bidirectional=True, full levels are expanded from whichever side has the smaller frontier until the
+  two searches meet, and then the forward search is extended through the routes that the backward
+  search found on shortest paths, using the same tie-breaking as the one-sided BFS. All state is kept
+  in flat lists indexed by route id.
+
+  start_routes (iterable of int) : Route ids to start on (i.e the routes that visit stop A).
+  goal_routes (iterable of int) : Route ids to end on.
+  bidirectional (bool) : If False, use a one-sided BFS.
+
+  Returns:
+    (list of int or None) Route ids along the path, or None if there isn't one.
+    (list of int) For each route, the id of the stop where it's boarded, or -1 for the first route.
+    (int) The number of routes whose neighbors were scanned by the search.
+  """
+  adjacent = graph.adjacent
+  num_routes = len(graph.route_names)
+  parent = [-1] * num_routes
+  parent_stop = [-1] * num_routes
+  dist_forward = [-1] * num_routes # Number of transfers from start_routes, or -1 if not reached yet.
+  dist_backward = [-1] * num_routes # Number of transfers to goal_routes, or -1 if not reached yet.
+
+  levels = [[]]
+  for route in start_routes:
+    if dist_forward[route] < 0:
+      dist_forward[route] = 0
+      levels[0].append(route)
+  backward_levels = [[]]
+  for route in goal_routes:
+    if dist_backward[route] < 0:
+      dist_backward[route] = 0
+      backward_levels[0].append(route)
+
+  num_expanded = 0
+  best = -1 # Length of the shortest path, once it's known.
+  for route in levels[0]:
+    if dist_backward[route] == 0:
+      best = 0
+
+  while best < 0:
+    forward_level, backward_level = levels[-1], backward_levels[-1]
+    if len(forward_level) == 0 or len(backward_level) == 0:
+      return None, [], num_expanded
+
+    if not bidirectional:
+      # Stop at the first goal route, in the order a FIFO queue would dequeue them.
+      next_level = []
+      depth = len(levels) - 1
+      for route in forward_level:
+        num_expanded += 1
+        for other, connect_stop in adjacent[route]:
+          if dist_forward[other] < 0:
+            dist_forward[other] = depth + 1
+            parent[other] = route
+            parent_stop[other] = connect_stop
+            next_level.append(other)
+      levels.append(next_level)
+      for route in next_level:
+        if dist_backward[route] == 0:
+          best = depth + 1
+          break
+
+    elif len(forward_level) <= len(backward_level):
+      next_level = []
+      depth = len(levels) - 1
+      for route in forward_level:
+        num_expanded += 1
+        for other, connect_stop in adjacent[route]:
+          if dist_forward[other] < 0:
+            dist_forward[other] = depth + 1
+            parent[other] = route
+            parent_stop[other] = connect_stop
+            next_level.append(other)
+            if dist_backward[other] >= 0 and (best < 0 or depth + 1 + dist_backward[other] < best):
+              best = depth + 1 + dist_backward[other]
+      levels.append(next_level)
+
+    else:
+      next_level = []
+      depth = len(backward_levels) - 1
+      for route in backward_level:
+        num_expanded += 1
+        for other, _ in adjacent[route]:
+          if dist_backward[other] < 0:
+            dist_backward[other] = depth + 1
+            next_level.append(other)
+            if dist_forward[other] >= 0 and (best < 0 or dist_forward[other] + depth + 1 < best):
+              best = dist_forward[other] + depth + 1
+      backward_levels.append(next_level)
+
+  # Extend the forward search past its last level, through the routes that are on a shortest path (those that
+  # are exactly one transfer closer to the goal, which the backward search already found). Each of them is
+  # given the parent that a one-sided BFS would have discovered it from first: its neighbor that comes
+  # earliest in the previous level. Then each level is sorted into the order a one-sided BFS would queue it.
+  level = levels[min(best, len(levels) - 1)]
+  order = [-1] * num_routes
+  for i, route in enumerate(level):
+    order[route] = i
+  for depth in range(len(levels) - 1, best):
+    next_level = []
+    for route in backward_levels[best - depth - 1]:
+      num_expanded += 1
+      first = -1
+      for other, connect_stop in adjacent[route]:
+        if dist_forward[other] == depth and (first < 0 or order[other] < order[first]):
+          first, first_stop = other, connect_stop
+      if first >= 0:
+        dist_forward[route] = depth + 1
+        parent[route] = first
+        parent_stop[route] = first_stop
+        next_level.append(route)
+    next_level.sort(key=lambda route: (order[parent[route]], route))
+    for i, route in enumerate(next_level):
+      order[route] = i
+    level = next_level
+
+  goal = next(route for route in level if dist_backward[route] == 0)
+  routes = []
+  connect_stops = []
+  while goal >= 0:
+    routes.append(goal)
+    connect_stops.append(parent_stop[goal])
+    goal = parent[goal]
+  routes.reverse()
+  connect_stops.reverse()
+  return routes, connect_stops, num_expanded
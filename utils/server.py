@@ -0,0 +1,231 @@
+import asyncio, json, os, time
+from urllib.parse import parse_qsl, urlsplit
+
+from utils.batch import route_to_json
+from utils.profiling import LATENCY_BUCKETS_MS, LatencyHistogram
+from utils.route_cache import RouteCache
+from utils.routing import TransitGraph
+from utils.snapshot import Snapshot
+
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class RoutingService(object):
+  """
+  Holds the route graph for a snapshot file, and swaps in a new graph when the file changes.
+
+  Each request should grab self.graph once. A reload builds the new graph on the side and then replaces
+  the reference, so requests that are in flight finish on the graph they started with. Searches are
+  memoized in a RouteCache, which is invalidated when a new graph is swapped in.
+
+  snapshot_path (str) : Path to a snapshot written by write_snapshot (i.e output/network_nominal.snap).
+  """
+  def __init__(self, snapshot_path):
+    self.snapshot_path = snapshot_path
+    self.version = 0
+    self.num_reloads = 0
+    self._stat_key = None
+    self.graph = None
+    self.cache = RouteCache()
+    self.reload_if_changed()
+
+  def _stat(self):
+    try:
+      st = os.stat(self.snapshot_path)
+    except FileNotFoundError:
+      return None
+    # write_snapshot replaces the file, so the inode changes even if the size and mtime don't.
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+  def reload_if_changed(self):
+    """
+    Rebuilds the graph if the snapshot file was replaced since it was last loaded.
+
+    Returns (bool) : Whether a new graph was swapped in.
+    """
+    stat_key = self._stat()
+    if stat_key is None or stat_key == self._stat_key:
+      return False
+
+    snapshot = Snapshot(self.snapshot_path)
+    try:
+      graph = TransitGraph.from_snapshot(snapshot)
+    finally:
+      snapshot.close()
+
+    self._stat_key = stat_key
+    if self.graph is not None:
+      self.num_reloads += 1
+    self.graph = graph
+    self.version += 1
+    return True
+
+  def route(self, stop_A, stop_B, graph=None):
+    graph = self.graph if graph is None else graph
+    return route_to_json(stop_A, stop_B, lambda A, B: self.cache.find_coarse_route(A, B, graph), graph)
+
+  def route_many(self, pairs):
+    """
+    Routes every (stop_A, stop_B) pair on the same graph, even if a reload happens partway through.
+    """
+    graph = self.graph
+    return [self.route(stop_A, stop_B, graph=graph) for stop_A, stop_B in pairs]
+
+
+class RoutingServer(object):
+  """
+  Minimal asyncio HTTP/1.1 server (with keep-alive) for a RoutingService.
+
+  Endpoints:
+    GET /route?from=A&to=B : Routes one pair. Returns the same JSON object as --batch mode.
+    POST /routes : Routes many pairs in one request. The body is a JSON list of {"from": A, "to": B} (or
+                   {"A": A, "B": B}) objects, and the response is a JSON list of results in the same order.
+    GET /metrics : Latency histograms for each endpoint, route cache hits and misses, and the network version.
+    GET /healthz : Returns {"ok": true} once the network is loaded.
+
+  service (RoutingService) : The network to serve.
+  reload_interval (float) : How often (seconds) to check whether the snapshot file changed.
+  max_body_bytes (int) : Largest POST body that is accepted.
+  """
+  def __init__(self, service, host="127.0.0.1", port=8080, reload_interval=1.0, max_body_bytes=16 * 1024 * 1024):
+    self.service = service
+    self.host = host
+    self.port = port
+    self.reload_interval = reload_interval
+    self.max_body_bytes = max_body_bytes
+    self.latency = {"/route": LatencyHistogram(), "/routes": LatencyHistogram()}
+    self.num_requests = 0
+    self.num_routed = 0
+    self._server = None
+    self._reload_task = None
+
+  async def start(self):
+    self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+    self.port = self._server.sockets[0].getsockname()[1]
+    if self.reload_interval is not None and self.reload_interval > 0:
+      self._reload_task = asyncio.ensure_future(self._watch_snapshot())
+
+  async def serve_forever(self):
+    if self._server is None:
+      await self.start()
+    async with self._server:
+      await self._server.serve_forever()
+
+  async def close(self):
+    if self._reload_task is not None:
+      self._reload_task.cancel()
+      try:
+        await self._reload_task
+      except asyncio.CancelledError:
+        pass
+    if self._server is not None:
+      self._server.close()
+      await self._server.wait_closed()
+
+  async def _watch_snapshot(self):
+    loop = asyncio.get_event_loop()
+    while True:
+      await asyncio.sleep(self.reload_interval)
+      try:
+        # Build the new graph in a thread, so that requests keep being served while it loads.
+        if await loop.run_in_executor(None, self.service.reload_if_changed):
+          print("NOTE: Reloaded {} (version {})".format(self.service.snapshot_path, self.service.version))
+      except Exception as e:
+        print("WARNING: Failed to reload {}: {}".format(self.service.snapshot_path, e))
+
+  async def _handle_connection(self, reader, writer):
+    try:
+      while True:
+        request_line = await reader.readline()
+        if len(request_line) == 0:
+          break
+        parts = request_line.decode("latin-1").split()
+        if len(parts) != 3:
+          await self._respond(writer, 400, {"error": "Malformed request line"}, keep_alive=False)
+          break
+        method, target, version = parts
+
+        headers = {}
+        while True:
+          line = await reader.readline()
+          if line in (b"\r\n", b"\n", b""):
+            break
+          key, _, value = line.decode("latin-1").partition(":")
+          headers[key.strip().lower()] = value.strip()
+
+        keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+        length = int(headers.get("content-length", 0) or 0)
+        if length > self.max_body_bytes:
+          await self._respond(writer, 413, {"error": "Body is larger than {} bytes".format(self.max_body_bytes)},
+                              keep_alive=False)
+          break
+        body = await reader.readexactly(length) if length > 0 else b""
+
+        status, payload = self._dispatch(method, target, body)
+        await self._respond(writer, status, payload, keep_alive)
+        if not keep_alive:
+          break
+    except (asyncio.IncompleteReadError, ConnectionError):
+      pass
+    finally:
+      writer.close()
+
+  def _dispatch(self, method, target, body):
+    self.num_requests += 1
+    url = urlsplit(target)
+    params = dict(parse_qsl(url.query))
+    t0 = time.perf_counter()
+
+    try:
+      if url.path == "/route":
+        if method != "GET":
+          return 405, {"error": "Use GET for /route"}
+        if "from" not in params or "to" not in params:
+          return 400, {"error": "Missing 'from' or 'to' parameter"}
+        result = self.service.route(params["from"], params["to"])
+        self.num_routed += 1
+        self.latency["/route"].record(time.perf_counter() - t0)
+        return 200, result
+
+      if url.path == "/routes":
+        if method != "POST":
+          return 405, {"error": "Use POST for /routes"}
+        try:
+          queries = json.loads(body.decode("utf-8"))
+          pairs = [(q["from"], q["to"]) if "from" in q else (q["A"], q["B"]) for q in queries]
+        except (ValueError, KeyError, TypeError):
+          return 400, {"error": "Expected a JSON list of {\"from\": ..., \"to\": ...} objects"}
+        results = self.service.route_many(pairs)
+        self.num_routed += len(results)
+        self.latency["/routes"].record(time.perf_counter() - t0)
+        return 200, results
+
+      if url.path == "/metrics":
+        return 200, self.metrics()
+
+      if url.path == "/healthz":
+        return 200, {"ok": self.service.graph is not None, "version": self.service.version}
+
+      return 404, {"error": "Unknown path {}".format(url.path)}
+    except Exception as e:
+      return 500, {"error": str(e)}
+
+  def metrics(self):
+    return {
+      "network_version": self.service.version,
+      "num_reloads": self.service.num_reloads,
+      "num_requests": self.num_requests,
+      "num_routed": self.num_routed,
+      "route_cache": {"hits": self.service.cache.hits, "misses": self.service.cache.misses,
+                      "invalidations": self.service.cache.invalidations},
+      "latency": {path: histogram.to_json() for path, histogram in self.latency.items()},
+    }
+
+  async def _respond(self, writer, status, payload, keep_alive):
+    body = json.dumps(payload).encode("utf-8")
+    head = "HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n".format(
+        status, _REASONS.get(status, ""), len(body), "keep-alive" if keep_alive else "close")
+    writer.write(head.encode("latin-1") + body)
+    await writer.drain()
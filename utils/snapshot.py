@@ -0,0 +1,204 @@
+import mmap, os, struct, sys
+from array import array
+from bisect import bisect_left
+
+
+SNAPSHOT_MAGIC = b"MBTASNAP"
+SNAPSHOT_VERSION = 1
+
+# magic, version, num_stops, num_routes, num_stop_routes, num_route_stops, stop_blob_len, route_blob_len
+_HEADER = struct.Struct("<8s7I")
+_HEADER_SIZE = 48 # Padded so that the arrays that follow are 8-byte aligned.
+
+
+def _align(n, alignment=8):
+  return (n + alignment - 1) // alignment * alignment
+
+
+def _to_little_endian(arr):
+  if sys.byteorder == "big":
+    arr = array(arr.typecode, arr)
+    arr.byteswap()
+  return arr.tobytes()
+
+
+def write_snapshot(path, routes_containing_stop, route_stops=None, coordinates=None):
+  """
+  Writes a network to a versioned binary snapshot file that can be opened with Snapshot.
+
+  The file holds interned (sorted) stop and route name tables, CSR-style int32 arrays for stop => routes
+  and route => stops, and float64 stop coordinates. Unlike the pickle caches, loading it doesn't create
+  any per-stop Python objects, and it is safe to copy between hosts.
+
+  routes_containing_stop (dict) : Output of preprocess_nominal/preprocess_covid.
+  route_stops (dict or None) : Maps each route name to its stop names in order along the route. If None,
+                               each route's stops are listed in stop id order.
+  coordinates (dict or None) : Maps stop names to (latitude, longitude). Missing stops are stored as NaN.
+  """
+  stop_names = sorted(routes_containing_stop)
+  route_names = sorted(set().union(*routes_containing_stop.values()))
+  stop_ids = {name: i for i, name in enumerate(stop_names)}
+  route_ids = {name: i for i, name in enumerate(route_names)}
+
+  if route_stops is None:
+    route_stops = {name: [] for name in route_names}
+    for stop_name in stop_names:
+      for route_name in routes_containing_stop[stop_name]:
+        route_stops[route_name].append(stop_name)
+
+  stop_routes_indptr, stop_routes_indices = array("i", [0]), array("i")
+  for stop_name in stop_names:
+    stop_routes_indices.extend(sorted(route_ids[r] for r in routes_containing_stop[stop_name]))
+    stop_routes_indptr.append(len(stop_routes_indices))
+
+  route_stops_indptr, route_stops_indices = array("i", [0]), array("i")
+  for route_name in route_names:
+    route_stops_indices.extend(stop_ids[s] for s in route_stops.get(route_name, []) if s in stop_ids)
+    route_stops_indptr.append(len(route_stops_indices))
+
+  coords = array("d", [float("nan")]) * (2 * len(stop_names))
+  for stop_name, (latitude, longitude) in (coordinates or {}).items():
+    if stop_name in stop_ids:
+      coords[2 * stop_ids[stop_name]] = latitude
+      coords[2 * stop_ids[stop_name] + 1] = longitude
+
+  def string_table(names):
+    offsets, blob = array("i", [0]), bytearray()
+    for name in names:
+      blob.extend(name.encode("utf-8"))
+      offsets.append(len(blob))
+    return offsets, bytes(blob)
+
+  stop_name_offsets, stop_blob = string_table(stop_names)
+  route_name_offsets, route_blob = string_table(route_names)
+
+  sections = [stop_name_offsets, route_name_offsets, stop_routes_indptr, stop_routes_indices,
+              route_stops_indptr, route_stops_indices]
+
+  header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(stop_names), len(route_names),
+                        len(stop_routes_indices), len(route_stops_indices), len(stop_blob), len(route_blob))
+
+  # Write to a temporary file first, so that readers never see a partially written snapshot.
+  tmp_path = "{}.{}.tmp".format(path, os.getpid())
+  with open(tmp_path, "wb") as f:
+    f.write(header.ljust(_HEADER_SIZE, b"\0"))
+    for section in sections:
+      data = _to_little_endian(section)
+      f.write(data.ljust(_align(len(data)), b"\0"))
+    f.write(_to_little_endian(coords))
+    f.write(stop_blob)
+    f.write(route_blob)
+  os.replace(tmp_path, path)
+
+
+class Snapshot(object):
+  """
+  Read-only view of a snapshot file written by write_snapshot.
+
+  The file is memory mapped, and the arrays are memoryviews into the mapping, so opening a snapshot only
+  reads the header, and several processes that open the same file share the same pages. Names are only
+  decoded when they are asked for.
+
+  path (str) : Path to the snapshot file.
+  """
+  def __init__(self, path):
+    self.path = path
+    with open(path, "rb") as f:
+      self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    self._buffer = memoryview(self._mmap)
+
+    magic, version, num_stops, num_routes, num_stop_routes, num_route_stops, stop_blob_len, route_blob_len = \
+        _HEADER.unpack_from(self._buffer, 0)
+    if magic != SNAPSHOT_MAGIC:
+      raise ValueError("{} is not a network snapshot".format(path))
+    if version != SNAPSHOT_VERSION:
+      raise ValueError("{} has snapshot version {}, expected {}".format(path, version, SNAPSHOT_VERSION))
+
+    self.version = version
+    self.num_stops = num_stops
+    self.num_routes = num_routes
+
+    self._offset = _HEADER_SIZE
+    self._stop_name_offsets = self._take("i", num_stops + 1)
+    self._route_name_offsets = self._take("i", num_routes + 1)
+    self.stop_routes_indptr = self._take("i", num_stops + 1)
+    self.stop_routes_indices = self._take("i", num_stop_routes)
+    self.route_stops_indptr = self._take("i", num_routes + 1)
+    self.route_stops_indices = self._take("i", num_route_stops)
+    self.coordinates = self._take("d", 2 * num_stops)
+    self._stop_blob = self._buffer[self._offset:self._offset + stop_blob_len]
+    self._route_blob = self._buffer[self._offset + stop_blob_len:self._offset + stop_blob_len + route_blob_len]
+
+  def _take(self, typecode, count):
+    itemsize = array(typecode).itemsize
+    data = self._buffer[self._offset:self._offset + count * itemsize]
+    self._offset += _align(count * itemsize)
+    if sys.byteorder == "big":
+      arr = array(typecode, data.tobytes())
+      arr.byteswap()
+      return memoryview(arr)
+    return data.cast(typecode)
+
+  def stop_name(self, stop_id):
+    return bytes(self._stop_blob[self._stop_name_offsets[stop_id]:self._stop_name_offsets[stop_id + 1]]).decode("utf-8")
+
+  def route_name(self, route_id):
+    return bytes(self._route_blob[self._route_name_offsets[route_id]:self._route_name_offsets[route_id + 1]]).decode("utf-8")
+
+  def stop_names(self):
+    return [self.stop_name(i) for i in range(self.num_stops)]
+
+  def route_names(self):
+    return [self.route_name(i) for i in range(self.num_routes)]
+
+  def stop_id(self, stop_name):
+    """
+    Returns the id of a stop (binary search over the sorted name table), or -1 if it doesn't exist.
+    """
+    names = _LazyNames(self.stop_name, self.num_stops)
+    i = bisect_left(names, stop_name)
+    return i if (i < self.num_stops and names[i] == stop_name) else -1
+
+  def __contains__(self, stop_name):
+    return self.stop_id(stop_name) >= 0
+
+  def stop_routes(self, stop_id):
+    return self.stop_routes_indices[self.stop_routes_indptr[stop_id]:self.stop_routes_indptr[stop_id + 1]]
+
+  def route_stops(self, route_id):
+    return self.route_stops_indices[self.route_stops_indptr[route_id]:self.route_stops_indptr[route_id + 1]]
+
+  def stop_coordinate(self, stop_id):
+    """
+    Returns (latitude, longitude) for a stop. Both are NaN if the coordinates weren't recorded.
+    """
+    return self.coordinates[2 * stop_id], self.coordinates[2 * stop_id + 1]
+
+  def routes_containing_stop(self):
+    """
+    Materializes the same dictionary that preprocess_nominal/preprocess_covid return.
+    """
+    route_names = self.route_names()
+    return {self.stop_name(i): {route_names[r] for r in self.stop_routes(i)} for i in range(self.num_stops)}
+
+  def close(self):
+    for view in (self._stop_name_offsets, self._route_name_offsets, self.stop_routes_indptr,
+                 self.stop_routes_indices, self.route_stops_indptr, self.route_stops_indices,
+                 self.coordinates, self._stop_blob, self._route_blob, self._buffer):
+      view.release()
+    self._mmap.close()
+
+
+class _LazyNames(object):
+  """
+  Sequence that decodes names on demand, so that bisect can search a name table.
+  """
+  def __init__(self, get_name, length):
+    self.get_name = get_name
+    self.length = length
+
+  def __len__(self):
+    return self.length
+
+  def __getitem__(self, i):
+    return self.get_name(i)
@@ -0,0 +1,128 @@
+import heapq, re
+from math import radians, cos, sin, asin
+
+
+EARTH_RADIUS_KM = 6371
+
+# Matches a "latitude,longitude" query, i.e "42.3601, -71.0589".
+_COORDINATE_REGEX = re.compile(r"^\s*(-?\d+(?:\.\d*)?)\s*,\s*(-?\d+(?:\.\d*)?)\s*$")
+
+
+def to_unit_sphere(latitude, longitude):
+  lat, lng = radians(latitude), radians(longitude)
+  return (cos(lat) * cos(lng), cos(lat) * sin(lng), sin(lat))
+
+
+def chord_to_km(chord):
+  """
+  Converts a straight-line distance between two points on the unit sphere to a great circle distance.
+  """
+  return 2 * EARTH_RADIUS_KM * asin(min(1.0, chord / 2))
+
+
+def parse_coordinates(query):
+  """
+  Returns (latitude, longitude) if query is a string like "42.3601,-71.0589", otherwise None.
+  """
+  match = _COORDINATE_REGEX.match(query) if isinstance(query, str) else None
+  return (float(match.group(1)), float(match.group(2))) if match is not None else None
+
+
+class StopIndex(object):
+  """
+  KD-tree for finding the stops nearest to a latitude and longitude.
+
+  Stops are stored as 3D points on the unit sphere, so that straight-line distance in the tree orders
+  points the same way as great circle (haversine) distance, without any special handling near the poles
+  or the antimeridian. The tree is stored in flat lists, and split on the axis with the largest spread.
+
+  coordinates (dict) : Maps each stop name to its (latitude, longitude).
+  """
+  def __init__(self, coordinates):
+    self.stop_names = tuple(sorted(coordinates))
+    self.points = [to_unit_sphere(*coordinates[name]) for name in self.stop_names]
+
+    # Node i covers the points order[start:end], split at order[mid] along axis[i].
+    self.order = list(range(len(self.points)))
+    self.node_point = []
+    self.node_axis = []
+    self.node_left = []
+    self.node_right = []
+    self.root = self._build(0, len(self.order))
+
+  @classmethod
+  def from_snapshot(cls, snapshot):
+    """
+    Builds an index of the stops in a Snapshot that have coordinates.
+    """
+    coordinates = {}
+    for stop_id in range(snapshot.num_stops):
+      latitude, longitude = snapshot.stop_coordinate(stop_id)
+      if latitude == latitude and longitude == longitude: # Skip NaNs.
+        coordinates[snapshot.stop_name(stop_id)] = (latitude, longitude)
+    return cls(coordinates)
+
+  def __len__(self):
+    return len(self.stop_names)
+
+  def _build(self, start, end):
+    if start >= end:
+      return -1
+
+    points = self.points
+    indices = self.order[start:end]
+    spreads = [max(points[i][axis] for i in indices) - min(points[i][axis] for i in indices) for axis in range(3)]
+    axis = spreads.index(max(spreads))
+    indices.sort(key=lambda i: points[i][axis])
+    self.order[start:end] = indices
+    mid = (start + end) // 2
+
+    node = len(self.node_point)
+    self.node_point.append(self.order[mid])
+    self.node_axis.append(axis)
+    self.node_left.append(-1)
+    self.node_right.append(-1)
+    self.node_left[node] = self._build(start, mid)
+    self.node_right[node] = self._build(mid + 1, end)
+    return node
+
+  def nearest_stops(self, latitude, longitude, k=1, accept=None):
+    """
+    Finds the k stops closest to a point.
+
+    accept (container or None) : If given, only stops that are "in" accept are returned (i.e pass a
+                                 TransitGraph to skip stops that are closed).
+
+    Returns (list of tuple) : Up to k (stop name, distance in km) pairs, nearest first.
+    """
+    query = to_unit_sphere(latitude, longitude)
+    qx, qy, qz = query
+    points, stop_names = self.points, self.stop_names
+    node_point, node_axis, node_left, node_right = self.node_point, self.node_axis, self.node_left, self.node_right
+
+    best = [] # Max-heap of (-squared distance, point index), with at most k entries.
+
+    # Each entry is (node, squared distance from the query to the plane that separates it from the query).
+    stack = [(self.root, 0.0)] if self.root >= 0 else []
+    while len(stack) > 0:
+      node, plane_dist2 = stack.pop()
+      # Skip subtrees that are entirely farther away than the k-th best point so far.
+      if node < 0 or (len(best) == k and plane_dist2 >= -best[0][0]):
+        continue
+      point = node_point[node]
+      px, py, pz = points[point]
+      dist2 = (px - qx)**2 + (py - qy)**2 + (pz - qz)**2
+
+      if accept is None or stop_names[point] in accept:
+        if len(best) < k:
+          heapq.heappush(best, (-dist2, point))
+        elif dist2 < -best[0][0]:
+          heapq.heapreplace(best, (-dist2, point))
+
+      axis = node_axis[node]
+      diff = query[axis] - points[point][axis]
+      near, far = (node_left[node], node_right[node]) if diff < 0 else (node_right[node], node_left[node])
+      stack.append((far, diff * diff))
+      stack.append((near, plane_dist2))
+
+    return [(stop_names[point], chord_to_km((-neg_dist2)**0.5)) for neg_dist2, point in sorted(best, reverse=True)]
@@ -0,0 +1,215 @@
+import heapq
+from collections import namedtuple
+from math import radians, cos, sin, asin, sqrt
+
+
+EARTH_RADIUS_KM = 6371
+
+
+# One ride along a single route.
+# "route" is the name of the route being travelled.
+# "board_stop" and "alight_stop" are the names of the stops where the ride starts and ends.
+# "num_stops" is the number of stops travelled, and "distance_km" is the distance along the route.
+Leg = namedtuple("Leg", ["route", "board_stop", "alight_stop", "num_stops", "distance_km"])
+
+
+class StopGraph(object):
+  """
+  Stop-level graph for finding the shortest path between two stops, as opposed to find_coarse_route,
+  which only finds the sequence of routes with the fewest transfers.
+
+  There is one node for each (route, stop) pair. Consecutive stops along a route are connected by edges
+  weighted by their haversine distance, and the nodes for the same stop on different routes are connected
+  by transfer edges weighted by transfer_penalty_km.
+
+  ordered_stop_names (dict) : Maps each route name to its stop names, in order along the route (i.e the
+                              first output of fetch_ordered_stops).
+  coordinates (dict) : Maps each stop name to its (latitude, longitude).
+  transfer_penalty_km (float) : Cost of a transfer, in the same units as distance (kilometers).
+  branch_links (dict or None) : Maps route names to extra (stop, stop) pairs that are adjacent along the route
+                                even though they aren't consecutive in the ordering (i.e where a line branches).
+  """
+  def __init__(self, ordered_stop_names, coordinates, transfer_penalty_km=1.0, branch_links=None):
+    self.transfer_penalty_km = transfer_penalty_km
+    self.stop_names = tuple(sorted({stop for stops in ordered_stop_names.values() for stop in stops}))
+    self.stop_ids = {name: i for i, name in enumerate(self.stop_names)}
+    self.route_names = tuple(sorted(ordered_stop_names))
+
+    # Stop coordinates in radians, with the cosine of the latitude precomputed for the haversine formula.
+    self.stop_lat = []
+    self.stop_lng = []
+    self.stop_cos_lat = []
+    for name in self.stop_names:
+      if name not in coordinates:
+        raise ValueError("Missing coordinates for stop {}".format(name))
+      latitude, longitude = map(radians, coordinates[name])
+      self.stop_lat.append(latitude)
+      self.stop_lng.append(longitude)
+      self.stop_cos_lat.append(cos(latitude))
+
+    # Intern (route, stop) nodes.
+    self.node_route = []
+    self.node_stop = []
+    node_ids = {}
+    for route_id, route in enumerate(self.route_names):
+      for stop in ordered_stop_names[route]:
+        if (route_id, stop) not in node_ids:
+          node_ids[(route_id, stop)] = len(self.node_stop)
+          self.node_route.append(route_id)
+          self.node_stop.append(self.stop_ids[stop])
+
+    adjacent = [[] for _ in self.node_stop]
+
+    for route_id, route in enumerate(self.route_names):
+      stops = ordered_stop_names[route]
+      pairs = list(zip(stops[:-1], stops[1:])) + list((branch_links or {}).get(route, []))
+      for stop_i, stop_j in pairs:
+        if stop_i == stop_j:
+          continue
+        node_i, node_j = node_ids[(route_id, stop_i)], node_ids[(route_id, stop_j)]
+        distance = self.distance(self.stop_ids[stop_i], self.stop_ids[stop_j])
+        adjacent[node_i].append((node_j, distance))
+        adjacent[node_j].append((node_i, distance))
+
+    # Nodes at each stop, which are all connected to each other by transfer edges.
+    self.stop_nodes = [[] for _ in self.stop_names]
+    for node, stop in enumerate(self.node_stop):
+      self.stop_nodes[stop].append(node)
+    for nodes in self.stop_nodes:
+      for node_i in nodes:
+        for node_j in nodes:
+          if node_i != node_j:
+            adjacent[node_i].append((node_j, transfer_penalty_km))
+
+    self.adjacent = tuple(tuple(edges) for edges in adjacent)
+
+  @classmethod
+  def from_snapshot(cls, snapshot, transfer_penalty_km=1.0, branch_links=None):
+    """
+    Builds the graph from the ordered route stops and coordinates in a Snapshot. Raises a ValueError if
+    the snapshot doesn't have coordinates (i.e it was written from the pickle caches).
+    """
+    ordered_stop_names = {}
+    for route_id in range(snapshot.num_routes):
+      ordered_stop_names[snapshot.route_name(route_id)] = [snapshot.stop_name(s) for s in snapshot.route_stops(route_id)]
+    coordinates = {}
+    for stop_id in range(snapshot.num_stops):
+      latitude, longitude = snapshot.stop_coordinate(stop_id)
+      if latitude == latitude and longitude == longitude: # Skip NaNs.
+        coordinates[snapshot.stop_name(stop_id)] = (latitude, longitude)
+    return cls(ordered_stop_names, coordinates, transfer_penalty_km=transfer_penalty_km, branch_links=branch_links)
+
+  def distance(self, stop_i, stop_j):
+    """
+    Haversine distance (km) between two stop ids. Same as haversine_distance in utils.utils.
+    """
+    dlat = self.stop_lat[stop_j] - self.stop_lat[stop_i]
+    dlng = self.stop_lng[stop_j] - self.stop_lng[stop_i]
+    a = sin(dlat / 2)**2 + self.stop_cos_lat[stop_i] * self.stop_cos_lat[stop_j] * sin(dlng / 2)**2
+    return 2 * EARTH_RADIUS_KM * asin(sqrt(a))
+
+  def shortest_path(self, stop_A, stop_B, use_astar=True):
+    """
+    Finds the lowest cost path from stop_A to stop_B, where cost is the distance travelled plus
+    transfer_penalty_km for each transfer.
+
+    use_astar (bool) : If True, use A* with the straight-line (haversine) distance to stop_B as the heuristic.
+                       This never overestimates the remaining cost, so the result is the same as Dijkstra's,
+                       but fewer nodes are expanded. If False, use Dijkstra's algorithm.
+
+    Returns:
+      (bool) Whether a path was found.
+      (list of Leg) The rides along the path (empty if stop_A and stop_B are the same).
+      (float) The cost of the path.
+      (int) The number of nodes that were expanded by the search.
+    """
+    if stop_A not in self.stop_ids or stop_B not in self.stop_ids:
+      return False, [], float("inf"), 0
+
+    source, goal = self.stop_ids[stop_A], self.stop_ids[stop_B]
+    if source == goal:
+      return True, [], 0.0, 0
+
+    node_stop = self.node_stop
+    adjacent = self.adjacent
+
+    # Heuristic for each stop, computed when the stop is first reached (inlined haversine, for speed).
+    heuristic = [None] * len(self.stop_names)
+    stop_lat, stop_lng, stop_cos_lat = self.stop_lat, self.stop_lng, self.stop_cos_lat
+    goal_lat, goal_lng, goal_cos_lat = stop_lat[goal], stop_lng[goal], stop_cos_lat[goal]
+
+    def h(node):
+      stop = node_stop[node]
+      value = heuristic[stop]
+      if value is None:
+        if use_astar:
+          a = sin((goal_lat - stop_lat[stop]) / 2)**2 + \
+              stop_cos_lat[stop] * goal_cos_lat * sin((goal_lng - stop_lng[stop]) / 2)**2
+          value = 2 * EARTH_RADIUS_KM * asin(sqrt(a))
+        else:
+          value = 0.0
+        heuristic[stop] = value
+      return value
+
+    cost = {}
+    parent = {}
+    frontier = []
+    for node in self.stop_nodes[source]:
+      cost[node] = 0.0
+      parent[node] = None
+      heapq.heappush(frontier, (h(node), node))
+
+    closed = set()
+    num_expanded = 0
+    while len(frontier) > 0:
+      _, node = heapq.heappop(frontier)
+      if node in closed:
+        continue
+      closed.add(node)
+      num_expanded += 1
+
+      if node_stop[node] == goal:
+        return True, self._legs(node, parent, cost), cost[node], num_expanded
+
+      node_cost = cost[node]
+      for other, weight in adjacent[node]:
+        other_cost = node_cost + weight
+        if other not in closed and other_cost < cost.get(other, float("inf")):
+          cost[other] = other_cost
+          parent[other] = node
+          heapq.heappush(frontier, (other_cost + h(other), other))
+
+    return False, [], float("inf"), num_expanded
+
+  def _legs(self, node, parent, cost):
+    """
+    Follows parent pointers back from the goal node, and groups the path into one Leg per route.
+    """
+    path = []
+    while node is not None:
+      path.append(node)
+      node = parent[node]
+    path.reverse()
+    return self.legs_along(path, [cost[node] for node in path])
+
+  def legs_along(self, path, costs):
+    """
+    Groups a path of nodes into one Leg per route.
+
+    path (list of int) : Node ids, from the start of the path to the end.
+    costs (list of float) : Cost of reaching each node along the path. Only differences between nodes on the
+                            same route are used, so transfer costs don't have to be included.
+    """
+    legs = []
+    start = 0
+    for i in range(1, len(path) + 1):
+      if i == len(path) or self.node_route[path[i]] != self.node_route[path[start]]:
+        if i - 1 > start: # Skip "legs" that are only a transfer between two routes at the same stop.
+          legs.append(Leg(
+            route=self.route_names[self.node_route[path[start]]],
+            board_stop=self.stop_names[self.node_stop[path[start]]],
+            alight_stop=self.stop_names[self.node_stop[path[i - 1]]],
+            num_stops=i - 1 - start,
+            distance_km=costs[i - 1] - costs[start]))
+        start = i
+    return legs
@@ -0,0 +1,126 @@
+import re, unicodedata
+from bisect import bisect_left
+
+
+_NON_ALPHANUMERIC = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_name(name):
+  """
+  Lowercases a stop name, strips accents, and replaces punctuation with spaces,
+  i.e "Kendall/MIT" => "kendall mit".
+  """
+  name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii")
+  return _NON_ALPHANUMERIC.sub(" ", name.lower()).strip()
+
+
+def trigrams(normalized):
+  """
+  Returns the set of 3-character substrings of a normalized name, padded so that the start and end of
+  each word count as well (i.e "mit" => {"  m", " mi", "mit", "it "}).
+  """
+  padded = "  " + normalized + " "
+  return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class StopNameResolver(object):
+  """
+  Resolves user input to stop names, with autocomplete and typo-tolerant fuzzy matching.
+
+  Built once per process from the stop names in a network (it isn't saved at preprocessing time). Fuzzy
+  lookups use an inverted index from trigrams to stops, so only names that share trigrams with the query
+  are scored (there's no edit distance scan over every name). Prefix lookups use a sorted list of every
+  word in every name.
+
+  stop_names (iterable of str) : The names to resolve to.
+  """
+  def __init__(self, stop_names):
+    self.stop_names = tuple(sorted(set(stop_names)))
+    self.normalized = tuple(normalize_name(name) for name in self.stop_names)
+    self.exact = {}
+    for stop_id, normalized in enumerate(self.normalized):
+      self.exact.setdefault(normalized, stop_id)
+
+    self.num_trigrams = []
+    index = {}
+    for stop_id, normalized in enumerate(self.normalized):
+      grams = trigrams(normalized)
+      self.num_trigrams.append(len(grams))
+      for gram in grams:
+        index.setdefault(gram, []).append(stop_id)
+    self.trigram_index = {gram: tuple(stop_ids) for gram, stop_ids in index.items()}
+
+    # Every suffix of each name that starts at a word boundary, so that "mit" completes "Kendall/MIT".
+    suffixes = []
+    for stop_id, normalized in enumerate(self.normalized):
+      words = normalized.split(" ")
+      for i in range(len(words)):
+        suffixes.append((" ".join(words[i:]), i, stop_id))
+    suffixes.sort()
+    self.suffixes = [suffix for suffix, _, _ in suffixes]
+    self.suffix_stops = [(word_index, stop_id) for _, word_index, stop_id in suffixes]
+
+  def complete(self, prefix, k=10):
+    """
+    Returns up to k stop names that have a word starting with prefix. Names where the match is at the
+    start come first, then names are in alphabetical order.
+    """
+    prefix = normalize_name(prefix)
+    if len(prefix) == 0:
+      return []
+
+    matches = {}
+    i = bisect_left(self.suffixes, prefix)
+    while i < len(self.suffixes) and self.suffixes[i].startswith(prefix):
+      word_index, stop_id = self.suffix_stops[i]
+      matches[stop_id] = min(word_index, matches.get(stop_id, word_index))
+      i += 1
+
+    ranked = sorted(matches, key=lambda stop_id: (matches[stop_id] > 0, self.stop_names[stop_id]))
+    return [self.stop_names[stop_id] for stop_id in ranked[:k]]
+
+  def resolve(self, query, k=5):
+    """
+    Finds the stop names that best match a (possibly misspelled or partial) query.
+
+    Returns (list of tuple) : Up to k (stop name, score) pairs, best first. The score is 1.0 for an exact
+                              match (after normalization), and otherwise the trigram similarity between the
+                              query and the name, which is between 0 and 1.
+    """
+    normalized = normalize_name(query)
+    if len(normalized) == 0:
+      return []
+
+    scores = {}
+    if normalized in self.exact:
+      scores[self.exact[normalized]] = 1.0
+
+    # Count the trigrams that each candidate shares with the query.
+    query_grams = trigrams(normalized)
+    shared = {}
+    for gram in query_grams:
+      for stop_id in self.trigram_index.get(gram, ()):
+        shared[stop_id] = shared.get(stop_id, 0) + 1
+
+    for stop_id, count in shared.items():
+      if stop_id not in scores:
+        # Jaccard similarity of the trigram sets, which is below 1 for anything but an exact match.
+        similarity = count / (len(query_grams) + self.num_trigrams[stop_id] - count)
+        scores[stop_id] = min(similarity, 0.99)
+
+    # Names that the query is a prefix of are good matches, even if they're much longer.
+    for stop_id in self._prefix_matches(normalized):
+      scores[stop_id] = max(scores.get(stop_id, 0.0), 0.9)
+
+    ranked = sorted(scores, key=lambda stop_id: (-scores[stop_id], self.stop_names[stop_id]))
+    return [(self.stop_names[stop_id], scores[stop_id]) for stop_id in ranked[:k]]
+
+  def _prefix_matches(self, normalized, limit=50):
+    i = bisect_left(self.suffixes, normalized)
+    matches = []
+    while i < len(self.suffixes) and self.suffixes[i].startswith(normalized) and len(matches) < limit:
+      word_index, stop_id = self.suffix_stops[i]
+      if word_index == 0:
+        matches.append(stop_id)
+      i += 1
+    return matches
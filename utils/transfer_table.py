@@ -0,0 +1,153 @@
+import pickle, os
+from array import array
+from collections import deque
+
+from utils.routing import RouteNode, TransitGraph
+
+
+class TransferTable(object):
+  """
+  Precomputed minimum-transfer answers for every (stop_A, stop_B) pair in a TransitGraph.
+
+  The table runs one BFS from each route over the route graph, and keeps route-level arrays (indexed by
+  source_route * num_routes + route) with the number of transfers between any two routes (-1 if there's no
+  feasible route), and the parents used to reconstruct the sequence of transfers.
+
+  Nothing is stored per pair of stops, so the table stays small (num_routes^2 entries) on the full network.
+  A query picks the best pair of routes at the two stops, then reconstructs the path, with no search at all.
+  """
+  def __init__(self, graph, transfers, parent_route, parent_stop):
+    self.graph = graph
+    self.transfers = transfers
+    self.parent_route = parent_route
+    self.parent_stop = parent_stop
+
+  @classmethod
+  def build(cls, graph):
+    """
+    Builds the table from a TransitGraph (or a routes_containing_stop dictionary).
+    """
+    if not isinstance(graph, TransitGraph):
+      graph = TransitGraph(graph)
+
+    num_routes = len(graph.route_names)
+
+    # Number of transfers between each pair of routes (-1 if unreachable).
+    transfers = array("h", [-1]) * (num_routes * num_routes)
+    parent_route = array("h", [-1]) * (num_routes * num_routes)
+    parent_stop = array("i", [-1]) * (num_routes * num_routes)
+
+    for source in range(num_routes):
+      offset = source * num_routes
+      transfers[offset + source] = 0
+      frontier = deque([source])
+      while len(frontier) > 0:
+        route = frontier.popleft()
+        for other, connect_stop in graph.adjacent[route]:
+          if transfers[offset + other] < 0:
+            transfers[offset + other] = transfers[offset + route] + 1
+            parent_route[offset + other] = route
+            parent_stop[offset + other] = connect_stop
+            frontier.append(other)
+
+    return cls(graph, transfers, parent_route, parent_stop)
+
+  def lookup(self, stop_A, stop_B):
+    """
+    Same interface and return values as find_coarse_route, but answered from the table.
+    """
+    graph = self.graph
+    if stop_A not in graph or stop_B not in graph:
+      print("WARNING: one of {} or {} is either invalid or closed due to COVID".format(stop_A, stop_B))
+      return False, []
+
+    if stop_A == stop_B:
+      print("WARNING: {} and {} are the same, empty route returned".format(stop_A, stop_B))
+      return True, []
+
+    # Start and end on the pair of routes at the two stops with the fewest transfers between them.
+    num_routes = len(graph.route_names)
+    transfers = self.transfers
+    best, source, route = -1, -1, -1
+    for route_A in graph.stop_routes[graph.stop_ids[stop_A]]:
+      offset = route_A * num_routes
+      for route_B in graph.stop_routes[graph.stop_ids[stop_B]]:
+        num_transfers = transfers[offset + route_B]
+        if num_transfers >= 0 and (best < 0 or num_transfers < best):
+          best, source, route = num_transfers, route_A, route_B
+    if best < 0:
+      return False, []
+
+    # Walk the parent arrays back from the end route to the start route.
+    offset = source * num_routes
+    chain = []
+    while route != source:
+      chain.append((route, graph.stop_names[self.parent_stop[offset + route]]))
+      route = self.parent_route[offset + route]
+    chain.append((source, stop_A))
+    chain.reverse()
+
+    sequence = []
+    node = None
+    for route, connect_stop in chain:
+      node = RouteNode(name=graph.route_names[route], parent_node=node, connect_stop=connect_stop)
+      sequence.append(node)
+
+    return True, sequence
+
+  def save(self, path):
+    with open(path, "wb") as f:
+      f.write(pickle.dumps({
+        "stop_names": self.graph.stop_names,
+        "route_names": self.graph.route_names,
+        "stop_routes": self.graph.stop_routes,
+        "transfers": self.transfers,
+        "parent_route": self.parent_route,
+        "parent_stop": self.parent_stop,
+      }))
+
+  @classmethod
+  def load(cls, path, graph):
+    """
+    Loads a table saved with save(). Returns None if the table was built for a different network: other
+    stops or routes, or routes that visit different stops (or the file is from an older version).
+    """
+    with open(path, "rb") as f:
+      d = pickle.load(f)
+    if d["stop_names"] != graph.stop_names or d["route_names"] != graph.route_names or \
+        d.get("stop_routes") != graph.stop_routes or "transfers" not in d:
+      return None
+    return cls(graph, d["transfers"], d["parent_route"], d["parent_stop"])
+
+
+def transfer_table_path(name):
+  """
+  Returns (str) : Where preprocess_transfer_table caches the table for a network.
+  """
+  path_to_output = os.path.abspath(os.path.join(os.path.abspath(__file__), "../../output/"))
+  return os.path.join(path_to_output, "transfer_table_{}.pkl".format(name))
+
+
+def preprocess_transfer_table(graph, name, allow_cache=True, verbose=True):
+  """
+  Loads the all-pairs TransferTable for a network from the output folder, or builds and saves it.
+
+  graph (TransitGraph) : The network to build the table for.
+  name (str) : Name of the network (i.e "nominal" or "covid"), used for the cache filename.
+  allow_cache (bool) : If True, will try to load precomputed results. If the cache is unavailable
+                       (or was built for a different network), will build the table and save it.
+  """
+  path_to_save = transfer_table_path(name)
+
+  if os.path.exists(path_to_save) and allow_cache:
+    table = TransferTable.load(path_to_save, graph)
+    if table is not None:
+      if verbose: print("NOTE: Using cached results from", path_to_save)
+      return table
+
+  table = TransferTable.build(graph)
+
+  if allow_cache:
+    table.save(path_to_save)
+
+  return table
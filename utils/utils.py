@@ -1,10 +1,12 @@
 from math import radians, cos, sin, asin, sqrt
+from functools import lru_cache
 
-import json
-from jsonpointer import resolve_pointer
+# NOTE: json and jsonpointer are imported by the functions that use them, since routing from a cached
+# network never needs them.
 
 
 def print_json(d):
+  import json
   print(json.dumps(d, indent=2))
 
 
@@ -28,18 +30,162 @@ def print_coarse_route(S, A, B):
   print("({}) End at {}".format(i + 3, B))
 
 
+def print_itineraries(itineraries, A, B):
+  """
+  Prints alternative itineraries, i.e from pareto_routes or k_best_routes.
+
+  itineraries (list of Itinerary) : See pareto.py
+  A (str) : Name of the origin stop.
+  B (str) : Name of the destination stop.
+  """
+  print("\n====== {} option(s) for {} to {} ======".format(len(itineraries), A, B))
+  for i, itinerary in enumerate(itineraries):
+    print("({}) {} transfer(s), {:.1f} km".format(i + 1, itinerary.transfers, itinerary.distance_km))
+    for leg in itinerary.legs:
+      print("    {} from {} to {} ({} stops)".format(leg.route, leg.board_stop, leg.alight_stop, leg.num_stops))
+
+
+def print_journey(journey, A, B):
+  """
+  Prints a timed journey from earliest_arrival.
+
+  journey (Journey) : See raptor.py
+  A (str) : Name of the origin stop.
+  B (str) : Name of the destination stop.
+  """
+  clock = lambda seconds: "{:02d}:{:02d}".format(seconds // 3600, (seconds // 60) % 60)
+  print("\n====== Leave {} at {}, arrive at {} at {} ({} transfer(s)) ======".format(
+      A, clock(journey.departure_time), B, clock(journey.arrival_time), journey.transfers))
+  for i, leg in enumerate(journey.legs):
+    if leg.route is None:
+      print("({}) {} Walk from {} to {}".format(i + 1, clock(leg.departure_time), leg.board_stop, leg.alight_stop))
+    else:
+      print("({}) {} Take {} from {} to {}, arriving at {}".format(
+          i + 1, clock(leg.departure_time), leg.route, leg.board_stop, leg.alight_stop, clock(leg.arrival_time)))
+
+
+@lru_cache(maxsize=None)
+def compile_pointer(ptr):
+  """
+  Parses a JSON pointer (i.e "/attributes/name") once, and returns a function that resolves it on an
+  object. This gives the same results as resolve_pointer(obj, ptr), without re-parsing the pointer
+  string on every call. Compiled pointers are cached, so calling this repeatedly is cheap.
+  """
+  from jsonpointer import JsonPointer, resolve_pointer
+  parts = tuple(JsonPointer(ptr).parts)
+
+  def fail(obj):
+    # Fall back to jsonpointer for anything unusual (i.e list indices), and for its error messages.
+    return resolve_pointer(obj, ptr)
+
+  if len(parts) == 0:
+    return lambda obj: obj
+
+  if len(parts) == 1:
+    (a,) = parts
+    def getter(obj):
+      try:
+        return obj[a]
+      except (KeyError, IndexError, TypeError):
+        return fail(obj)
+  elif len(parts) == 2:
+    a, b = parts
+    def getter(obj):
+      try:
+        return obj[a][b]
+      except (KeyError, IndexError, TypeError):
+        return fail(obj)
+  else:
+    def getter(obj):
+      try:
+        value = obj
+        for part in parts:
+          value = value[part]
+        return value
+      except (KeyError, IndexError, TypeError):
+        return fail(obj)
+
+  return getter
+
+
+def project_attributes(json, ptrs):
+  """
+  Gets several attributes from a list of objects in one pass.
+
+  ptrs (list of str) : JSON pointers to resolve on each object.
+
+  Returns (list of tuple) : One tuple per object, with one value per pointer.
+  """
+  getters = [compile_pointer(ptr) for ptr in ptrs]
+  return [tuple([getter(obj) for getter in getters]) for obj in json["data"]]
+
+
 def strip_attributes(json, ptr):
   """
   Convenience function for getting one or more attributes from a list of objects.
   """
-  return [resolve_pointer(obj, ptr) for obj in json["data"]]
+  getter = compile_pointer(ptr)
+  return [getter(obj) for obj in json["data"]]
 
 
 def index_by_attribute(json, key_ptr):
-  index = {}
-  for obj in json["data"]:
-    index[resolve_pointer(obj, key_ptr)] = obj
-  return index
+  getter = compile_pointer(key_ptr)
+  return {getter(obj): obj for obj in json["data"]}
+
+
+def route_display_name(route_type, short_name, long_name, route_id):
+  """
+  Picks the name that a route is shown with. Rapid transit, commuter rail and ferry routes use their
+  long_name (i.e "Red Line"), and buses use their number (i.e "Bus 1"), since a bus long_name is just
+  its two end points.
+  """
+  if route_type == 3 and short_name:
+    return "Bus {}".format(short_name)
+  return long_name or short_name or route_id
+
+
+def unique_route_names(routes):
+  """
+  Names each route with route_display_name. Some routes share a name (i.e a few buses have the same
+  number), so the route ID is added to those to tell them apart.
+
+  routes (list of tuple) : (route ID, route type, short name, long name) for each route.
+
+  Returns (dict) : Maps each route ID to its name.
+  """
+  names = [route_display_name(route_type, short_name, long_name, route_id)
+           for route_id, route_type, short_name, long_name in routes]
+  name_counts = {}
+  for name in names:
+    name_counts[name] = name_counts.get(name, 0) + 1
+  return {route[0]: (name if name_counts[name] == 1 else "{} ({})".format(name, route[0]))
+          for route, name in zip(routes, names)}
+
+
+def merge_stop_patterns(patterns):
+  """
+  Merges the stop sequences of a route's trips into one ordering of all of its stops, like the one that
+  the MBTA API returns for a route. Starts from the longest sequence, and inserts each stop that's
+  missing right after the stop before it in its sequence. For the Red Line, the Ashmont branch ends up
+  between JFK/UMass and the Braintree branch.
+
+  patterns (iterable of tuple) : Stop sequences.
+
+  Returns (list) : Every stop, in order.
+  """
+  patterns = sorted(patterns, key=lambda pattern: (-len(pattern), pattern))
+  if len(patterns) == 0:
+    return []
+
+  order = list(patterns[0])
+  seen = set(order)
+  for pattern in patterns[1:]:
+    for i, stop in enumerate(pattern):
+      if stop in seen:
+        continue
+      order.insert(order.index(pattern[i - 1]) + 1 if i > 0 else 0, stop)
+      seen.add(stop)
+  return order
 
 
 def haversine_distance(lon1, lat1, lon2, lat2):
@@ -63,6 +209,53 @@ def haversine_distance(lon1, lat1, lon2, lat2):
   return c * r
 
 
+def haversine_many(lons1, lats1, lons2, lats2, float32=False):
+  """
+  Vectorized haversine_distance over arrays of coordinates (in decimal degrees). The arrays are broadcast
+  against each other with NumPy's rules, so either side can also be a single point.
+
+  float32 (bool) : Return float32 distances to save memory. The math is still done in float64.
+
+  Returns (numpy.ndarray) : Distances in kilometers.
+  """
+  import numpy as np # NOTE: Imported here so that NumPy is only loaded by code that needs it.
+
+  lons1, lats1, lons2, lats2 = [np.radians(np.asarray(x, dtype=np.float64)) for x in (lons1, lats1, lons2, lats2)]
+  a = np.sin((lats2 - lats1) / 2)**2 + np.cos(lats1) * np.cos(lats2) * np.sin((lons2 - lons1) / 2)**2
+  distances = 2 * 6371 * np.arcsin(np.sqrt(a))
+  return distances.astype(np.float32) if float32 else distances
+
+
+def haversine_matrix(lons1, lats1, lons2=None, lats2=None, float32=False):
+  """
+  Haversine distance between every pair of points in two coordinate arrays (in decimal degrees).
+
+  lons2, lats2 (array or None) : If None, distances are computed between every pair of points in lons1, lats1.
+  float32 (bool) : Return float32 distances to save memory (the matrix is len(lons1) x len(lons2)).
+
+  Returns (numpy.ndarray) : Matrix where entry [i, j] is the distance (km) from point i to point j.
+  """
+  import numpy as np
+
+  if lons2 is None or lats2 is None:
+    lons2, lats2 = lons1, lats1
+
+  lons1, lats1, lons2, lats2 = [np.radians(np.asarray(x, dtype=np.float64)) for x in (lons1, lats1, lons2, lats2)]
+  cos_lats1, cos_lats2 = np.cos(lats1), np.cos(lats2)
+
+  # Build the matrix one block of rows at a time, so that temporaries stay small for large inputs.
+  dtype = np.float32 if float32 else np.float64
+  distances = np.empty((len(lons1), len(lons2)), dtype=dtype)
+  block = max(1, (1 << 20) // max(1, len(lons2)))
+  for start in range(0, len(lons1), block):
+    end = min(len(lons1), start + block)
+    a = np.sin((lats2[None, :] - lats1[start:end, None]) / 2)**2 + \
+        cos_lats1[start:end, None] * cos_lats2[None, :] * np.sin((lons2[None, :] - lons1[start:end, None]) / 2)**2
+    distances[start:end] = 2 * 6371 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+  return distances
+
+
 def dict_argmin_argmax(d, fn=lambda x: x):
   """
   Returns the min and max keys and values from a dictionary, where the value ordering is determined